@@ -1,8 +1,19 @@
 import os
 import uuid
-from datetime import datetime
-from flask import Flask, render_template, request, redirect, url_for, session
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, flash
 from werkzeug.utils import secure_filename
+import thumbnails
+import availability
+import changes
+import assets
+import ratings
+import search
+from blob_store import LocalBlobStore, content_key, hash_stream
+from memstore import Store, Booking, SessionBooking, Feedback
+from sqlstore import SQLiteStore
 
 app = Flask(__name__)
 app.secret_key = "yojeong_secret_key_2026"
@@ -11,30 +22,109 @@ app.secret_key = "yojeong_secret_key_2026"
 UPLOAD_FOLDER = 'static/uploads'
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
+# Uploads are stored once per content hash under static/uploads/content/, derivatives under derived/
+upload_store = LocalBlobStore(UPLOAD_FOLDER)
 
-# --- DUMMY DATABASE ---
-users = {
+# Fingerprinted static URLs, compression and cached public pages (see assets.py);
+# content-addressed uploads never change under their name either
+assets.init_app(app, immutable_prefixes=('uploads/content/', 'uploads/derived/'))
+
+def collect_upload(key, sha256):
+    """The last booking of an upload is gone: remove its bytes and derivatives"""
+    upload_store.delete(key)
+    thumbnails.delete_derivatives(upload_store, sha256)
+
+# --- DATABASE ---
+# Seeded into a fresh database; existing accounts are left alone
+DEFAULT_USERS = {
     "admin@yojeong.com": {"name": "Admin User", "password": "adminposthost", "role": "admin"},
     "client@test.com": {"name": "Jane Doe", "password": "password123", "role": "user"}
 }
 
-bookings = []         # Retouching requests (Uploads)
-session_bookings = []  # Photography dates (Calendar)
-feedbacks = []         # User reviews
+# Tables (see sqlstore.py / memstore.py):
+#   store.users     - Accounts keyed by email
+#   store.bookings  - Retouching requests (Uploads)
+#   store.sessions  - Photography dates (Calendar), plus the photographer time they hold
+#   store.feedbacks - User reviews
+# STORE_BACKEND=sqlite (default) persists to SQLITE_PATH and is shared by every
+# gunicorn worker; STORE_BACKEND=memory keeps everything in this process.
+STORE_BACKEND = os.environ.get('STORE_BACKEND', 'sqlite')
+if STORE_BACKEND == 'memory':
+    store = Store(DEFAULT_USERS)
+else:
+    store = SQLiteStore(os.environ.get('SQLITE_PATH', 'database.db'), DEFAULT_USERS)
+
+# Statuses /admin/bulk/<section> can set
+BULK_STATUSES = {
+    'bookings': ('Confirmed', 'Cancelled'),
+    'sessions': ('Confirmed', 'Completed', 'Cancelled'),
+}
+BULK_MAX_IDS = 500
+
+# --- SESSION STATUS SWEEPER ---
+# Confirmed sessions are 'Today' on their date and 'Upcoming' otherwise. The
+# statuses are stored precomputed; this sweeper only moves the sessions that
+# sit on a day boundary that has just passed, using the status and date indexes.
+
+last_sweep = None
+sweep_lock = threading.Lock()
+
+def sweep_sessions(today_str):
+    for s in store.sessions.with_status('Today'):
+        if s.date != today_str:
+            store.sessions.set_status(s.id, 'Upcoming')
+    for s in store.sessions.on_date(today_str):
+        if s.status == 'Upcoming':
+            store.sessions.set_status(s.id, 'Today')
+
+def sweep_if_due():
+    """Sweep once per calendar day (cheap no-op otherwise)"""
+    global last_sweep
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    if today_str == last_sweep:
+        return
+    with sweep_lock:
+        if today_str != last_sweep:
+            sweep_sessions(today_str)
+            last_sweep = today_str
+
+def sweeper_loop():
+    """Background thread: sweep just after every midnight"""
+    wakeup = threading.Event()
+    while True:
+        sweep_if_due()
+        now = datetime.now()
+        midnight = (now + timedelta(days=1)).replace(hour=0, minute=0, second=0, microsecond=0)
+        wakeup.wait((midnight - now).total_seconds() + 1)
+
+threading.Thread(target=sweeper_loop, name='session-sweeper', daemon=True).start()
+
+# --- TEMPLATE HELPERS ---
+
+@app.template_global()
+def thumbnail_url(booking, name='thumb'):
+    if not booking.get('sha256'):
+        return url_for('static', filename='uploads/' + booking['filename'])
+    return url_for('static', filename='uploads/' + thumbnails.derivative_key(booking['sha256'], name))
+
+@app.template_global()
+def original_url(booking):
+    # Bookings made before uploads were content-addressed only have a filename
+    return url_for('static', filename='uploads/' + (booking.get('storage_key') or booking['filename']))
 
 # --- ROUTES ---
 
 @app.route('/')
 def home():
-    return render_template('home.html')
+    return assets.cached_page('home.html')
 
 @app.route('/signup', methods=['POST'])
 def signup():
     name = request.form.get('name')
     email = request.form.get('email')
     password = request.form.get('password')
-    if email and email not in users:
-        users[email] = {"name": name, "password": password, "role": "user"}
+    if email:
+        store.users.add(email, name, password)
     return redirect(url_for('login'))
 
 # --- SEPARATED LOGIN: USER ---
@@ -43,7 +133,7 @@ def login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
-        user = users.get(email)
+        user = store.users.get(email)
         
         # Check if user exists and is NOT an admin
         if user and user['password'] == password and user['role'] == 'user':
@@ -51,7 +141,7 @@ def login():
             return redirect(url_for('dashboard'))
         
         return "Invalid User Credentials. <a href='/login'>Try Again</a>"
-    return render_template('login.html')
+    return assets.cached_page('login.html', flashes=True)
 
 # --- SEPARATED LOGIN: ADMIN ---
 @app.route('/admin/login', methods=['GET', 'POST'])
@@ -59,7 +149,7 @@ def admin_login():
     if request.method == 'POST':
         email = request.form.get('email')
         password = request.form.get('password')
-        user = users.get(email)
+        user = store.users.get(email)
         
         # Check if user exists and IS an admin
         if user and user['password'] == password and user['role'] == 'admin':
@@ -67,15 +157,14 @@ def admin_login():
             return redirect(url_for('admin_panel'))
             
         return "Invalid Admin Credentials. <a href='/admin/login'>Try Again</a>"
-    return render_template('admin_login.html') # You will need to create this template
+    return assets.cached_page('admin_login.html', flashes=True)
 
 @app.route('/dashboard')
 def dashboard():
     if 'user' in session and session.get('role') == 'user':
         email = session['email']
-        my_data = [b for b in bookings if b['user'] == email] + \
-                  [s for s in session_bookings if s['user'] == email]
-        my_feedbacks = [f for f in feedbacks if f['user_email'] == email]
+        my_data = store.bookings.for_user(email) + store.sessions.for_user(email)
+        my_feedbacks = store.feedbacks.for_user(email)
         return render_template('dashboard.html', 
                                name=session['user'], 
                                my_bookings=my_data, 
@@ -88,14 +177,28 @@ def book_retouch():
     file = request.files.get('file')
     if file:
         filename = secure_filename(file.filename)
-        file.save(os.path.join(app.config['UPLOAD_FOLDER'], filename))
-        bookings.append({
-            "id": len(bookings) + 1, 
-            "user": session['email'],
-            "service": f"Retouch: {request.form.get('service')}", 
-            "filename": filename, 
-            "status": "Pending"
-        })
+        sha256, size = hash_stream(file.stream)
+        record = Booking(
+            id=None,
+            user=session['email'],
+            service=f"Retouch: {request.form.get('service')}",
+            filename=filename,
+            sha256=sha256,
+            status="Pending",
+            created_at=datetime.now().isoformat()
+        )
+        # A photo that is already stored just gains a reference; only new content is written.
+        # Each copy gets a key of its own (as in app_aws.py), so collecting an old copy of
+        # the same content can never remove this one.
+        if store.add_upload(record, size) is None:
+            ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+            copy_id = uuid.uuid4().hex
+            blob = upload_store.put_stream(content_key(sha256, f"{copy_id}.{ext}" if ext else copy_id), file.stream)
+            store.add_upload(record, size, blob.key)
+            if record.storage_key != blob.key:
+                upload_store.delete(blob.key)  # the same content was stored by another upload meanwhile
+            elif ext:
+                thumbnails.schedule(upload_store, blob.key, sha256, ext)
     return redirect(url_for('dashboard'))
 
 @app.route('/book_session', methods=['POST'])
@@ -111,29 +214,61 @@ def book_session():
     photographer = request.form.get('photographer')
     time = request.form.get('session_time')
 
-    session_bookings.append({
-        "id": len(session_bookings) + 1000, 
-        "user": session['email'],
-        "user_name": session['user'], 
-        "service": f"{event_type} (with {photographer})", 
-        "date": date_str, 
-        "time": time,
-        "status": "Pending"
-    })
+    span = availability.interval(event_type, time)
+    if photographer not in availability.PHOTOGRAPHERS or span is None:
+        return "Error: Unknown photographer, session type or time. <a href='/dashboard'>Go Back</a>"
+
+    booked = store.reserve_session(SessionBooking(
+        id=None,
+        user=session['email'],
+        user_name=session['user'],
+        service=f"{event_type} (with {photographer})",
+        photographer=photographer,
+        date=date_str,
+        time=time,
+        status="Pending"
+    ), *span)
+    if booked is None:
+        return f"Error: {photographer} is already booked at {time} on {date_str}. <a href='/dashboard'>Go Back</a>"
     return redirect(url_for('dashboard'))
 
+@app.route('/availability')
+def photographer_availability():
+    """Free start times per day for one photographer, e.g. a month at a time"""
+    photographer = request.args.get('photographer')
+    if photographer not in availability.PHOTOGRAPHERS:
+        return jsonify(error="Unknown photographer"), 400
+    duration = availability.DURATIONS.get(request.args.get('session_type'), min(availability.DURATIONS.values()))
+    try:
+        dates = availability.days(request.args.get('date_from', ''), request.args.get('date_to', ''))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    dates = [d for d in dates if d >= today_str]
+    return jsonify(photographer=photographer, free=store.free_slots(photographer, dates, duration))
+
 @app.route('/submit_feedback', methods=['POST'])
 def submit_feedback():
     if 'email' not in session: return redirect(url_for('login'))
-    feedback_data = {
-        "id": str(uuid.uuid4())[:8],
-        "user_name": session.get('user'), 
-        "user_email": session.get('email'),
-        "service": request.form.get('service'),
-        "rating": int(request.form.get('rating')),
-        "comment": request.form.get('comment')
-    }
-    feedbacks.append(feedback_data)
+    rating = ratings.parse_rating(request.form.get('rating'))
+    if rating is None:
+        flash("Please rate from 1 to 5 stars.")
+        return redirect(url_for('dashboard'))
+    service = request.form.get('service')
+    photographer = request.form.get('photographer') or None
+    if service not in ratings.SERVICES or (photographer and photographer not in availability.PHOTOGRAPHERS):
+        flash("Please choose a service and photographer from the list.")
+        return redirect(url_for('dashboard'))
+    # The rating counters follow in the same write (see ratings.py)
+    store.feedbacks.add(Feedback(
+        id=str(uuid.uuid4())[:8],
+        user_name=session.get('user'),
+        user_email=session.get('email'),
+        service=service,
+        photographer=photographer,
+        rating=rating,
+        comment=request.form.get('comment')
+    ))
     return redirect(url_for('dashboard'))
 
 # --- ADMIN ACTIONS ---
@@ -143,63 +278,200 @@ def admin_panel():
     if session.get('role') != 'admin': 
         return redirect(url_for('admin_login'))
     
+    # Statuses are kept current by the sweeper; this only covers a missed midnight
+    sweep_if_due()
+
+    # Taken before the reads, so the page's delta sync re-reads anything written meanwhile
+    sync_cursor = changes.cursor()
+    return render_template('admin.html', 
+                           sync_cursor=sync_cursor,
+                           stats=store.stats(),
+                           ratings=ratings.summarize(store.ratings()),
+                           search_statuses=search.STATUSES,
+                           photographers=availability.PHOTOGRAPHERS,
+                           users=store.users.all(), 
+                           bookings=store.bookings.all(), 
+                           sessions=store.sessions.all(),
+                           feedbacks=store.feedbacks.all())
+
+@app.route('/admin/changes')
+def admin_changes():
+    """Admin rows created, changed or deleted after ?since=<cursor>, as JSON (see changes.py).
+
+    ?html=1 adds each row's rendered markup for the admin page to patch in;
+    a cursor that is too old, or too many changes, gets {"reset": true}.
+    """
+    if session.get('role') != 'admin': return "Unauthorized", 403
+    try:
+        since = changes.normalize(request.args.get('since'))
+    except ValueError:
+        return jsonify(error="since must be a cursor from the admin page or an earlier response"), 400
+    next_cursor = changes.cursor()
+    found = store.changed_since(since) if since >= changes.horizon() else None
+    if found is None or len(found) > changes.LIMIT:
+        return jsonify(reset=True, cursor=next_cursor)
+
+    html = request.args.get('html') == '1'
+    entries = []
+    for updated_at, section, record_id, record in found:
+        entry = {'section': section, 'id': record_id, 'updated_at': updated_at, 'deleted': record is None}
+        if record is not None:
+            fields = dict(record) if section == 'users' else record.to_dict()
+            entry['record'] = {k: v for k, v in fields.items() if k != 'password'}
+            if html:
+                rows = {record_id: record} if section == 'users' else [record]
+                entry['html'] = render_template('admin_rows.html', section=section, rows=rows)
+        entries.append(entry)
+    return jsonify(cursor=next_cursor, changes=entries, stats=store.stats())
+
+@app.route('/admin/search')
+def admin_search():
+    """One page of the bookings, sessions or users matching the query string's filters, as JSON (see search.py).
+
+    ?html=1 adds the page's rendered rows.
+    """
+    if session.get('role') != 'admin': return "Unauthorized", 403
+    try:
+        filters = search.parse(request.args)
+    except search.SearchError as e:
+        return jsonify(error=str(e)), 400
+
+    section = filters['section']
+    found = store.search(filters)
+    rows, total, pages = search.paginate(section, found[:search.MAX_RESULTS], filters['page'])
+    fields = rows if section == 'users' else [record.to_dict() for record in rows]
+    response = {
+        'results': [{k: v for k, v in row.items() if k != 'password'} for row in fields],
+        'page': filters['page'],
+        'pages': pages,
+        'total': total,
+        'truncated': len(found) > search.MAX_RESULTS,
+    }
+    if request.args.get('html') == '1':
+        rows = {u['email']: u for u in rows} if section == 'users' else rows
+        response['html'] = render_template('admin_rows.html', section=section, rows=rows)
+    return jsonify(response)
+
+@app.route('/ratings')
+def rating_summary():
+    """Average, count and star histogram per service and per photographer (public)"""
+    response = jsonify(ratings.summarize(store.ratings()))
+    response.headers['Cache-Control'] = f"public, max-age={ratings.MAX_AGE}"
+    return response
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Header counters as JSON; kept up to date on every write (see stats.py)"""
+    if session.get('role') != 'admin': return "Unauthorized", 403
+    return jsonify(store.stats())
+
+def bulk_set_status(section, ids, status):
+    """Move many bookings or sessions to `status` in one store batch; returns {id: result}"""
+    table = store.bookings if section == 'bookings' else store.sessions
     today_str = datetime.now().strftime('%Y-%m-%d')
-    
-    for s in session_bookings:
-        if s['status'] in ['Upcoming', 'Today']:
-            if s['date'] == today_str:
-                s['status'] = 'Today'
+    results = {}
+    with store.batch():
+        for raw_id in ids:
+            record = table.get(int(raw_id)) if raw_id.isdigit() else None
+            new_status = status
+            if record is not None and section == 'sessions':
+                if record.status == 'Cancelled' and status != 'Cancelled':
+                    new_status = None  # its time is released; the customer has to book again
+                elif status == 'Confirmed':
+                    new_status = 'Today' if record.date == today_str else 'Upcoming'
+            if record is None:
+                results[raw_id] = 'not_found'
+            elif new_status is None:
+                results[raw_id] = 'not_allowed'
+            elif new_status == record.status:
+                results[raw_id] = 'unchanged'
             else:
-                s['status'] = 'Upcoming'
+                if section == 'sessions' and new_status == 'Cancelled':
+                    store.cancel_session(record.id)
+                else:
+                    table.set_status(record.id, new_status)
+                results[raw_id] = 'updated'
+    return results
 
-    return render_template('admin.html', 
-                           users=users, 
-                           bookings=bookings, 
-                           sessions=session_bookings,
-                           feedbacks=feedbacks)
+@app.route('/admin/bulk/<section>', methods=['POST'])
+def bulk_update(section):
+    """Set one status on many bookings or sessions, then redirect once.
+
+    Form posts (ids=..&ids=..&status=..) get a flash summary; JSON posts
+    ({"ids": [...], "status": ".."}) or ?format=json get per-item results.
+    """
+    if session.get('role') != 'admin': return "Unauthorized", 403
+    if section not in BULK_STATUSES: return "Unknown section", 404
+
+    wants_json = request.is_json or request.args.get('format') == 'json'
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        ids, status = payload.get('ids') or [], payload.get('status')
+    else:
+        ids, status = request.form.getlist('ids'), request.form.get('status')
+    ids = list(dict.fromkeys(str(item_id) for item_id in ids))
+
+    if status not in BULK_STATUSES[section]:
+        error = f"Status must be one of: {', '.join(BULK_STATUSES[section])}"
+    elif not ids:
+        error = "Nothing selected."
+    elif len(ids) > BULK_MAX_IDS:
+        error = f"At most {BULK_MAX_IDS} items per request."
+    else:
+        error = None
+    tab = 'uploads' if section == 'bookings' else section
+    if error:
+        if wants_json:
+            return jsonify(error=error), 400
+        flash(error)
+        return redirect(url_for('admin_panel', section=tab))
+
+    results = bulk_set_status(section, ids, status)
+    summary = Counter(results.values())
+    if wants_json:
+        return jsonify(section=section, status=status, results=results, summary=summary)
+    flash(f"{section.capitalize()} set to {status}: " +
+          ', '.join(f"{count} {result.replace('_', ' ')}" for result, count in sorted(summary.items())))
+    return redirect(url_for('admin_panel', section=tab))
 
 @app.route('/admin/approve/<int:id>')
 def approve(id):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    for b in bookings:
-        if b['id'] == id:
-            b['status'] = 'Confirmed'
+    store.bookings.set_status(id, 'Confirmed')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/reject/<int:id>')
 def reject(id):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    for b in bookings:
-        if b['id'] == id:
-            b['status'] = 'Cancelled'
+    store.bookings.set_status(id, 'Cancelled')
+    return redirect(url_for('admin_panel'))
+
+@app.route('/admin/delete_booking/<int:id>')
+def delete_booking(id):
+    if session.get('role') != 'admin': return "Unauthorized", 403
+    store.delete_booking(id, collect_upload)
+    return redirect(url_for('admin_panel'))
+
+def set_session_status(id, status):
+    """One session through bulk_set_status, so a cancelled one (its time released) stays cancelled"""
+    if bulk_set_status('sessions', [str(id)], status)[str(id)] == 'not_allowed':
+        flash(f"Session {id} was cancelled and its time released. The customer has to book again.")
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/confirm_session/<int:id>')
 def confirm_session(id):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    for s in session_bookings:
-        if s['id'] == id:
-            if s['date'] == today_str:
-                s['status'] = 'Today'
-            else:
-                s['status'] = 'Upcoming'
-    return redirect(url_for('admin_panel'))
+    return set_session_status(id, 'Confirmed')
 
 @app.route('/admin/complete_session/<int:id>')
 def complete_session(id):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    for s in session_bookings:
-        if s['id'] == id:
-            s['status'] = 'Completed'
-    return redirect(url_for('admin_panel'))
+    return set_session_status(id, 'Completed')
 
 @app.route('/admin/cancel_session/<int:id>')
 def cancel_session(id):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    for s in session_bookings:
-        if s['id'] == id:
-            s['status'] = 'Cancelled'
+    store.cancel_session(id)
     return redirect(url_for('admin_panel'))
 
 # --- DATABASE MANAGEMENT ---
@@ -210,24 +482,21 @@ def edit_user():
     old_email = request.form.get('old_email')
     new_name = request.form.get('new_name')
     new_email = request.form.get('new_email')
-    if old_email in users:
-        data = users.pop(old_email)
-        data['name'] = new_name
-        users[new_email] = data
+    # Their bookings, sessions and feedback move to the new email too
+    if not store.update_user(old_email, new_email, new_name):
+        flash(f"{new_email} already has an account." if store.users.get(new_email) else "That account no longer exists.")
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete_user/<email>')
 def delete_user(email):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    if email in users:
-        users.pop(email)
+    store.users.delete(email)
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete_feedback/<id>')
 def delete_feedback(id):
     if session.get('role') != 'admin': return "Unauthorized", 403
-    global feedbacks
-    feedbacks = [f for f in feedbacks if f['id'] != id]
+    store.feedbacks.delete(id)
     return redirect(url_for('admin_panel'))
 
 @app.route('/logout')
@@ -1,54 +1,609 @@
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, render_template, request, redirect, url_for, session, flash, jsonify, Response
 import os
-import boto3
+import json
+import time
 import uuid
+import hashlib
 import base64
-from decimal import Decimal
+import threading
+import contextvars
+import heapq
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait
 from werkzeug.utils import secure_filename
+from werkzeug.datastructures import ContentRange
 from boto3.dynamodb.conditions import Key, Attr
-from botocore.exceptions import ClientError
-from datetime import datetime
-
-# Helper to convert DynamoDB Decimal to Python int/float
-def convert_decimal(obj):
-    """Recursively convert Decimal objects to int or float"""
-    if isinstance(obj, Decimal):
-        if obj % 1 == 0:
-            return int(obj)
-        else:
-            return float(obj)
-    elif isinstance(obj, dict):
-        return {k: convert_decimal(v) for k, v in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_decimal(item) for item in obj]
-    return obj
+from botocore.exceptions import BotoCoreError, ClientError
+from datetime import datetime, timezone
+from create_tables import USER_INDEX, FEEDBACK_USER_INDEX, UPDATED_INDEX
+import blob_store as blobs
+import thumbnails
+import cache as caching
+import changes
+import assets
+import aws_clients
+import dynamo
+import email_change
+import metrics
+import notify
+import ratings
+import search
+import session_sweeper
+import stats
+import availability
 
 app = Flask(__name__)
 app.secret_key = 'yojeong_secret_key'
 
 # --- AWS Configuration ---
 REGION = 'us-east-1'
-dynamodb = boto3.resource('dynamodb', region_name=REGION)
+# One low-level client per worker; items come back as native int/float/str
+# (see dynamo.py), so no Decimal clean-up pass is needed. The client is built
+# on first use after the fork, with pool size, timeouts and retries from the
+# DYNAMODB_* settings; only the service model is loaded here (see aws_clients.py)
+db = dynamo.DynamoDB(factory=aws_clients.from_env(os.environ, 'dynamodb', 'DYNAMODB_', region=REGION))
+db.factory.preload()
 
 # DynamoDB Tables
-users_table = dynamodb.Table('Users')
-admin_table = dynamodb.Table('AdminUsers')
-bookings_table = dynamodb.Table('Bookings')
-sessions_table = dynamodb.Table('Sessions')
-feedback_table = dynamodb.Table('Feedback')
-files_table = dynamodb.Table('Files')
-
-MAX_FILE_SIZE = 100 * 1024  # 100KB
+users_table = db.Table('Users')
+admin_table = db.Table('AdminUsers')
+bookings_table = db.Table('Bookings')
+sessions_table = db.Table('Sessions')
+feedback_table = db.Table('Feedback')
+files_table = db.Table('Files')
+availability_table = db.Table('Availability')
+# Running totals for the admin header (see stats.py)
+stats_table = db.Table('Stats')
+
+# Tables shown on the admin panel, keyed by section name
+ADMIN_SECTIONS = {
+    'users': 'Users',
+    'bookings': 'Bookings',
+    'sessions': 'Sessions',
+    'feedback': 'Feedback',
+}
+# Primary key attributes of those tables: the shape of a scan's LastEvaluatedKey
+ADMIN_KEYS = {
+    'users': ('email',),
+    'bookings': ('id',),
+    'sessions': ('id',),
+    'feedback': ('id',),
+}
+
+MAX_FILE_SIZE = 50 * 1024 * 1024  # 50MB
+app.config['MAX_CONTENT_LENGTH'] = MAX_FILE_SIZE + 1024 * 1024  # room for the other form fields
+
+# Uploaded file bytes live here; the Files table only keeps metadata
+blob_store = blobs.from_env()
+
+# Read-through cache for user lookups and admin pages (see cache.py)
+cache = caching.from_env(os.environ)
+
+# Route/template/DynamoDB timings on /metrics (internal addresses only, or
+# METRICS_TOKEN); SLOW_REQUEST_MS logs the per-call breakdown of any slower
+# request (see metrics.py)
+SLOW_REQUEST_MS = os.environ.get('SLOW_REQUEST_MS')
+metrics.init_app(app, db, slow_request_ms=float(SLOW_REQUEST_MS) if SLOW_REQUEST_MS else None,
+                 token=os.environ.get('METRICS_TOKEN'))
+
+# Booking alerts go through a background queue (SNS_TOPIC_ARN, see notify.py)
+notifier = notify.from_env(os.environ, region=REGION)
+
+# Fingerprinted static URLs, compression and cached public pages (see assets.py)
+assets.init_app(app)
+
+# Statuses /admin/bulk/<section> can set
+BULK_STATUSES = {
+    'bookings': ('Confirmed', 'Cancelled'),
+    'sessions': ('Confirmed', 'Completed', 'Cancelled'),
+}
+# (section, requested status) -> (notification type, verb), as the single-item routes send
+BULK_EVENTS = {
+    ('bookings', 'Confirmed'): ('booking.approved', 'approved'),
+    ('bookings', 'Cancelled'): ('booking.rejected', 'rejected'),
+    ('sessions', 'Confirmed'): ('session.confirmed', 'confirmed'),
+    ('sessions', 'Cancelled'): ('session.cancelled', 'cancelled'),
+}
+BULK_MAX_IDS = 500
+TRANSACTION_LIMIT = 100  # TransactWriteItems operations per call
+
+ADMIN_PAGE_SIZE = 50  # rows per admin table section
+EXPORT_SEGMENTS = 4  # parallel scan segments for /admin/export
+READ_WORKERS = 8  # threads per worker process for concurrent table reads
+READ_TIMEOUT = 5  # seconds a page waits for its reads before rendering without them
+
+# Shared, bounded pool for fanning out independent reads within a request
+_read_pool = ThreadPoolExecutor(max_workers=READ_WORKERS, thread_name_prefix='ddb-read')
 
 # --- Helper Functions ---
 def allowed_file(filename):
     ALLOWED_EXTENSIONS = {'jpg', 'jpeg', 'png', 'gif', 'pdf'}
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def get_table(name):
+    """Table handle that is safe to use from any thread (shared low-level client)"""
+    return db.Table(name)
+
+def _read_until(at, fn):
+    with dynamo.deadline(at):
+        return fn()
+
+def fan_out(reads, timeout=READ_TIMEOUT):
+    """Run independent reads concurrently and gather their results.
+
+    `reads` maps a name to a zero-argument callable. Returns (results, failed):
+    `results` holds the return value of every read that finished in time, and
+    `failed` lists the names that raised or timed out, so the page can still
+    render whatever did load. Each read runs in a copy of the caller's
+    context, so request-scoped context variables follow it onto the pool.
+
+    A running read can't be cancelled, so its DynamoDB calls carry the
+    deadline instead (see dynamo.deadline): each gets a client that times
+    out within the time left, and none starts after it, so a slow table
+    frees its pool thread about when the page stops waiting for it.
+    """
+    at = time.monotonic() + timeout
+    futures = {_read_pool.submit(contextvars.copy_context().run, _read_until, at, fn): name
+               for name, fn in reads.items()}
+    _, not_done = wait(futures, timeout=timeout)
+
+    results, failed = {}, []
+    for future, name in futures.items():
+        if future in not_done:
+            future.cancel()
+            app.logger.warning("Read '%s' timed out after %ss", name, timeout)
+            failed.append(name)
+        elif future.exception() is not None:
+            app.logger.warning("Read '%s' failed: %s", name, future.exception())
+            failed.append(name)
+        else:
+            results[name] = future.result()
+    return results, failed
+
+def query_all(table, index_name, key_name, value):
+    """Query a secondary index for every item with the given key, newest first.
+
+    Follows LastEvaluatedKey so results are never cut off at the 1MB page limit.
+    """
+    kwargs = {
+        'IndexName': index_name,
+        'KeyConditionExpression': Key(key_name).eq(value),
+        'ScanIndexForward': False,
+    }
+    items = []
+    while True:
+        resp = table.query(**kwargs)
+        items.extend(resp.get('Items', []))
+        if 'LastEvaluatedKey' not in resp:
+            return items
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+def get_user(email):
+    """The Users item for `email` (None if there isn't one), cached per worker"""
+    def load():
+        return users_table.get_item(Key={'email': email}).get('Item')
+    user = cache.get_or_load(f"user:{email}", load)
+    return dict(user) if user else None  # callers may modify their copy
+
+def admin_page(section, cursor=None):
+    """One page of an admin section as (rows, next_cursor, sync_cursor), cached per cursor.
+
+    `sync_cursor` is taken before the scan, so /admin/changes from there
+    covers every write the (possibly cached) page might be missing. A
+    cursor that isn't one of ours raises ValueError (see decode_cursor).
+    """
+    start_key = decode_cursor(cursor, ADMIN_KEYS[section])
+
+    def load():
+        sync_cursor = changes.cursor()
+        items, next_cursor = scan_page(get_table(ADMIN_SECTIONS[section]), start_key)
+        return items, next_cursor, sync_cursor
+    return cache.get_or_load(cache.key(section, cursor or ''), load)
+
+def form_ids(token, *names):
+    """8-character ids derived from a form's idempotency token.
+
+    A retried post carries the same token, so it maps onto the records the
+    first attempt created instead of minting new ones.
+    """
+    return [hashlib.sha256(f"{token}:{name}".encode('utf-8')).hexdigest()[:8] for name in names]
+
+def add_upload(booking_item, file_item, request_token):
+    """Write a retouch booking plus its reference to the uploaded content.
+
+    With `file_item` None the booking reuses the stored copy: the Files item
+    for its sha256 must exist, and its `refs` count goes up by one. Otherwise
+    `file_item` (just written to the blob store) is created with refs = 1 and
+    must not exist yet. Both writes share one transaction; the bookings
+    counters go up after it (see stats.py). Returns 'booked', 'duplicate'
+    (this form was already submitted) or 'conflict' (the Files item was not
+    in the expected state, so the caller should take the other path).
+    """
+    if file_item is None:
+        file_op = ('Update', 'Files', {
+            'Key': {'id': booking_item['sha256']},
+            'UpdateExpression': 'ADD refs :one',
+            'ConditionExpression': 'attribute_exists(id)',
+            'ExpressionAttributeValues': {':one': 1}
+        })
+    else:
+        file_op = ('Put', 'Files', {'Item': file_item, 'ConditionExpression': 'attribute_not_exists(id)'})
+    try:
+        db.transact_write([
+            file_op,
+            ('Put', 'Bookings', {'Item': booking_item, 'ConditionExpression': 'attribute_not_exists(id)'}),
+        ], token=request_token)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        reasons = dynamo.cancellation_reasons(e)
+        if code == 'IdempotentParameterMismatchException':
+            return 'duplicate'
+        if 'ConditionalCheckFailed' in reasons:
+            return 'duplicate' if reasons[1] == 'ConditionalCheckFailed' else 'conflict'
+        raise
+    stats.apply(stats_table, stats.added('bookings', booking_item['status']))
+    return 'booked'
+
+def release_upload(booking):
+    """Delete a retouch booking and drop its reference to the uploaded content.
+
+    Content whose last reference is gone is garbage-collected: its Files
+    item is deleted only while refs is still 0 (so a concurrent upload that
+    just re-referenced it wins), then its blob and derivatives. Each stored
+    copy has its own blob key, so a fresh copy uploaded meanwhile is never
+    the one removed.
+    """
+    file_id = booking.get('file_id')
+    content_addressed = file_id and file_id == booking.get('sha256')
+    operations = [
+        ('Delete', 'Bookings', {'Key': {'id': booking['id']}, 'ConditionExpression': Attr('status').eq(booking['status'])}),
+        ('Put', 'Deletions', {'Item': changes.tombstone('bookings', booking['id'])}),
+    ]
+    if content_addressed:
+        operations.append(('Update', 'Files', {
+            'Key': {'id': file_id},
+            'UpdateExpression': 'ADD refs :minus_one',
+            'ExpressionAttributeValues': {':minus_one': -1}
+        }))
+    db.transact_write(operations)
+    stats.apply(stats_table, stats.removed('bookings', booking['status']))
+    if not file_id:
+        return
+
+    try:
+        if content_addressed:
+            item = files_table.delete_item(
+                Key={'id': file_id},
+                ConditionExpression='refs <= :zero',
+                ExpressionAttributeValues={':zero': 0},
+                ReturnValues='ALL_OLD'
+            ).get('Attributes')
+        else:
+            # Uploads from before deduplication have a Files item of their own
+            item = files_table.delete_item(Key={'id': file_id}, ReturnValues='ALL_OLD').get('Attributes')
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return  # still referenced by another booking
+        raise
+    if item and item.get('storage_key'):
+        blob_store.delete(item['storage_key'])
+        if content_addressed:
+            thumbnails.delete_derivatives(blob_store, item['sha256'])
+
+def reserve_session(item, request_token):
+    """Write a session plus the Availability slots it holds in one transaction.
+
+    Each slot put is conditional on the slot being free, so two overlapping
+    bookings can never both succeed. Returns 'booked', 'duplicate' (this form
+    was already submitted) or 'taken' (the photographer is busy); any other
+    failure raises ClientError.
+    """
+    operations = [('Put', 'Sessions', {'Item': item, 'ConditionExpression': 'attribute_not_exists(id)'})]
+    operations += [
+        ('Put', 'Availability', {
+            'Item': {'photographer': item['photographer'], 'slot': slot, 'session_id': item['id']},
+            'ConditionExpression': 'attribute_not_exists(slot)'
+        })
+        for slot in item['slots']
+    ]
+    try:
+        db.transact_write(operations, token=request_token)
+    except ClientError as e:
+        code = e.response['Error']['Code']
+        reasons = dynamo.cancellation_reasons(e)
+        if code == 'IdempotentParameterMismatchException':
+            return 'duplicate'
+        if 'ConditionalCheckFailed' in reasons:
+            return 'duplicate' if reasons[0] == 'ConditionalCheckFailed' else 'taken'
+        raise
+    stats.apply(stats_table, stats.added('sessions', item['status']))
+    return 'booked'
+
+def busy_schedule(photographer, dates):
+    """Schedule of a photographer's held slots over `dates`, from one range query"""
+    schedule = availability.Schedule()
+    kwargs = {'KeyConditionExpression': Key('photographer').eq(photographer)
+              & Key('slot').between(f"{dates[0]}#", f"{dates[-1]}#~")}
+    while True:
+        resp = availability_table.query(**kwargs)
+        for item in resp.get('Items', []):
+            date_str, start, end = availability.parse_block(item['slot'])
+            schedule.reserve(photographer, date_str, start, end, item['session_id'])
+        if 'LastEvaluatedKey' not in resp:
+            return schedule
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+def encode_cursor(last_key):
+    """Turn a LastEvaluatedKey into a URL-safe token (None when there are no more rows)"""
+    if not last_key:
+        return None
+    raw = json.dumps(last_key, sort_keys=True).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+def decode_cursor(token, key_names):
+    """Inverse of encode_cursor for a table keyed by `key_names`; None without a token.
+
+    Raises ValueError unless the token decodes to exactly those attributes,
+    each a non-empty string, so a tampered cursor never reaches a scan as
+    its ExclusiveStartKey.
+    """
+    if not token:
+        return None
+    try:
+        key = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except ValueError:  # also covers bad base64 and non-ASCII/UTF-8 input
+        raise ValueError("Invalid cursor") from None
+    if (not isinstance(key, dict) or set(key) != set(key_names)
+            or not all(isinstance(value, str) and value for value in key.values())):
+        raise ValueError("Invalid cursor")
+    return key
+
+def scan_page(table, start_key=None, limit=ADMIN_PAGE_SIZE):
+    """Read one page of a table from `start_key`, returning (items, next_cursor).
+
+    DynamoDB may return fewer than `limit` items when it hits the 1MB page
+    size, so keep reading until the page is full or the table is exhausted.
+    """
+    kwargs = {}
+    if start_key:
+        kwargs['ExclusiveStartKey'] = start_key
+    items = []
+    while True:
+        kwargs['Limit'] = limit - len(items)
+        resp = table.scan(**kwargs)
+        items.extend(resp.get('Items', []))
+        last_key = resp.get('LastEvaluatedKey')
+        if not last_key or len(items) >= limit:
+            return items, encode_cursor(last_key)
+        kwargs['ExclusiveStartKey'] = last_key
+
+def parallel_scan(table_name, segments=EXPORT_SEGMENTS):
+    """Read a whole table using `segments` concurrent Segment/TotalSegments scans."""
+    def scan_segment(segment):
+        table = get_table(table_name)
+        kwargs = {'Segment': segment, 'TotalSegments': segments}
+        items = []
+        while True:
+            resp = table.scan(**kwargs)
+            items.extend(resp.get('Items', []))
+            if 'LastEvaluatedKey' not in resp:
+                return items
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    with ThreadPoolExecutor(max_workers=segments) as pool:
+        results = pool.map(scan_segment, range(segments))
+    return [item for segment_items in results for item in segment_items]
+
+def query_changes(table_name, index_name, range_key, day, since):
+    """Items of one updated_day written after `since` (stops early past changes.LIMIT)"""
+    kwargs = {'KeyConditionExpression': Key('updated_day').eq(day) & Key(range_key).gt(since)}
+    if index_name:
+        kwargs['IndexName'] = index_name
+    table = get_table(table_name)
+    items = []
+    while True:
+        resp = table.query(**kwargs)
+        items.extend(resp.get('Items', []))
+        if 'LastEvaluatedKey' not in resp or len(items) > changes.LIMIT:
+            return items
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+def changed_since(since):
+    """Admin rows written or deleted after `since`, oldest first.
+
+    One query per table and day on the updated_day-updated_at-index, plus
+    one on Deletions, all side by side. Returns (changes, stats, failed):
+    each change is (updated_at, section, id, item), item None for a deletion.
+    """
+    reads = {'stats': lambda: stats.read(stats_table)}
+    for day in changes.days(since):
+        for section, table_name in ADMIN_SECTIONS.items():
+            reads[f"{section} {day}"] = (lambda table_name=table_name, day=day:
+                                         query_changes(table_name, UPDATED_INDEX, 'updated_at', day, since))
+        reads[f"deletions {day}"] = lambda day=day: query_changes('Deletions', None, 'change_id', day, since)
+    results, failed = fan_out(reads)
+    totals = results.pop('stats', None)
+
+    found = []
+    for name, items in results.items():
+        section = name.split()[0]
+        for item in items:
+            if section == 'deletions':
+                found.append((item['updated_at'], item['section'], item['id'], None))
+            else:
+                found.append((item['updated_at'], section, item['email' if section == 'users' else 'id'], item))
+    found.sort(key=lambda change: (change[0], change[3] is not None))  # a deletion first on a tie
+    return found, totals, failed
+
+def delete_admin_row(section, key, operations=()):
+    """Delete a user or feedback item with its tombstone, then drop its counter; False if it was gone.
+
+    `operations` join the same transaction. Any other failure raises ClientError.
+    """
+    (key_name, record_id), = key.items()
+    try:
+        db.transact_write([
+            ('Delete', ADMIN_SECTIONS[section], {'Key': key, 'ConditionExpression': f"attribute_exists({key_name})"}),
+            ('Put', 'Deletions', {'Item': changes.tombstone(section, record_id)}),
+            *operations,
+        ])
+    except ClientError as e:
+        if dynamo.cancellation_reasons(e)[:1] == ['ConditionalCheckFailed']:
+            return False
+        raise
+    stats.apply(stats_table, stats.removed(section))
+    return True
+
+def email_change_step(job):
+    """A batch of a customer's rows moved to their new email (see email_change.py)"""
+    for section in ('bookings', 'sessions', 'feedback'):
+        cache.invalidate_namespace(section)
+
+# Session statuses are precomputed; session_sweeper.py moves the ones on the
+# day boundary (run it from cron). Each worker also sweeps once per day on the
+# first admin page view, in case the schedule was missed.
+_last_sweep = None
+_sweep_lock = threading.Lock()
+
+def sweep_if_due():
+    global _last_sweep
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    if today_str == _last_sweep:
+        return
+    with _sweep_lock:
+        if today_str == _last_sweep:
+            return
+        try:
+            if session_sweeper.sweep(sessions_table, today_str, stats_table):
+                cache.invalidate_namespace('sessions')
+            _last_sweep = today_str
+        except ClientError as e:
+            app.logger.warning("Session sweep failed: %s", e)
+
+def bulk_status(section, item, status, today_str):
+    """The status `item` ends up with when `status` is requested (None: not allowed)"""
+    if section == 'sessions':
+        if item.get('status') == 'Cancelled' and status != 'Cancelled':
+            return None  # its slots are gone; the customer has to book again
+        if status == 'Confirmed':
+            return 'Today' if item.get('date') == today_str else 'Upcoming'
+    return status
+
+def bulk_set_status(section, ids, status):
+    """Move many bookings or sessions to `status`; returns {id: result}.
+
+    Items are read with BatchGetItem and written with TransactWriteItems in
+    chunks of up to 100 operations; one Stats update per chunk follows it
+    with all of its moves. Every update is conditional on the status that was
+    read, so an item changed meanwhile is reported as 'conflict' (and the
+    rest of its chunk retried) instead of being overwritten. Cancelling a
+    session also releases its Availability slots. Other results: 'updated',
+    'unchanged', 'not_found', 'not_allowed' and 'error'.
+    """
+    table_name = ADMIN_SECTIONS[section]
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    found = {item['id']: item for item in db.batch_get(table_name, [{'id': item_id} for item_id in ids])}
+
+    results = {}
+    planned = []  # (item, new status, operations)
+    for item_id in ids:
+        item = found.get(item_id)
+        new_status = bulk_status(section, item, status, today_str) if item else None
+        if item is None:
+            results[item_id] = 'not_found'
+        elif new_status is None:
+            results[item_id] = 'not_allowed'
+        elif new_status == item.get('status'):
+            results[item_id] = 'unchanged'
+        else:
+            operations = [('Update', table_name, changes.touch({
+                'Key': {'id': item_id},
+                'UpdateExpression': "set #st = :s",
+                'ConditionExpression': Attr('status').eq(item.get('status')),
+                'ExpressionAttributeNames': {'#st': 'status'},
+                'ExpressionAttributeValues': {':s': new_status}
+            }))]
+            if section == 'sessions' and new_status == 'Cancelled':
+                operations += [
+                    ('Delete', 'Availability', {
+                        'Key': {'photographer': item['photographer'], 'slot': slot},
+                        'ConditionExpression': Attr('session_id').eq(item_id)
+                    })
+                    for slot in item.get('slots', [])
+                ]
+            planned.append((item, new_status, operations))
+
+    chunk, size = [], 0
+    for entry in planned + [None]:
+        if entry is None or size + len(entry[2]) > TRANSACTION_LIMIT:
+            if chunk:
+                _write_bulk_chunk(section, status, chunk, results)
+            chunk, size = [], 0
+        if entry is not None:
+            chunk.append(entry)
+            size += len(entry[2])
+    return results
+
+def _write_bulk_chunk(section, status, chunk, results):
+    while chunk:
+        operations = [op for _, _, ops in chunk for op in ops]
+        try:
+            db.transact_write(operations)
+        except ClientError as e:
+            reasons = dynamo.cancellation_reasons(e)
+            failed, index = set(), 0
+            for n, (_, _, ops) in enumerate(chunk):
+                if 'ConditionalCheckFailed' in reasons[index:index + len(ops)]:
+                    failed.add(n)
+                index += len(ops)
+            if not failed:
+                app.logger.warning("Bulk %s update failed: %s", section, e)
+                results.update({item['id']: 'error' for item, _, _ in chunk})
+                return
+            results.update({chunk[n][0]['id']: 'conflict' for n in failed})
+            chunk = [entry for n, entry in enumerate(chunk) if n not in failed]
+            continue
+
+        deltas = Counter()
+        for item, new_status, _ in chunk:
+            deltas.update(stats.moved(section, item.get('status'), new_status))
+        stats.apply(stats_table, {name: delta for name, delta in deltas.items() if delta})
+        event = BULK_EVENTS.get((section, status))
+        for item, new_status, _ in chunk:
+            results[item['id']] = 'updated'
+            if event is None:
+                continue
+            details = {'user': item.get('user'), 'service': item.get('service')}
+            if section == 'bookings':
+                subject = f"Retouch booking {item['id']} {event[1]}"
+                details['booking_id'] = item['id']
+            else:
+                subject = f"Session {item['id']} {event[1]}"
+                details.update(session_id=item['id'], date=item.get('date'))
+            notifier.notify(event[0], subject, **details)
+        return
+
 # --- Main Routes ---
+@app.route('/ready')
+def ready():
+    """Readiness probe: 200 once this worker's DynamoDB client is built and a read gets through.
+
+    The first probe builds the client and opens its first connection, so
+    the worker's first real request doesn't pay for either.
+    """
+    started = time.perf_counter()
+    try:
+        stats_table.get_item(Key=stats.KEY)
+    except (BotoCoreError, ClientError) as e:
+        app.logger.warning("Not ready: %s", e)
+        return jsonify(ready=False), 503
+    build = db.factory.build_seconds if db.factory else None
+    return jsonify(ready=True, check_ms=round((time.perf_counter() - started) * 1000, 1),
+                   client_build_ms=round(build * 1000, 1) if build is not None else None)
+
 @app.route('/')
 def home():
-    return render_template('home.html')
+    return assets.cached_page('home.html')
 
 @app.route('/signup', methods=['POST'])
 def signup():
@@ -61,17 +616,32 @@ def signup():
         flash("Passwords don't match!")
         return redirect(url_for('login'))
 
-    response = users_table.get_item(Key={'email': email})
-    if 'Item' in response:
+    if get_user(email):
         flash("Account already exists!")
         return redirect(url_for('login'))
 
-    users_table.put_item(Item={
+    user = changes.stamp({
         'email': email,
         'name': name,
         'password': password,
         'role': 'user'
     })
+    try:
+        db.transact_write([
+            ('Put', 'Users', {'Item': user, 'ConditionExpression': 'attribute_not_exists(email)'}),
+            # Name and email prefixes for /admin/search
+            *search.term_operations(email, name),
+        ])
+    except ClientError as e:
+        if dynamo.cancellation_reasons(e)[:1] == ['ConditionalCheckFailed']:
+            flash("Account already exists!")
+        else:
+            app.logger.warning("Signup for %s failed: %s", email, e)
+            flash("We couldn't create your account just now. Please try again.")
+        return redirect(url_for('login'))
+    stats.apply(stats_table, stats.added('users'))
+    cache.set(f"user:{email}", user)
+    cache.invalidate_namespace('users')
 
     flash("Account created! Please login.")
     return redirect(url_for('login'))
@@ -82,9 +652,8 @@ def login():
         email = request.form['email']
         password = request.form['password']
 
-        response = users_table.get_item(Key={'email': email})
-        if 'Item' in response:
-            user = convert_decimal(response['Item'])
+        user = get_user(email)
+        if user:
             if user['password'] == password:
                 session['user'] = user['name']
                 session['email'] = email
@@ -92,7 +661,8 @@ def login():
                 return redirect(url_for('dashboard'))
 
         flash("Invalid user credentials.")
-    return render_template('login.html')
+        return render_template('login.html')
+    return assets.cached_page('login.html', flashes=True)
 
 @app.route('/dashboard')
 def dashboard():
@@ -101,26 +671,27 @@ def dashboard():
 
     email = session['email']
 
-    # ✅ FIXED: Use .eq() instead of ==
-    bookings_resp = bookings_table.scan(
-        FilterExpression=Attr('user').eq(email)
-    )
-    sessions_resp = sessions_table.scan(
-        FilterExpression=Attr('user').eq(email)
-    )
-    feedbacks_resp = feedback_table.scan(
-        FilterExpression=Attr('user_email').eq(email)
-    )
+    # Per-user GSIs (see create_tables.py) so we only read this customer's rows;
+    # the three queries are independent, so run them side by side
+    results, failed = fan_out({
+        'bookings': lambda: query_all(get_table('Bookings'), USER_INDEX, 'user', email),
+        'sessions': lambda: query_all(get_table('Sessions'), USER_INDEX, 'user', email),
+        'feedback': lambda: query_all(get_table('Feedback'), FEEDBACK_USER_INDEX, 'user_email', email),
+    })
+    if failed:
+        flash(f"Some of your history could not be loaded ({', '.join(failed)}). Please refresh.")
 
-    # Combine bookings and sessions for display, convert Decimals
-    my_bookings = [convert_decimal(b) for b in bookings_resp.get('Items', [])] + [convert_decimal(s) for s in sessions_resp.get('Items', [])]
-    my_feedbacks = [convert_decimal(f) for f in feedbacks_resp.get('Items', [])]
+    # Each query comes back newest first, so merging keeps the combined list newest first
+    my_bookings = list(heapq.merge(results.get('bookings', []), results.get('sessions', []),
+                                   key=lambda item: item['created_at'], reverse=True))
+    my_feedbacks = results.get('feedback', [])
 
     return render_template(
         'dashboard.html',
         name=session['user'],
         my_bookings=my_bookings,
-        my_feedbacks=my_feedbacks
+        my_feedbacks=my_feedbacks,
+        idempotency_key=str(uuid.uuid4())
     )
 
 @app.route('/book', methods=['POST'])
@@ -136,43 +707,79 @@ def book_retouch():
         file.seek(0)
 
         if file_size > MAX_FILE_SIZE:
-            flash("File too large! Max size is 100KB")
+            flash("File too large! Max size is 50MB")
             return redirect(url_for('dashboard'))
 
         if not allowed_file(filename):
             flash("Invalid file type! Allowed: jpg, png, gif, pdf")
             return redirect(url_for('dashboard'))
 
-        file_data = file.read()
-        file_b64 = base64.b64encode(file_data).decode('utf-8')
-        file_id = str(uuid.uuid4())[:8]
-        booking_id = str(uuid.uuid4())[:8]
-
+        # Hidden form field; older cached forms without one just get a fresh token
+        token = request.form.get('idempotency_key') or str(uuid.uuid4())
+        copy_id, booking_id, reuse_token, store_token, retry_token = form_ids(
+            f"{session['email']}:{token}", 'file', 'booking', 'reuse', 'store', 'reuse-again')
+
+        # Uploads are stored once per content hash: the Files item is keyed by
+        # the sha256 and counts the bookings that reference it
+        sha256, size = blobs.hash_stream(file.stream)
+        now = datetime.now().isoformat()
+        booking_item = changes.stamp({
+            'id': booking_id,
+            'user': session['email'],
+            'user_name': session['user'],
+            'service': f"Retouch: {request.form.get('service')}",
+            'filename': filename,
+            'file_id': sha256,
+            'sha256': sha256,
+            'status': 'Pending',
+            'created_at': now
+        })
+
+        blob = None
         try:
-            files_table.put_item(Item={
-                'id': file_id,
-                'filename': filename,
-                'data': file_b64,
-                'file_type': filename.rsplit('.', 1)[1].lower(),
-                'size': file_size,
-                'user': session['email'],
-                'created_at': datetime.now().isoformat()
-            })
-
-            bookings_table.put_item(Item={
-                'id': booking_id,
-                'user': session['email'],
-                'user_name': session['user'],
-                'service': f"Retouch: {request.form.get('service')}",
-                'filename': filename,
-                'file_id': file_id,
-                'status': 'Pending',
-                'created_at': datetime.now().isoformat()
-            })
+            result = add_upload(booking_item, None, reuse_token)
+            if result == 'conflict':
+                # First copy of this content: stream it from werkzeug's spooled
+                # temp file into the blob store, then record it
+                with metrics.timed('blob_upload'):
+                    blob = blob_store.put_stream(blobs.content_key(sha256, copy_id), file.stream, file.mimetype)
+                file_item = {
+                    'id': sha256,
+                    'filename': filename,
+                    'storage_key': blob.key,
+                    'sha256': sha256,
+                    'content_type': file.mimetype or 'application/octet-stream',
+                    'file_type': filename.rsplit('.', 1)[1].lower(),
+                    'size': size,
+                    'refs': 1,
+                    'user': session['email'],
+                    'created_at': now
+                }
+                result = add_upload(booking_item, file_item, store_token)
+                if result != 'booked':
+                    blob_store.delete(blob.key)
+                    blob = None
+                if result == 'conflict':
+                    # Another upload stored the same content meanwhile; reference that copy
+                    result = add_upload(booking_item, None, retry_token)
+        except Exception as e:
+            flash(f"Upload failed: {str(e)}")
+            if blob is not None:
+                blob_store.delete(blob.key)
+            return redirect(url_for('dashboard'))
 
+        if result == 'booked':
             flash("File uploaded successfully!")
-        except ClientError as e:
-            flash(f"Upload failed: {str(e)}")
+            cache.invalidate_namespace('bookings')
+            notifier.notify('booking.created', f"New retouch booking from {session['user']}",
+                            booking_id=booking_id, user=session['email'],
+                            service=booking_item['service'], filename=filename)
+            if blob is not None:
+                thumbnails.schedule(blob_store, blob.key, sha256, filename.rsplit('.', 1)[1])
+        elif result == 'duplicate':
+            flash("This upload was already received.")
+        else:
+            flash("Upload failed: please try again.")
 
     return redirect(url_for('dashboard'))
 
@@ -182,25 +789,128 @@ def download_file(file_id):
         return redirect(url_for('login'))
 
     try:
-        resp = files_table.get_item(Key={'id': file_id})
+        # Metadata only: validators come from here, so a 304 never touches the payload
+        resp = files_table.get_item(
+            Key={'id': file_id},
+            ProjectionExpression='id, filename, storage_key, sha256, content_type, #sz, created_at',
+            ExpressionAttributeNames={'#sz': 'size'}
+        )
         if 'Item' not in resp:
             flash("File not found!")
             return redirect(url_for('dashboard'))
 
         item = resp['Item']
-        file_data = base64.b64decode(item['data'])
-
-        from flask import send_file
-        from io import BytesIO
-        return send_file(
-            BytesIO(file_data),
-            as_attachment=True,
-            download_name=item['filename']
-        )
+        if 'storage_key' not in item:
+            # Legacy item stored inline as base64 (see migrate_files.py)
+            item = files_table.get_item(Key={'id': file_id})['Item']
+            from flask import send_file
+            from io import BytesIO
+            with metrics.timed('legacy_base64_decode'):
+                data = base64.b64decode(item['data'])
+            return send_file(
+                BytesIO(data),
+                as_attachment=True,
+                download_name=item['filename']
+            )
+
+        # One stored copy serves every booking of the same content; each
+        # booking links with its own filename
+        name = secure_filename(request.args.get('name', ''))
+        if name:
+            item['filename'] = name
+        return blob_response(item)
     except Exception as e:
         flash(f"Download failed: {str(e)}")
         return redirect(url_for('dashboard'))
 
+@app.route('/derived/<sha256>/<name>')
+def derived_file(sha256, name):
+    """Thumbnail/preview of an upload; content-addressed, so cacheable forever"""
+    if session.get('role') not in ['user', 'admin']:
+        return "Unauthorized", 403
+    if name not in thumbnails.SIZES or len(sha256) != 64 or not all(c in '0123456789abcdef' for c in sha256):
+        return "Not found", 404
+
+    etag = f"{sha256}-{name}"
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        try:
+            chunks = blob_store.iter_chunks(thumbnails.derivative_key(sha256, name))
+        except Exception:
+            return "Not found", 404  # not generated yet (or not an image)
+        response = Response(chunks, mimetype=thumbnails.CONTENT_TYPE)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, max-age=31536000, immutable'
+    return response
+
+@app.template_global()
+def thumbnail_url(booking, name='thumb'):
+    """URL of a booking's derivative image ('' until one exists)"""
+    if not booking.get('sha256'):
+        return ''
+    return url_for('derived_file', sha256=booking['sha256'], name=name)
+
+@app.template_global()
+def original_url(booking):
+    if not booking.get('file_id'):
+        return ''
+    return url_for('download_file', file_id=booking['file_id'], name=booking.get('filename'))
+
+def blob_response(item):
+    """Stream a stored file, honouring If-None-Match/If-Modified-Since and Range"""
+    size = int(item['size'])
+    etag = item['sha256']
+    last_modified = datetime.fromisoformat(item['created_at']).replace(microsecond=0, tzinfo=timezone.utc)
+
+    def with_validators(response):
+        response.set_etag(etag)
+        response.last_modified = last_modified
+        response.headers['Accept-Ranges'] = 'bytes'
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+
+    if request.if_none_match:
+        not_modified = request.if_none_match.contains(etag)
+    else:
+        since = request.if_modified_since
+        not_modified = since is not None and last_modified <= since
+    if not_modified:
+        return with_validators(Response(status=304))
+
+    start, length, status = 0, size, 200
+    # If-Range: only honour the Range if the client's copy is still current
+    if_range = request.if_range
+    if if_range.etag is not None:
+        range_valid = if_range.etag == etag
+    elif if_range.date is not None:
+        range_valid = if_range.date >= last_modified
+    else:
+        range_valid = True
+    # Several ranges would need a multipart/byteranges body; send the whole
+    # file for those instead, as a server that ignores Range would
+    if request.range and range_valid and len(request.range.ranges) == 1:
+        span = request.range.range_for_length(size)
+        if span is None:
+            response = Response(status=416)
+            response.headers['Content-Range'] = f"bytes */{size}"
+            return with_validators(response)
+        start, stop = span
+        length, status = stop - start, 206
+
+    response = Response(
+        blob_store.iter_chunks(item['storage_key'], start, length),
+        status=status,
+        mimetype=item.get('content_type', 'application/octet-stream'),
+        headers={
+            'Content-Length': str(length),
+            'Content-Disposition': f'attachment; filename="{item["filename"]}"'
+        }
+    )
+    if status == 206:
+        response.content_range = ContentRange('bytes', start, start + length, size)
+    return with_validators(response)
+
 @app.route('/book_session', methods=['POST'])
 def book_session():
     if session.get('role') != 'user':
@@ -213,36 +923,108 @@ def book_session():
         flash("Cannot book session for past dates.")
         return redirect(url_for('dashboard'))
 
-    session_id = str(uuid.uuid4())[:8]
-    sessions_table.put_item(Item={
+    session_type = request.form.get('session_type')
+    photographer = request.form.get('photographer')
+    time_str = request.form.get('session_time')
+    span = availability.interval(session_type, time_str)
+    if photographer not in availability.PHOTOGRAPHERS or span is None:
+        flash("Please choose a photographer, session type and time from the list.")
+        return redirect(url_for('dashboard'))
+
+    # The ids include the chosen slot, so picking another time after a
+    # conflict is a new request rather than a replay of the first one
+    token = request.form.get('idempotency_key') or str(uuid.uuid4())
+    session_id, request_token = form_ids(
+        f"{session['email']}:{token}:{photographer}:{session_type}:{date_str}:{time_str}",
+        'session', 'request'
+    )
+    item = changes.stamp({
         'id': session_id,
         'user': session['email'],
         'user_name': session['user'],
-        'service': f"{request.form.get('session_type')} (with {request.form.get('photographer')})",
+        'service': f"{session_type} (with {photographer})",
+        'photographer': photographer,
         'date': date_str,
-        'time': request.form.get('session_time'),
+        'time': time_str,
+        'slots': availability.blocks(date_str, *span),
         'status': 'Pending',
         'created_at': datetime.now().isoformat()
     })
+    try:
+        outcome = reserve_session(item, request_token)
+    except ClientError as e:
+        app.logger.warning("Session booking %s failed: %s", session_id, e)
+        flash("We couldn't book this session just now. Please try again.")
+        return redirect(url_for('dashboard'))
+    if outcome == 'duplicate':
+        flash("This session request was already received.")
+        return redirect(url_for('dashboard'))
+    if outcome == 'taken':
+        flash(f"{photographer} is already booked at {time_str} on {date_str}. Please pick another time.")
+        return redirect(url_for('dashboard'))
 
+    cache.invalidate_namespace('sessions')
+    notifier.notify('session.requested', f"New session request from {session['user']}",
+                    session_id=session_id, user=session['email'], service=f"{session_type} (with {photographer})",
+                    date=date_str, time=time_str)
     flash("Session booked successfully!")
     return redirect(url_for('dashboard'))
 
+@app.route('/availability')
+def photographer_availability():
+    """Free start times per day for one photographer, e.g. a month at a time"""
+    photographer = request.args.get('photographer')
+    if photographer not in availability.PHOTOGRAPHERS:
+        return jsonify(error="Unknown photographer"), 400
+    duration = availability.DURATIONS.get(request.args.get('session_type'), min(availability.DURATIONS.values()))
+    try:
+        dates = availability.days(request.args.get('date_from', ''), request.args.get('date_to', ''))
+    except ValueError as e:
+        return jsonify(error=str(e)), 400
+    today_str = datetime.now().strftime('%Y-%m-%d')
+    dates = [d for d in dates if d >= today_str]
+    if not dates:
+        return jsonify(photographer=photographer, free={})
+    free = busy_schedule(photographer, dates).free_slots(photographer, dates, duration)
+    return jsonify(photographer=photographer, free=free)
+
 @app.route('/submit_feedback', methods=['POST'])
 def submit_feedback():
     if session.get('role') != 'user':
         return redirect(url_for('login'))
 
-    feedback_id = str(uuid.uuid4())[:8]
-    feedback_table.put_item(Item={
-        'id': feedback_id,
+    rating = ratings.parse_rating(request.form.get('rating'))
+    if rating is None:
+        flash("Please rate from 1 to 5 stars.")
+        return redirect(url_for('dashboard'))
+    # Each service and photographer names counters on the ratings item, so only known ones are taken
+    service = request.form.get('service')
+    photographer = request.form.get('photographer') or None
+    if service not in ratings.SERVICES or (photographer and photographer not in availability.PHOTOGRAPHERS):
+        flash("Please choose a service and photographer from the list.")
+        return redirect(url_for('dashboard'))
+
+    item = changes.stamp({
+        'id': str(uuid.uuid4())[:8],
         'user_name': session['user'],
         'user_email': session['email'],
-        'service': request.form.get('service'),
-        'rating': int(request.form.get('rating')),
+        'service': service,
+        'rating': rating,
         'comment': request.form.get('comment'),
         'created_at': datetime.now().isoformat()
     })
+    if photographer:
+        item['photographer'] = photographer
+    try:
+        feedback_table.put_item(Item=item)
+    except ClientError as e:
+        app.logger.warning("Feedback from %s failed: %s", session['email'], e)
+        flash("We couldn't save your feedback just now. Please try again.")
+        return redirect(url_for('dashboard'))
+    # The counters follow the review on their own (see stats.py and ratings.py)
+    stats.apply(stats_table, stats.added('feedback'))
+    ratings.apply(stats_table, ratings.added(item))
+    cache.invalidate_namespace('feedback')
 
     flash("Thank you for your feedback!")
     return redirect(url_for('dashboard'))
@@ -257,7 +1039,7 @@ def admin_login():
 
         response = admin_table.get_item(Key={'email': email})
         if 'Item' in response:
-            user = convert_decimal(response['Item'])
+            user = response['Item']
             if user['password'] == password:
                 session['user'] = user['name']
                 session['email'] = email
@@ -265,42 +1047,261 @@ def admin_login():
                 return redirect(url_for('admin_panel'))
 
         flash("Access Denied: Admin credentials invalid.")
-    return render_template('admin_login.html')
+        return render_template('admin_login.html')
+    return assets.cached_page('admin_login.html', flashes=True)
 
 @app.route('/admin')
 def admin_panel():
     if session.get('role') != 'admin':
         return redirect(url_for('admin_login'))
 
-    users = [convert_decimal(u) for u in users_table.scan().get('Items', [])]
-    bookings = [convert_decimal(b) for b in bookings_table.scan().get('Items', [])]
-    sessions = [convert_decimal(s) for s in sessions_table.scan().get('Items', [])]
-    feedbacks = [convert_decimal(f) for f in feedback_table.scan().get('Items', [])]
-
-    users_dict = {u['email']: {'name': u['name']} for u in users}
+    # Each section pages independently via ?<section>_cursor=<token>
+    try:
+        for name in ADMIN_SECTIONS:
+            decode_cursor(request.args.get(f'{name}_cursor'), ADMIN_KEYS[name])
+    except ValueError as e:
+        return str(e), 400
+
+    sweep_if_due()
+
+    reads = {
+        name: (lambda name=name, cursor=request.args.get(f'{name}_cursor'): admin_page(name, cursor))
+        for name in ADMIN_SECTIONS
+    }
+    # Header totals come from one Stats item instead of counting rows
+    reads['stats'] = lambda: stats.read(stats_table)
+    reads['ratings'] = lambda: ratings.read(stats_table)
+    results, failed = fan_out(reads)
+    if failed:
+        flash(f"Could not load: {', '.join(failed)}. Showing the rest.")
+
+    page = {}
+    cursors = {}
+    # Delta sync starts from the oldest section read (or cached) for this page
+    sync_cursor = changes.cursor()
+    for name in ADMIN_SECTIONS:
+        page[name], cursors[name], loaded_at = results.get(name, ([], None, sync_cursor))
+        sync_cursor = min(sync_cursor, loaded_at)
+
+    users_dict = {u['email']: {'name': u['name']} for u in page['users']}
 
     return render_template(
         'admin.html',
         users=users_dict,
-        bookings=bookings,
-        sessions=sessions,
-        feedbacks=feedbacks
+        bookings=page['bookings'],
+        sessions=page['sessions'],
+        feedbacks=page['feedback'],
+        cursors=cursors,
+        stats=results.get('stats', {}),
+        ratings=ratings.summarize(results.get('ratings', {})),
+        search_statuses=search.STATUSES,
+        photographers=availability.PHOTOGRAPHERS,
+        sync_cursor=sync_cursor
     )
 
+@app.route('/admin/more/<section>')
+def admin_more(section):
+    """Render the next page of one admin section as table rows for "Load more"."""
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+    if section not in ADMIN_SECTIONS:
+        return "Unknown section", 404
+
+    try:
+        rows, next_cursor, _ = admin_page(section, request.args.get('cursor'))
+    except ValueError as e:
+        return str(e), 400
+    if section == 'users':
+        rows = {u['email']: {'name': u['name']} for u in rows}
+
+    html = render_template('admin_rows.html', section=section, rows=rows)
+    return html, 200, {'X-Next-Cursor': next_cursor or ''}
+
+@app.route('/admin/changes')
+def admin_changes():
+    """Admin rows created, changed or deleted after ?since=<cursor>, as JSON.
+
+    The admin page polls this with the cursor of its last response and
+    patches its tables in place (?html=1 adds each row's rendered markup),
+    so a refresh costs bytes in proportion to what changed. A cursor that
+    is too old, or too many changes, gets {"reset": true}: reload instead.
+    """
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+
+    try:
+        since = changes.normalize(request.args.get('since'))
+    except ValueError:
+        return jsonify(error="since must be a cursor from the admin page or an earlier response"), 400
+    next_cursor = changes.cursor()  # taken before reading, so the next poll re-reads anything in flight
+    if since < changes.horizon():
+        return jsonify(reset=True, cursor=next_cursor)
+
+    found, totals, failed = changed_since(since)
+    failed = [name for name in failed if name != 'stats']
+    if failed:
+        return jsonify(error=f"Could not read: {', '.join(failed)}"), 503
+    if len(found) > changes.LIMIT:
+        return jsonify(reset=True, cursor=next_cursor)
+
+    html = request.args.get('html') == '1'
+    entries = []
+    for updated_at, section, record_id, item in found:
+        entry = {'section': section, 'id': record_id, 'updated_at': updated_at, 'deleted': item is None}
+        if item is not None:
+            entry['record'] = {k: v for k, v in item.items() if k != 'password'}
+            if html:
+                rows = {record_id: {'name': item.get('name')}} if section == 'users' else [item]
+                entry['html'] = render_template('admin_rows.html', section=section, rows=rows)
+        entries.append(entry)
+    return jsonify(cursor=next_cursor, changes=entries, stats=totals)
+
+@app.route('/admin/search')
+def admin_search():
+    """Bookings, sessions or users matching the filters in the query string, one page of them as JSON.
+
+    Each search reads one index (see search.py), so it costs the rows that
+    match rather than the table. ?html=1 adds the page's rendered rows.
+    """
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+    try:
+        filters = search.parse(request.args)
+    except search.SearchError as e:
+        return jsonify(error=str(e)), 400
+
+    section = filters['section']
+    found = search.find(db, filters)
+    rows, total, pages = search.paginate(section, found[:search.MAX_RESULTS], filters['page'])
+    response = {
+        'results': [{k: v for k, v in row.items() if k != 'password'} for row in rows],
+        'page': filters['page'],
+        'pages': pages,
+        'total': total,
+        'truncated': len(found) > search.MAX_RESULTS,
+    }
+    if request.args.get('html') == '1':
+        rows = {u['email']: {'name': u.get('name')} for u in rows} if section == 'users' else rows
+        response['html'] = render_template('admin_rows.html', section=section, rows=rows)
+    return jsonify(response)
+
+@app.route('/ratings')
+def rating_summary():
+    """Average, count and star histogram per service and per photographer (public): one GetItem"""
+    response = jsonify(ratings.summarize(cache.get_or_load(cache.key('feedback', 'ratings'),
+                                                           lambda: ratings.read(stats_table))))
+    response.headers['Cache-Control'] = f"public, max-age={ratings.MAX_AGE}"
+    return response
+
+@app.route('/admin/stats')
+def admin_stats():
+    """Header counters as JSON: one GetItem, whatever the table sizes"""
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+    return jsonify(stats.read(stats_table))
+
+@app.route('/admin/export/<section>')
+def admin_export(section):
+    """Full JSON export of one admin table using a parallel scan."""
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+    if section not in ADMIN_SECTIONS:
+        return "Unknown section", 404
+
+    segments = max(1, min(request.args.get('segments', EXPORT_SEGMENTS, type=int), 16))
+    items = parallel_scan(ADMIN_SECTIONS[section], segments)
+    # never ship password hashes/plaintext out in an export
+    return jsonify([
+        {k: v for k, v in item.items() if k != 'password'}
+        for item in items
+    ])
+
+@app.route('/admin/bulk/<section>', methods=['POST'])
+def bulk_update(section):
+    """Set one status on many bookings or sessions with a single round of writes.
+
+    A form post (ids=..&ids=..&status=..) gets a flash summary and one
+    redirect back to the panel. A JSON post ({"ids": [...], "status": ".."})
+    or ?format=json gets the per-item results as JSON, for scripts.
+    """
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+    if section not in BULK_STATUSES:
+        return "Unknown section", 404
+
+    wants_json = request.is_json or request.args.get('format') == 'json'
+    if request.is_json:
+        payload = request.get_json(silent=True) or {}
+        ids, status = payload.get('ids') or [], payload.get('status')
+    else:
+        ids, status = request.form.getlist('ids'), request.form.get('status')
+    ids = list(dict.fromkeys(str(item_id) for item_id in ids))
+
+    if status not in BULK_STATUSES[section]:
+        error = f"Status must be one of: {', '.join(BULK_STATUSES[section])}"
+    elif not ids:
+        error = "Nothing selected."
+    elif len(ids) > BULK_MAX_IDS:
+        error = f"At most {BULK_MAX_IDS} items per request."
+    else:
+        error = None
+    tab = 'uploads' if section == 'bookings' else section
+    if error:
+        if wants_json:
+            return jsonify(error=error), 400
+        flash(error)
+        return redirect(url_for('admin_panel', section=tab))
+
+    try:
+        results = bulk_set_status(section, ids, status)
+    except ClientError as e:
+        if wants_json:
+            return jsonify(error=str(e)), 502
+        flash(f"Bulk update failed: {str(e)}")
+        return redirect(url_for('admin_panel', section=tab))
+    cache.invalidate_namespace(section)
+
+    summary = Counter(results.values())
+    if wants_json:
+        return jsonify(section=section, status=status, results=results, summary=summary)
+    flash(f"{section.capitalize()} set to {status}: " +
+          ', '.join(f"{count} {result.replace('_', ' ')}" for result, count in sorted(summary.items())))
+    return redirect(url_for('admin_panel', section=tab))
+
 @app.route('/admin/approve/<booking_id>')
 def approve(booking_id):
     if session.get('role') != 'admin':
         return "Unauthorized", 403
 
     try:
-        bookings_table.update_item(
+        booking = bookings_table.update_item(**changes.touch(dict(
             Key={'id': str(booking_id)},
             UpdateExpression="set #st = :s",
+            ConditionExpression='attribute_exists(id)',
             ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':s': 'Confirmed'}
-        )
+            ExpressionAttributeValues={':s': 'Confirmed'},
+            ReturnValues='ALL_OLD'
+        )))['Attributes']
+        stats.apply(stats_table, stats.moved('bookings', booking.get('status'), 'Confirmed'))
+        notifier.notify('booking.approved', f"Retouch booking {booking_id} approved",
+                        booking_id=str(booking_id), user=booking.get('user'), service=booking.get('service'))
     except Exception as e:
         flash(f"Error updating booking: {str(e)}")
+    cache.invalidate_namespace('bookings')
+    return redirect(url_for('admin_panel'))
+
+@app.route('/admin/delete_booking/<booking_id>')
+def delete_booking(booking_id):
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+
+    try:
+        booking = bookings_table.get_item(Key={'id': str(booking_id)}).get('Item')
+        if booking:
+            release_upload(booking)
+    except Exception as e:
+        flash(f"Error deleting booking: {str(e)}")
+    cache.invalidate_namespace('bookings')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/reject/<booking_id>')
@@ -309,51 +1310,49 @@ def reject(booking_id):
         return "Unauthorized", 403
 
     try:
-        bookings_table.update_item(
+        booking = bookings_table.update_item(**changes.touch(dict(
             Key={'id': str(booking_id)},
             UpdateExpression="set #st = :s",
+            ConditionExpression='attribute_exists(id)',
             ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':s': 'Cancelled'}
-        )
+            ExpressionAttributeValues={':s': 'Cancelled'},
+            ReturnValues='ALL_OLD'
+        )))['Attributes']
+        stats.apply(stats_table, stats.moved('bookings', booking.get('status'), 'Cancelled'))
+        notifier.notify('booking.rejected', f"Retouch booking {booking_id} rejected",
+                        booking_id=str(booking_id), user=booking.get('user'), service=booking.get('service'))
     except Exception as e:
         flash(f"Error rejecting booking: {str(e)}")
+    cache.invalidate_namespace('bookings')
+    return redirect(url_for('admin_panel'))
+
+def set_session_status(session_id, status, verb):
+    """One session through bulk_set_status, so a cancelled one (its slots released) stays cancelled"""
+    try:
+        result = bulk_set_status('sessions', [str(session_id)], status)[str(session_id)]
+    except ClientError as e:
+        app.logger.warning("%s session %s failed: %s", verb.capitalize(), session_id, e)
+        result = 'error'
+    if result == 'not_allowed':
+        flash(f"Session {session_id} was cancelled and its slots released. The customer has to book again.")
+    elif result == 'conflict':
+        flash(f"Session {session_id} was changed meanwhile. Please try again.")
+    elif result == 'error':
+        flash(f"Error {verb} session {session_id}. Please try again.")
+    cache.invalidate_namespace('sessions')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/confirm_session/<session_id>')
 def confirm_session(session_id):
     if session.get('role') != 'admin':
         return "Unauthorized", 403
-
-    today_str = datetime.now().strftime('%Y-%m-%d')
-    try:
-        resp = sessions_table.get_item(Key={'id': str(session_id)})
-        if 'Item' in resp:
-            status = 'Today' if resp['Item']['date'] == today_str else 'Upcoming'
-            sessions_table.update_item(
-                Key={'id': str(session_id)},
-                UpdateExpression="set #st = :s",
-                ExpressionAttributeNames={'#st': 'status'},
-                ExpressionAttributeValues={':s': status}
-            )
-    except Exception as e:
-        flash(f"Error confirming session: {str(e)}")
-    return redirect(url_for('admin_panel'))
+    return set_session_status(session_id, 'Confirmed', 'confirming')
 
 @app.route('/admin/complete_session/<session_id>')
 def complete_session(session_id):
     if session.get('role') != 'admin':
         return "Unauthorized", 403
-
-    try:
-        sessions_table.update_item(
-            Key={'id': str(session_id)},
-            UpdateExpression="set #st = :s",
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':s': 'Completed'}
-        )
-    except Exception as e:
-        flash(f"Error completing session: {str(e)}")
-    return redirect(url_for('admin_panel'))
+    return set_session_status(session_id, 'Completed', 'completing')
 
 @app.route('/admin/cancel_session/<session_id>')
 def cancel_session(session_id):
@@ -361,14 +1360,32 @@ def cancel_session(session_id):
         return "Unauthorized", 403
 
     try:
-        sessions_table.update_item(
-            Key={'id': str(session_id)},
-            UpdateExpression="set #st = :s",
-            ExpressionAttributeNames={'#st': 'status'},
-            ExpressionAttributeValues={':s': 'Cancelled'}
-        )
+        item = sessions_table.get_item(Key={'id': str(session_id)}).get('Item')
+        if item and item.get('status') != 'Cancelled':
+            # Free the photographer's slots in the same transaction; each
+            # delete only removes a slot this session still holds
+            db.transact_write([
+                ('Update', 'Sessions', changes.touch({
+                    'Key': {'id': item['id']},
+                    'UpdateExpression': "set #st = :s",
+                    'ConditionExpression': Attr('status').eq(item['status']),
+                    'ExpressionAttributeNames': {'#st': 'status'},
+                    'ExpressionAttributeValues': {':s': 'Cancelled'}
+                })),
+            ] + [
+                ('Delete', 'Availability', {
+                    'Key': {'photographer': item['photographer'], 'slot': slot},
+                    'ConditionExpression': Attr('session_id').eq(item['id'])
+                })
+                for slot in item.get('slots', [])
+            ])
+            stats.apply(stats_table, stats.moved('sessions', item['status'], 'Cancelled'))
+            notifier.notify('session.cancelled', f"Session {session_id} cancelled",
+                            session_id=item['id'], user=item.get('user'),
+                            service=item.get('service'), date=item.get('date'))
     except Exception as e:
         flash(f"Error cancelling session: {str(e)}")
+    cache.invalidate_namespace('sessions')
     return redirect(url_for('admin_panel'))
 
 @app.route('/edit_user', methods=['POST'])
@@ -380,13 +1397,57 @@ def edit_user():
     new_name = request.form['new_name']
     new_email = request.form['new_email']
 
-    res = users_table.get_item(Key={'email': old_email})
-    if 'Item' in res:
-        item = res['Item']
-        users_table.delete_item(Key={'email': old_email})
+    item = get_user(old_email)
+    if item:
+        old_name = item.get('name')
         item['email'] = new_email
         item['name'] = new_name
-        users_table.put_item(Item=item)
+        changes.stamp(item)
+        # The search prefixes change with the row; both writes are conditional
+        # on the name the prefixes were derived from, in case the cached row is stale
+        terms = search.term_operations(new_email, new_name, old=(old_email, old_name))
+        unchanged = {'ConditionExpression': 'attribute_exists(email) AND #nm = :name',
+                     'ExpressionAttributeNames': {'#nm': 'name'}, 'ExpressionAttributeValues': {':name': old_name}}
+        if new_email == old_email:
+            try:
+                db.transact_write([('Put', 'Users', {'Item': item, **unchanged})] + terms)
+            except ClientError as e:
+                if dynamo.cancellation_reasons(e)[:1] == ['ConditionalCheckFailed']:
+                    flash("This customer was changed or deleted meanwhile. Please try again.")
+                else:
+                    app.logger.warning("Editing user %s failed: %s", old_email, e)
+                    flash("We couldn't save the changes to this customer just now. Please try again.")
+                cache.delete(f"user:{old_email}")
+                return redirect(url_for('admin_panel'))
+        else:
+            # The row moves to a new key, together with the job that moves the
+            # customer's bookings, sessions and feedback after it (see
+            # email_change.py); the tombstone drops the old row from open admin pages
+            job = email_change.new_job(old_email, new_email, new_name)
+            try:
+                db.transact_write([
+                    ('Delete', 'Users', {'Key': {'email': old_email}, **unchanged}),
+                    ('Put', 'Users', {'Item': item, 'ConditionExpression': 'attribute_not_exists(email)'}),
+                    ('Put', 'Deletions', {'Item': changes.tombstone('users', old_email)}),
+                ] + email_change.job_operations(job) + terms)
+            except ClientError as e:
+                # Operation order above: 0 old row, 1 new row, 2 tombstone, 3+ job and search terms
+                reasons = dynamo.cancellation_reasons(e)
+                if reasons[1:2] == ['ConditionalCheckFailed']:
+                    flash(f"{new_email} already has an account.")
+                elif 'ConditionalCheckFailed' in reasons[3:]:
+                    flash("This customer's records are still moving from their last email change. Try again in a minute.")
+                elif reasons[:1] == ['ConditionalCheckFailed']:
+                    flash("This customer was changed or deleted meanwhile. Please try again.")
+                else:
+                    app.logger.warning("Moving user %s to %s failed: %s", old_email, new_email, e)
+                    flash("We couldn't save the changes to this customer just now. Please try again.")
+                cache.delete(f"user:{old_email}")  # a failed Delete means the cached row is out of date
+                return redirect(url_for('admin_panel'))
+            email_change.start(db, job, on_step=email_change_step)
+        cache.delete(f"user:{old_email}")
+        cache.set(f"user:{new_email}", item)
+        cache.invalidate_namespace('users')
 
     return redirect(url_for('admin_panel'))
 
@@ -395,7 +1456,16 @@ def delete_user(email):
     if session.get('role') != 'admin':
         return "Unauthorized", 403
 
-    users_table.delete_item(Key={'email': email})
+    # Read from the table rather than the cache: the search prefixes to drop come from the name
+    item = users_table.get_item(Key={'email': email}, ConsistentRead=True).get('Item')
+    if item is not None:
+        try:
+            delete_admin_row('users', {'email': email},
+                             search.term_operations(None, None, old=(email, item.get('name'))))
+        except ClientError as e:
+            flash(f"Error deleting user: {str(e)}")
+    cache.delete(f"user:{email}")
+    cache.invalidate_namespace('users')
     return redirect(url_for('admin_panel'))
 
 @app.route('/admin/delete_feedback/<feedback_id>')
@@ -403,9 +1473,24 @@ def delete_feedback(feedback_id):
     if session.get('role') != 'admin':
         return "Unauthorized", 403
 
-    feedback_table.delete_item(Key={'id': feedback_id})
+    item = feedback_table.get_item(Key={'id': feedback_id}).get('Item')
+    if item is not None:
+        try:
+            if delete_admin_row('feedback', {'id': feedback_id}):
+                # Reviews are never edited, so the counters to take back are the ones this item added
+                ratings.apply(stats_table, ratings.removed(item))
+        except ClientError as e:
+            flash(f"Error deleting feedback: {str(e)}")
+    cache.invalidate_namespace('feedback')
     return redirect(url_for('admin_panel'))
 
+@app.route('/admin/cache_stats')
+def cache_stats():
+    """Hit/miss counters for sizing CACHE_SIZE / CACHE_TTL"""
+    if session.get('role') != 'admin':
+        return "Unauthorized", 403
+    return jsonify(cache.stats())
+
 @app.route('/logout')
 def logout():
     session.clear()
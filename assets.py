@@ -0,0 +1,249 @@
+"""HTTP caching and compression for app.py and app_aws.py.
+
+* fingerprinted assets - `url_for('static', filename='panda.jpeg')` points at
+                         the build's copy, static/dist/panda.<sha256>.jpeg,
+                         served with `Cache-Control: public, max-age=31536000,
+                         immutable`; a changed file gets a new name, so
+                         browsers never revalidate the old one
+* compression          - HTML, CSS, JS, JSON and SVG responses are sent
+                         brotli or gzip encoded, whichever the client prefers;
+                         fingerprinted assets use the variants the build wrote
+                         next to them (.br/.gz) instead of compressing per request
+* page cache           - `cached_page()` renders a page that depends on
+                         nothing but its template once per template mtime,
+                         keeps its compressed variants, and answers
+                         If-None-Match with 304
+
+Build step (on deploy, and after changing anything in static/):
+
+    python assets.py
+
+Without a build (a fresh checkout) asset URLs are left as they are and
+served by Flask's static route. Brotli is optional (`pip install brotli`);
+without it only gzip is offered.
+"""
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'static')
+DIST = 'dist'  # build output, under STATIC_DIR
+MANIFEST = 'manifest.json'
+SKIP = ('uploads', DIST)  # user content and build output are not assets
+
+IMMUTABLE = 'public, max-age=31536000, immutable'
+PAGE_CACHE_CONTROL = 'public, no-cache'  # store, but revalidate: a 304 costs no render
+COMPRESSIBLE = {'text/html', 'text/css', 'text/plain', 'text/javascript', 'application/javascript',
+                'application/json', 'image/svg+xml'}
+MIN_SIZE = 1024   # bytes; smaller responses aren't worth the CPU or the header
+GZIP_LEVEL = 6    # per-request compression: fast, most of the gain
+BROTLI_QUALITY = 5
+ENCODING_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+
+def encodings():
+    """Encodings this process can produce, most preferred first"""
+    return ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data, encoding, best=False):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11 if best else BROTLI_QUALITY)
+    # mtime=0 keeps the output (and so the ETag of built files) reproducible
+    return gzip.compress(data, compresslevel=9 if best else GZIP_LEVEL, mtime=0)
+
+
+def negotiate(request, available):
+    """The client's preferred encoding among `available`, None for identity"""
+    return request.accept_encodings.best_match(available) if available else None
+
+
+# --- Build step ---
+
+def fingerprint(path):
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            h.update(chunk)
+    return h.hexdigest()[:16]
+
+
+def build(static_dir=STATIC_DIR):
+    """Copy every asset to dist/<name>.<hash><ext>, with .br/.gz variants of text types.
+
+    Copies from earlier builds are kept, so pages still cached by browsers
+    can load the assets they reference. Returns the manifest.
+    """
+    dist_dir = os.path.join(static_dir, DIST)
+    os.makedirs(dist_dir, exist_ok=True)
+    manifest = {}
+    for root, dirs, files in os.walk(static_dir):
+        if root == static_dir:
+            dirs[:] = [d for d in dirs if d not in SKIP]
+        for filename in sorted(files):
+            source = os.path.join(root, filename)
+            name = os.path.relpath(source, static_dir).replace(os.sep, '/')
+            stem, ext = os.path.splitext(name)
+            built = f"{DIST}/{stem}.{fingerprint(source)}{ext}"
+            target = os.path.join(static_dir, built)
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+                if mimetypes.guess_type(filename)[0] in COMPRESSIBLE:
+                    with open(source, 'rb') as f:
+                        data = f.read()
+                    # JPEGs and other binary formats are compressed already; only text gains
+                    for encoding in encodings():
+                        with open(target + ENCODING_SUFFIXES[encoding], 'wb') as f:
+                            f.write(compress(data, encoding, best=True))
+            manifest[name] = built
+    with open(os.path.join(dist_dir, MANIFEST), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return manifest
+
+
+def load_manifest(static_dir=STATIC_DIR):
+    try:
+        with open(os.path.join(static_dir, DIST, MANIFEST), encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+# --- Page cache ---
+
+class _Page:
+    __slots__ = ('key', 'etag', 'variants')
+
+    def __init__(self, key, body):
+        self.key = key
+        self.etag = hashlib.sha256(body).hexdigest()[:16]
+        self.variants = {None: body}
+        for encoding in encodings():
+            self.variants[encoding] = compress(body, encoding, best=True)
+
+
+_pages = {}  # template name -> _Page of its current mtime
+
+
+def cached_page(template_name, flashes=False):
+    """Response for a GET of a page that depends on nothing but its template.
+
+    Pass `flashes=True` for templates that show flashed messages: while the
+    session holds any, the page is rendered as usual so they appear once.
+    """
+    from flask import Response, current_app, render_template, request, session
+
+    if flashes and session.get('_flashes'):
+        return render_template(template_name)
+    template = current_app.jinja_env.get_template(template_name)
+    # The manifest version is part of the key: a build changes the asset URLs in the page
+    key = (os.path.getmtime(template.filename), current_app.extensions['assets'].version)
+    page = _pages.get(template_name)
+    if page is None or page.key != key:
+        # Concurrent requests may both render a changed template; either result is right
+        page = _pages[template_name] = _Page(key, render_template(template_name).encode('utf-8'))
+
+    encoding = negotiate(request, [e for e in page.variants if e])
+    response = Response(page.variants[encoding], mimetype='text/html')
+    if encoding:
+        response.headers['Content-Encoding'] = encoding
+    response.vary.add('Accept-Encoding')
+    # One ETag per representation, as the bytes differ
+    response.set_etag(f"{page.etag}-{encoding}" if encoding else page.etag)
+    response.headers['Cache-Control'] = PAGE_CACHE_CONTROL
+    return response.make_conditional(request)
+
+
+# --- Flask wiring ---
+
+class Assets:
+    def __init__(self, static_dir, immutable_prefixes=()):
+        self.static_dir = static_dir
+        self.immutable_prefixes = tuple(immutable_prefixes)
+        self.manifest = load_manifest(static_dir)
+        self.version = hashlib.sha256(json.dumps(self.manifest, sort_keys=True).encode()).hexdigest()[:16]
+        self._variants = {}
+
+    def is_built(self, filename):
+        # Any build's copy, not just the current one: its name still matches its bytes
+        return filename.startswith(DIST + '/') and filename != f"{DIST}/{MANIFEST}"
+
+    def variants(self, filename):
+        """Precompressed encodings the build wrote for `filename`"""
+        found = self._variants.get(filename)
+        if found is None:
+            path = os.path.join(self.static_dir, filename)
+            found = self._variants[filename] = [
+                e for e in encodings() if os.path.exists(path + ENCODING_SUFFIXES[e])]
+        return found
+
+
+def init_app(app, immutable_prefixes=()):
+    """Fingerprint static URLs, serve built assets as immutable, and compress text responses.
+
+    Files under `immutable_prefixes` (paths below static/, e.g. content-
+    addressed uploads) are served as immutable too.
+    """
+    from flask import request, send_from_directory
+
+    assets = app.extensions['assets'] = Assets(app.static_folder, immutable_prefixes)
+    serve_static = app.view_functions['static']
+
+    @app.url_defaults
+    def _fingerprint(endpoint, values):
+        if endpoint == 'static' and values.get('filename') in assets.manifest:
+            values['filename'] = assets.manifest[values['filename']]
+
+    def static(filename):
+        if assets.is_built(filename):
+            available = assets.variants(filename)
+            encoding = negotiate(request, available)
+            suffix = ENCODING_SUFFIXES[encoding] if encoding else ''
+            response = send_from_directory(app.static_folder, filename + suffix,
+                                           mimetype=mimetypes.guess_type(filename)[0])
+            if encoding:
+                response.headers['Content-Encoding'] = encoding
+            if available:
+                response.vary.add('Accept-Encoding')
+        elif filename.startswith(assets.immutable_prefixes):
+            response = serve_static(filename=filename)
+        else:
+            return serve_static(filename=filename)
+        response.headers['Cache-Control'] = IMMUTABLE
+        return response
+
+    app.view_functions['static'] = static
+
+    @app.after_request
+    def _compress(response):
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or 'Content-Encoding' in response.headers or response.mimetype not in COMPRESSIBLE):
+            return response
+        body = response.get_data()
+        if len(body) < MIN_SIZE:
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = negotiate(request, encodings())
+        if encoding:
+            response.set_data(compress(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+            if response.headers.get('ETag'):
+                etag, weak = response.get_etag()
+                response.set_etag(f"{etag}-{encoding}", weak)
+        return response
+
+
+if __name__ == '__main__':
+    built = build()
+    for name, target in sorted(built.items()):
+        print(f"{name:<32} {target}")
+    print(f"Wrote {os.path.join(STATIC_DIR, DIST, MANIFEST)} ({len(built)} assets).")
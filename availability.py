@@ -0,0 +1,131 @@
+"""Photographer availability shared by app.py and app_aws.py.
+
+A session occupies its photographer from its start time for the duration of
+its session type. `Schedule` keeps, per photographer and day, the occupied
+intervals as sorted parallel lists; because accepted intervals never overlap,
+a conflict check is two bisects (O(log n)) and a month of free slots is one
+check per day and start time.
+
+app.py keeps one Schedule for the life of the process. app_aws.py stores the
+occupied time as one-hour slot items in the Availability table (see
+`blocks`) and builds a Schedule from a single range query when it needs free
+slots.
+"""
+import bisect
+import threading
+from datetime import date, datetime, timedelta
+
+PHOTOGRAPHERS = ('Jin-Soo Park', 'Min-Hee Kim', 'Sora Lee')
+START_TIMES = ('09:00 AM', '12:00 PM', '03:00 PM')
+
+# Minutes a session of each type keeps the photographer busy
+DURATIONS = {
+    'Wedding': 360,
+    'Engagement': 120,
+    'Baby Shower': 180,
+    'Proposal': 60,
+    'Portrait': 60,
+}
+
+# Statuses that hold a photographer's time
+ACTIVE_STATUSES = ('Pending', 'Upcoming', 'Today')
+
+BLOCK_MINUTES = 60   # size of one Availability slot item
+MAX_RANGE_DAYS = 62  # longest /availability window
+
+
+def minutes(time_str):
+    """'03:00 PM' -> 900 (minutes after midnight)"""
+    parsed = datetime.strptime(time_str, '%I:%M %p')
+    return parsed.hour * 60 + parsed.minute
+
+
+def interval(session_type, time_str):
+    """(start, end) in minutes for a session, or None if either value is unknown"""
+    if session_type not in DURATIONS or time_str not in START_TIMES:
+        return None
+    start = minutes(time_str)
+    return start, start + DURATIONS[session_type]
+
+
+def blocks(date_str, start, end):
+    """Sortable slot keys ('YYYY-MM-DD#HH:MM') covering start..end"""
+    first = start - start % BLOCK_MINUTES
+    return [f"{date_str}#{m // 60:02d}:{m % 60:02d}" for m in range(first, end, BLOCK_MINUTES)]
+
+
+def parse_block(slot):
+    """Inverse of one `blocks` key: (date_str, start, end)"""
+    date_str, clock = slot.split('#')
+    hours, mins = clock.split(':')
+    start = int(hours) * 60 + int(mins)
+    return date_str, start, start + BLOCK_MINUTES
+
+
+def days(date_from, date_to):
+    """ISO dates from date_from to date_to inclusive; ValueError if the range is invalid"""
+    first = date.fromisoformat(date_from)
+    last = date.fromisoformat(date_to)
+    if last < first or (last - first).days >= MAX_RANGE_DAYS:
+        raise ValueError(f"date range must be 1-{MAX_RANGE_DAYS} days")
+    return [(first + timedelta(days=n)).isoformat() for n in range((last - first).days + 1)]
+
+
+class Schedule:
+    """Occupied intervals per (photographer, date), kept sorted and non-overlapping"""
+
+    def __init__(self):
+        self._days = {}  # (photographer, date) -> (starts, ends, session ids)
+        self._lock = threading.Lock()
+
+    def _is_free(self, key, start, end):
+        day = self._days.get(key)
+        if day is None:
+            return True
+        starts, ends, _ = day
+        i = bisect.bisect_left(starts, start)
+        if i > 0 and ends[i - 1] > start:
+            return False
+        return i == len(starts) or starts[i] >= end
+
+    def is_free(self, photographer, date_str, start, end):
+        with self._lock:
+            return self._is_free((photographer, date_str), start, end)
+
+    def reserve(self, photographer, date_str, start, end, session_id):
+        """Occupy start..end for a session; returns False if it overlaps another one"""
+        key = (photographer, date_str)
+        with self._lock:
+            if not self._is_free(key, start, end):
+                return False
+            starts, ends, ids = self._days.setdefault(key, ([], [], []))
+            i = bisect.bisect_left(starts, start)
+            starts.insert(i, start)
+            ends.insert(i, end)
+            ids.insert(i, session_id)
+            return True
+
+    def release(self, photographer, date_str, session_id):
+        """Free every interval held by a session on that day"""
+        key = (photographer, date_str)
+        with self._lock:
+            day = self._days.get(key)
+            if day is None:
+                return
+            starts, ends, ids = day
+            for i in reversed(range(len(ids))):
+                if ids[i] == session_id:
+                    del starts[i], ends[i], ids[i]
+            if not ids:
+                del self._days[key]
+
+    def free_slots(self, photographer, dates, duration=min(DURATIONS.values())):
+        """{date: [start times]} where a session of `duration` minutes fits"""
+        with self._lock:
+            free = {}
+            for date_str in dates:
+                free[date_str] = [
+                    t for t in START_TIMES
+                    if self._is_free((photographer, date_str), minutes(t), minutes(t) + duration)
+                ]
+            return free
@@ -0,0 +1,154 @@
+"""Lazily built, fork-safe boto3 clients for app_aws.py.
+
+Building a boto3 client is slow: a fresh session reads and parses the
+service model, endpoint rules and credential chain (~100 ms for DynamoDB),
+and a client made before gunicorn forks would hand every worker a copy of
+the same connection pool. `ClientFactory` splits the two halves:
+
+* `preload()`  - loads the service model, endpoint rules and retry and
+                 default settings into the factory's session; no sockets,
+                 no credentials, so it is safe (and shared copy-on-write)
+                 before the fork
+* `client()`   - builds the client on first use in each process, from that
+                 session, and again after a fork; the client is thread-safe,
+                 so a process's threads share it and its connection pool
+* `client(timeout=s)` - a variant of it for calls that must finish within
+                 `s` seconds: connect and read timeouts of at most `s`
+                 (rounded up to whole seconds) and no retries; one per
+                 distinct value, built on first use like the main client
+
+app_aws.py preloads at import (pre-fork under `gunicorn --preload`, where
+a worker's client then builds in ~20 ms instead of ~95 ms, see
+benchmarks/bench_cold_start.py) and its /ready
+probe builds the client and makes one read, so a load balancer only routes
+to a worker that has a client and a connection to DynamoDB.
+
+Settings (environment, `DYNAMODB_` prefix for app_aws.py's client):
+
+    DYNAMODB_MAX_POOL_CONNECTIONS  connections kept per worker (default 50;
+                                   botocore's 10 throttles the read fan-out)
+    DYNAMODB_CONNECT_TIMEOUT       seconds (default 2)
+    DYNAMODB_READ_TIMEOUT          seconds (default 5)
+    DYNAMODB_RETRY_MODE            adaptive (default), standard or legacy
+    DYNAMODB_MAX_ATTEMPTS          including the first call (default 3)
+    DYNAMODB_TCP_KEEPALIVE         1 (default) or 0
+    DYNAMODB_ENDPOINT_URL          e.g. DynamoDB Local; unset for AWS
+"""
+import logging
+import math
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+from botocore.exceptions import DataNotFoundError
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'MAX_POOL_CONNECTIONS': 50,
+    'CONNECT_TIMEOUT': 2,
+    'READ_TIMEOUT': 5,
+    'RETRY_MODE': 'adaptive',
+    'MAX_ATTEMPTS': 3,
+    'TCP_KEEPALIVE': '1',
+}
+RETRY_MODES = ('adaptive', 'standard', 'legacy')
+# botocore data files every client build reads, besides the service's own
+SHARED_DATA = ('endpoints', 'partitions', '_retry', 'sdk-default-configuration')
+
+
+def config_from_env(environ, prefix):
+    """botocore Config from `<prefix>*` settings, falling back to DEFAULTS"""
+    def setting(name):
+        return environ.get(prefix + name) or DEFAULTS[name]
+
+    retry_mode = setting('RETRY_MODE')
+    if retry_mode not in RETRY_MODES:
+        raise ValueError(f"{prefix}RETRY_MODE must be one of {', '.join(RETRY_MODES)}")
+    return Config(
+        max_pool_connections=int(setting('MAX_POOL_CONNECTIONS')),
+        connect_timeout=float(setting('CONNECT_TIMEOUT')),
+        read_timeout=float(setting('READ_TIMEOUT')),
+        retries={'mode': retry_mode, 'total_max_attempts': int(setting('MAX_ATTEMPTS'))},
+        tcp_keepalive=setting('TCP_KEEPALIVE') not in ('0', 'false', 'no'),
+    )
+
+
+class ClientFactory:
+    """One `service` client per process, built on first use"""
+
+    def __init__(self, service, region_name=None, config=None, endpoint_url=None):
+        self.service = service
+        self.region_name = region_name
+        self.config = config
+        self.endpoint_url = endpoint_url
+        self.build_seconds = None  # how long this process's client took to build
+        self._session = boto3.session.Session(region_name=region_name)
+        self._client = None
+        self._bounded = {}  # whole seconds -> client that gives up within them
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def preload(self):
+        """Load the data files a client build reads now, so building it later only wires it up.
+
+        The session's loader caches them; returns the seconds this took.
+        """
+        started = time.perf_counter()
+        session = self._session._session
+        session.get_service_model(self.service)
+        loader = session.get_component('data_loader')
+        try:
+            loader.load_service_model(self.service, 'endpoint-rule-set-1')
+        except DataNotFoundError:  # pragma: no cover - older botocore resolves endpoints from 'endpoints'
+            pass
+        for name in SHARED_DATA:
+            try:
+                loader.load_data(name)
+            except DataNotFoundError:  # pragma: no cover - not shipped by every botocore version
+                pass
+        return time.perf_counter() - started
+
+    def _build(self, config):
+        return self._session.client(self.service, region_name=self.region_name,
+                                    endpoint_url=self.endpoint_url, config=config)
+
+    def client(self, timeout=None):
+        if self._pid != os.getpid():
+            # Sessions aren't thread-safe and clients must not cross fork(): build once per process
+            with self._lock:
+                if self._pid != os.getpid():
+                    started = time.perf_counter()
+                    self._client = self._build(self.config)
+                    self._bounded = {}
+                    self.build_seconds = time.perf_counter() - started
+                    self._pid = os.getpid()
+                    logger.info("Built %s client for pid %s in %.1f ms",
+                                self.service, self._pid, self.build_seconds * 1000)
+        if timeout is None:
+            return self._client
+        seconds = max(1, math.ceil(timeout))
+        client = self._bounded.get(seconds)
+        if client is None:
+            with self._lock:
+                client = self._bounded.get(seconds)
+                if client is None:
+                    config = self.config or Config()
+                    client = self._bounded[seconds] = self._build(config.merge(Config(
+                        connect_timeout=min(config.connect_timeout, seconds),
+                        read_timeout=min(config.read_timeout, seconds),
+                        retries={'mode': (config.retries or {}).get('mode', 'standard'), 'total_max_attempts': 1},
+                    )))
+        return client
+
+
+def from_env(environ, service, prefix, region=None):
+    """ClientFactory for `service` with the `<prefix>*` settings described above"""
+    return ClientFactory(
+        service,
+        region_name=region,
+        config=config_from_env(environ, prefix),
+        endpoint_url=environ.get(prefix + 'ENDPOINT_URL') or None,
+    )
@@ -0,0 +1 @@
+"""Benchmarks for the booking apps. Run modules with `python -m benchmarks.<name>`."""
@@ -0,0 +1,64 @@
+"""Worker cold start: building app_aws.py's DynamoDB client after a fork.
+
+    python -m benchmarks.bench_cold_start          # 20 forked workers per case
+    python -m benchmarks.bench_cold_start 50
+
+Each case forks workers the way gunicorn does and times, in the child, how
+long its first DynamoDB client takes to build (no network: the client is
+built but never called):
+
+* eager, default session - `boto3.client('dynamodb')` in every worker, as
+                           app_aws.py did before aws_clients.py
+* factory, no preload    - aws_clients.ClientFactory without preload()
+* factory, preloaded     - preload() in the parent, as app_aws.py does
+"""
+import os
+import statistics
+import sys
+import time
+
+import boto3
+
+import aws_clients
+
+REGION = 'us-east-1'
+DEFAULT_WORKERS = 20
+
+
+def in_child(build):
+    """Seconds `build()` takes in a freshly forked process"""
+    read_end, write_end = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(read_end)
+        started = time.perf_counter()
+        build()
+        os.write(write_end, repr(time.perf_counter() - started).encode())
+        os._exit(0)
+    os.close(write_end)
+    with os.fdopen(read_end) as f:
+        seconds = float(f.read())
+    os.waitpid(pid, 0)
+    return seconds
+
+
+def main(workers):
+    # Credentials aren't needed to build a client, only a region
+    os.environ.setdefault('AWS_ACCESS_KEY_ID', 'bench')
+    os.environ.setdefault('AWS_SECRET_ACCESS_KEY', 'bench')
+    preloaded = aws_clients.from_env(os.environ, 'dynamodb', 'DYNAMODB_', region=REGION)
+    preload_seconds = preloaded.preload()
+    cases = {
+        'eager, default session': lambda: boto3.session.Session().client('dynamodb', region_name=REGION),
+        'factory, no preload': lambda: aws_clients.from_env(
+            os.environ, 'dynamodb', 'DYNAMODB_', region=REGION).client(),
+        'factory, preloaded': preloaded.client,
+    }
+    print(f"preload() in the parent: {preload_seconds * 1000:.1f} ms (once, before the fork)")
+    for name, build in cases.items():
+        times = sorted(in_child(build) * 1000 for _ in range(workers))
+        print(f"{name:<24} p50 {statistics.median(times):6.1f} ms   max {times[-1]:6.1f} ms")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_WORKERS)
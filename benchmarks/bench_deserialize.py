@@ -0,0 +1,88 @@
+"""Item decoding cost: resource-layer Decimal + convert_decimal vs dynamo.deserialize.
+
+    python -m benchmarks.bench_deserialize          # 1k, 5k and 20k items
+    python -m benchmarks.bench_deserialize 50000
+
+The "old" path is what app_aws.py used to do for every admin/dashboard row:
+boto3's TypeDeserializer (Decimal for every number, as the resource layer
+returns it) followed by a recursive convert_decimal walk.
+"""
+import sys
+import time
+from decimal import Decimal
+
+from boto3.dynamodb.types import TypeDeserializer
+
+import dynamo
+
+DEFAULT_SIZES = (1_000, 5_000, 20_000)
+
+
+def convert_decimal(obj):
+    """The helper app_aws.py used before dynamo.py existed"""
+    if isinstance(obj, Decimal):
+        if obj % 1 == 0:
+            return int(obj)
+        else:
+            return float(obj)
+    elif isinstance(obj, dict):
+        return {k: convert_decimal(v) for k, v in obj.items()}
+    elif isinstance(obj, list):
+        return [convert_decimal(item) for item in obj]
+    return obj
+
+
+def wire_item(i):
+    """A Bookings-shaped row in DynamoDB wire format"""
+    return {
+        'id': {'S': f'{i:08x}'},
+        'user': {'S': f'user{i % 1000}@test.com'},
+        'user_name': {'S': 'Jane Doe'},
+        'service': {'S': 'Retouch: Background Removal'},
+        'filename': {'S': f'IMG_{i}.jpg'},
+        'file_id': {'S': f'{i * 7:08x}'},
+        'status': {'S': 'Pending'},
+        'size': {'N': str(1024 * (i % 5000))},
+        'rating': {'N': str(i % 5 + 1)},
+        'price': {'N': '49.99'},
+        'created_at': {'S': '2026-10-18T09:00:00'},
+        'history': {'L': [
+            {'M': {'status': {'S': 'Pending'}, 'at': {'N': str(1760000000 + i)}}},
+        ]},
+    }
+
+
+def old_path(items):
+    deserializer = TypeDeserializer()
+    return [
+        convert_decimal({k: deserializer.deserialize(v) for k, v in item.items()})
+        for item in items
+    ]
+
+
+def new_path(items):
+    return [dynamo.deserialize(item) for item in items]
+
+
+def best_of(fn, items, rounds=5):
+    best = float('inf')
+    for _ in range(rounds):
+        start = time.perf_counter()
+        fn(items)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(sizes):
+    sample = [wire_item(i) for i in range(100)]
+    assert old_path(sample) == new_path(sample), "paths disagree"
+
+    print(f"{'items':>8} {'old (ms)':>10} {'new (ms)':>10} {'speedup':>9}")
+    for n in sizes:
+        items = [wire_item(i) for i in range(n)]
+        t_old, t_new = best_of(old_path, items), best_of(new_path, items)
+        print(f"{n:>8,} {t_old * 1e3:>10.2f} {t_new * 1e3:>10.2f} {t_old / t_new:>8.1f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,110 @@
+"""Per-route cost of app.py's data access: old list scans vs memstore indexes.
+
+    python -m benchmarks.bench_store            # 10k, 100k and 1M records
+    python -m benchmarks.bench_store 50000      # custom sizes
+
+For each size the tables are filled with that many bookings, sessions and
+feedback rows spread over USERS customers, then each route's lookup is timed
+with the old list-comprehension code and with the indexed Store.
+"""
+import sys
+import timeit
+import uuid
+
+from memstore import Store, Booking, SessionBooking, Feedback
+
+USERS = 1000
+DEFAULT_SIZES = (10_000, 100_000, 1_000_000)
+
+
+def build(n):
+    """Same data twice: as the old plain lists and as an indexed Store"""
+    lists = {'bookings': [], 'sessions': [], 'feedbacks': []}
+    store = Store()
+    for i in range(n):
+        user = f"user{i % USERS}@test.com"
+        booking = {'id': i + 1, 'user': user, 'service': 'Retouch: Retouching',
+                   'filename': f'{i}.jpg', 'sha256': None, 'status': 'Pending'}
+        sess = {'id': i + 1000, 'user': user, 'user_name': 'Client', 'service': 'Wedding',
+                'date': '2026-10-18', 'time': '09:00 AM', 'status': 'Pending'}
+        fb = {'id': uuid.uuid4().hex[:8], 'user_name': 'Client', 'user_email': user,
+              'service': 'Retouching', 'rating': 5, 'comment': 'Great'}
+        lists['bookings'].append(booking)
+        lists['sessions'].append(sess)
+        lists['feedbacks'].append(fb)
+        store.bookings.add(Booking(**booking))
+        store.sessions.add(SessionBooking(**sess))
+        store.feedbacks.add(Feedback(**fb))
+    return lists, store
+
+
+def list_routes(lists, n):
+    email = f"user{n // 2 % USERS}@test.com"
+    target = n // 2
+
+    def dashboard():
+        my_data = [b for b in lists['bookings'] if b['user'] == email] + \
+                  [s for s in lists['sessions'] if s['user'] == email]
+        return my_data, [f for f in lists['feedbacks'] if f['user_email'] == email]
+
+    def approve():
+        for b in lists['bookings']:
+            if b['id'] == target:
+                b['status'] = 'Confirmed'
+
+    def complete_session():
+        for s in lists['sessions']:
+            if s['id'] == target + 1000:
+                s['status'] = 'Completed'
+
+    def delete_feedback():
+        # the id never matches, so every run rebuilds the full list like the old route
+        return [f for f in lists['feedbacks'] if f['id'] != 'missing']
+
+    return {'dashboard': dashboard, 'approve': approve,
+            'complete_session': complete_session, 'delete_feedback': delete_feedback}
+
+
+def store_routes(store, n):
+    email = f"user{n // 2 % USERS}@test.com"
+    target = n // 2
+
+    def dashboard():
+        my_data = store.bookings.for_user(email) + store.sessions.for_user(email)
+        return my_data, store.feedbacks.for_user(email)
+
+    def approve():
+        store.bookings.set_status(target, 'Confirmed')
+        store.bookings.set_status(target, 'Pending')
+
+    def complete_session():
+        store.sessions.set_status(target + 1000, 'Completed')
+        store.sessions.set_status(target + 1000, 'Pending')
+
+    def delete_feedback():
+        return store.feedbacks.delete('missing')
+
+    return {'dashboard': dashboard, 'approve': approve,
+            'complete_session': complete_session, 'delete_feedback': delete_feedback}
+
+
+def per_call(fn, budget=0.5):
+    """Seconds per call, repeating until roughly `budget` seconds have elapsed"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    repeat = max(1, int(budget / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat=min(repeat, 5), number=number)) / number
+
+
+def main(sizes):
+    print(f"{'records':>10} {'route':<18} {'lists (ms)':>12} {'store (ms)':>12} {'speedup':>9}")
+    for n in sizes:
+        lists, store = build(n)
+        old, new = list_routes(lists, n), store_routes(store, n)
+        for route in old:
+            t_old, t_new = per_call(old[route]), per_call(new[route])
+            print(f"{n:>10,} {route:<18} {t_old * 1e3:>12.3f} {t_new * 1e3:>12.4f} {t_old / t_new:>8.0f}x")
+
+
+if __name__ == '__main__':
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
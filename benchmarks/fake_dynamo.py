@@ -0,0 +1,787 @@
+"""In-process DynamoDB stand-in for the load tests and tests/.
+
+`FakeDynamoDB` answers the low-level client calls the apps make (items,
+queries and scans on tables and GSIs, condition/update/projection
+expressions, transactions with ClientRequestToken, batch writes) from
+memory, under one lock. Tables are created through create_tables.bootstrap,
+so the schema is the production one. It is not a full emulator: only the
+expression syntax boto3's ConditionExpressionBuilder and this repo emit is
+understood, and there are no capacity limits or 1MB pages.
+
+Transactions follow DynamoDB's rules: at most 100 operations, one per item,
+and a transaction that touches an item another one holds between its
+prepare and commit (`transaction_seconds`, 0 by default) is cancelled with
+TransactionConflict. Single-item writes don't conflict with them here.
+
+`LatencyClient` wraps any client so every call waits a configurable
+round-trip time and is counted against the route that made it. The route
+is a context variable, which app_aws.fan_out carries onto its read threads.
+"""
+import contextlib
+import contextvars
+import copy
+import json
+import random
+import re
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+from decimal import Decimal
+
+from botocore.exceptions import ClientError
+
+current_route = contextvars.ContextVar('current_route', default='(setup)')
+
+TOKEN_TTL = 600  # seconds a ClientRequestToken is remembered, as in DynamoDB
+MAX_TRANSACTION_ITEMS = 100
+
+
+def _error(operation, code, message, **extra):
+    return ClientError({'Error': {'Code': code, 'Message': message}, **extra}, operation)
+
+
+# --- Values ---
+
+def _comparable(av):
+    """Wire value -> (type, python value) that compares like DynamoDB does"""
+    (kind, raw), = av.items()
+    if kind == 'N':
+        return 'N', Decimal(raw)
+    if kind in ('SS', 'BS'):
+        return kind, frozenset(raw)
+    if kind == 'NS':
+        return kind, frozenset(Decimal(v) for v in raw)
+    if kind in ('M', 'L'):
+        return kind, json.dumps(raw, sort_keys=True, default=str)
+    return kind, raw
+
+
+def _key_part(av):
+    kind, value = _comparable(av)
+    return kind, value.normalize() if kind == 'N' else value
+
+
+# --- Expressions ---
+
+_TOKEN = re.compile(r"\s*(<>|<=|>=|[()=<>,.\[\]+-]|[#:]?[A-Za-z0-9_]+)")
+_KEYWORDS = {'AND', 'OR', 'NOT', 'BETWEEN', 'IN', 'SET', 'REMOVE', 'ADD', 'DELETE'}
+
+
+class _Parser:
+    def __init__(self, text, names):
+        self.tokens = []
+        pos = 0
+        text = text.strip()
+        while pos < len(text):
+            match = _TOKEN.match(text, pos)
+            if not match:
+                raise ValueError(f"Cannot parse expression near {text[pos:]!r}")
+            self.tokens.append(match.group(1))
+            pos = match.end()
+        self.pos = 0
+        self.names = names
+
+    def peek(self, upper=True):
+        if self.pos >= len(self.tokens):
+            return None
+        token = self.tokens[self.pos]
+        return token.upper() if upper and token.upper() in _KEYWORDS else token
+
+    def take(self, expected=None):
+        token = self.peek()
+        if expected is not None and token != expected:
+            raise ValueError(f"Expected {expected!r}, got {token!r}")
+        self.pos += 1
+        return token
+
+    def done(self):
+        return self.pos >= len(self.tokens)
+
+    # Operands
+
+    def path(self):
+        parts = [self._name(self.take())]
+        while self.peek() in ('.', '['):
+            if self.take() == '.':
+                parts.append(self._name(self.take()))
+            else:
+                parts.append(int(self.take()))
+                self.take(']')
+        return parts
+
+    def _name(self, token):
+        return self.names[token] if token.startswith('#') else token
+
+    def operand(self):
+        token = self.peek()
+        if token.startswith(':'):
+            self.take()
+            return ('value', token)
+        if token in ('size', 'if_not_exists', 'list_append') and self.tokens[self.pos + 1:self.pos + 2] == ['(']:
+            self.take()
+            self.take('(')
+            args = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                args.append(self.operand())
+            self.take(')')
+            return ('call', token, args)
+        return ('path', self.path())
+
+    # Conditions
+
+    def condition(self):
+        node = self._and()
+        while self.peek() == 'OR':
+            self.take()
+            node = ('or', node, self._and())
+        return node
+
+    def _and(self):
+        node = self._not()
+        while self.peek() == 'AND':
+            self.take()
+            node = ('and', node, self._not())
+        return node
+
+    def _not(self):
+        if self.peek() == 'NOT':
+            self.take()
+            return ('not', self._not())
+        return self._primary()
+
+    def _primary(self):
+        token = self.peek()
+        if token == '(':
+            self.take()
+            node = self.condition()
+            self.take(')')
+            return node
+        if token in ('attribute_exists', 'attribute_not_exists', 'attribute_type', 'begins_with', 'contains'):
+            self.take()
+            self.take('(')
+            args = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                args.append(self.operand())
+            self.take(')')
+            return ('func', token, args)
+        left = self.operand()
+        op = self.take()
+        if op == 'BETWEEN':
+            low = self.operand()
+            self.take('AND')
+            return ('between', left, low, self.operand())
+        if op == 'IN':
+            self.take('(')
+            options = [self.operand()]
+            while self.peek() == ',':
+                self.take()
+                options.append(self.operand())
+            self.take(')')
+            return ('in', left, options)
+        if op not in ('=', '<>', '<', '<=', '>', '>='):
+            raise ValueError(f"Unsupported operator {op!r}")
+        return ('cmp', op, left, self.operand())
+
+    # Updates
+
+    def update(self):
+        actions = []
+        while not self.done():
+            clause = self.take()
+            while True:
+                path = self.path()
+                if clause == 'SET':
+                    self.take('=')
+                    value = self.operand()
+                    if self.peek() in ('+', '-'):
+                        value = ('arith', self.take(), value, self.operand())
+                    actions.append(('SET', path, value))
+                elif clause == 'REMOVE':
+                    actions.append(('REMOVE', path, None))
+                elif clause in ('ADD', 'DELETE'):
+                    actions.append((clause, path, self.operand()))
+                else:
+                    raise ValueError(f"Unknown update clause {clause!r}")
+                if self.peek() != ',':
+                    break
+                self.take()
+        return actions
+
+
+def _get(item, path):
+    value = {'M': item}
+    for part in path:
+        container = value.get('M') if isinstance(part, str) else value.get('L')
+        if container is None:
+            return None
+        try:
+            value = container[part]
+        except (KeyError, IndexError):
+            return None
+    return value
+
+
+def _set(item, path, av):
+    container = item
+    for part in path[:-1]:
+        child = container[part] if isinstance(container, list) else container.get(part)
+        if child is None:
+            raise ValueError("The document path provided in the update expression is invalid")
+        container = child.get('M', child.get('L'))
+    if isinstance(container, list) and path[-1] >= len(container):
+        container.append(av)
+    else:
+        container[path[-1]] = av
+
+
+def _remove(item, path):
+    parent = _get(item, path[:-1]) if len(path) > 1 else {'M': item}
+    if parent is None:
+        return
+    container = parent.get('M', parent.get('L'))
+    if isinstance(container, dict):
+        container.pop(path[-1], None)
+    elif container is not None and path[-1] < len(container):
+        del container[path[-1]]
+
+
+class _Evaluator:
+    def __init__(self, item, values):
+        self.item = item or {}
+        self.values = values
+
+    def operand(self, node):
+        kind = node[0]
+        if kind == 'value':
+            return self.values[node[1]]
+        if kind == 'path':
+            return _get(self.item, node[1])
+        name, args = node[1], node[2]
+        if name == 'size':
+            av = self.operand(args[0])
+            if av is None:
+                return None
+            (k, raw), = av.items()
+            return {'N': str(len(raw.encode('utf-8') if k == 'S' else raw))}
+        if name == 'if_not_exists':
+            existing = self.operand(args[0])
+            return existing if existing is not None else self.operand(args[1])
+        if name == 'list_append':
+            return {'L': self.operand(args[0])['L'] + self.operand(args[1])['L']}
+        raise ValueError(f"Unknown function {name}")
+
+    def test(self, node):
+        kind = node[0]
+        if kind == 'and':
+            return self.test(node[1]) and self.test(node[2])
+        if kind == 'or':
+            return self.test(node[1]) or self.test(node[2])
+        if kind == 'not':
+            return not self.test(node[1])
+        if kind == 'func':
+            name, args = node[1], node[2]
+            target = self.operand(args[0])
+            if name == 'attribute_exists':
+                return target is not None
+            if name == 'attribute_not_exists':
+                return target is None
+            if target is None:
+                return False
+            other = self.operand(args[1])
+            if name == 'attribute_type':
+                return next(iter(target)) == other['S']
+            if name == 'begins_with':
+                (k, raw), = target.items()
+                prefix = next(iter(other.values()))
+                return k in ('S', 'B') and raw.startswith(prefix)
+            (k, raw), = target.items()
+            if k == 'S':
+                return next(iter(other.values())) in raw
+            if k in ('SS', 'NS', 'BS'):
+                return next(iter(other.values())) in raw
+            if k == 'L':
+                return other in raw
+            return False
+        if kind == 'between':
+            value, low, high = (self.operand(n) for n in node[1:])
+            if value is None or low is None or high is None:
+                return False
+            (vk, v), (lk, lo), (hk, hi) = _comparable(value), _comparable(low), _comparable(high)
+            return vk == lk == hk and lo <= v <= hi
+        if kind == 'in':
+            value = self.operand(node[1])
+            return value is not None and any(
+                _comparable(value) == _comparable(option) for option in map(self.operand, node[2])
+                if option is not None)
+        op, left, right = node[1], self.operand(node[2]), self.operand(node[3])
+        if left is None or right is None:
+            return op == '<>' and (left is None) != (right is None)
+        (lk, lv), (rk, rv) = _comparable(left), _comparable(right)
+        if op == '=':
+            return lk == rk and lv == rv
+        if op == '<>':
+            return lk != rk or lv != rv
+        if lk != rk:
+            return False
+        return {'<': lv < rv, '<=': lv <= rv, '>': lv > rv, '>=': lv >= rv}[op]
+
+    def apply(self, actions):
+        for action, path, node in actions:
+            if action == 'REMOVE':
+                _remove(self.item, path)
+            elif action == 'SET':
+                if node[0] == 'arith':
+                    left, right = self.operand(node[2]), self.operand(node[3])
+                    total = Decimal(left['N']) + (Decimal(right['N']) * (1 if node[1] == '+' else -1))
+                    value = {'N': str(total)}
+                else:
+                    value = self.operand(node)
+                _set(self.item, path, copy.deepcopy(value))
+            elif action == 'ADD':
+                current, delta = _get(self.item, path), self.operand(node)
+                if 'N' in delta:
+                    start = Decimal(current['N']) if current else Decimal(0)
+                    _set(self.item, path, {'N': str(start + Decimal(delta['N']))})
+                else:
+                    (kind, members), = delta.items()
+                    merged = list(dict.fromkeys((current or {kind: []})[kind] + members))
+                    _set(self.item, path, {kind: merged})
+            else:  # DELETE from a set
+                current, delta = _get(self.item, path), self.operand(node)
+                if current:
+                    (kind, members), = delta.items()
+                    left = [m for m in current[kind] if m not in members]
+                    if left:
+                        _set(self.item, path, {kind: left})
+                    else:
+                        _remove(self.item, path)
+
+
+def _condition(text, names, values, item):
+    if not text:
+        return True
+    return _Evaluator(item, values).test(_Parser(text, names).condition())
+
+
+def _project(item, text, names):
+    if not text:
+        return copy.deepcopy(item)
+    out = {}
+    for part in text.split(','):
+        name = part.strip()
+        name = names.get(name, name)
+        if name in item:
+            out[name] = copy.deepcopy(item[name])
+    return out
+
+
+# --- Tables ---
+
+class _Index:
+    def __init__(self, name, key_schema, projection='ALL'):
+        self.name = name
+        self.hash_key = next(k['AttributeName'] for k in key_schema if k['KeyType'] == 'HASH')
+        self.range_key = next((k['AttributeName'] for k in key_schema if k['KeyType'] == 'RANGE'), None)
+        self.projection = projection
+        self.buckets = {}  # hash key part -> set of table keys
+
+    def add(self, key, item):
+        if self.hash_key in item and (self.range_key is None or self.range_key in item):
+            self.buckets.setdefault(_key_part(item[self.hash_key]), set()).add(key)
+
+    def discard(self, key, item):
+        if self.hash_key in item:
+            bucket = self.buckets.get(_key_part(item[self.hash_key]))
+            if bucket is not None:
+                bucket.discard(key)
+
+
+class _Table:
+    def __init__(self, name, key_schema):
+        self.name = name
+        self.primary = _Index(None, key_schema)
+        self.items = {}  # key tuple -> wire item, in insertion order
+        self.indexes = {}
+        self.ttl_attribute = None
+
+    def key_of(self, item, operation):
+        try:
+            key = (_key_part(item[self.primary.hash_key]),)
+            if self.primary.range_key:
+                key += (_key_part(item[self.primary.range_key]),)
+        except KeyError:
+            raise _error(operation, 'ValidationException',
+                         "The provided key element does not match the schema") from None
+        return key
+
+    def key_attributes(self, item, index=None):
+        names = [self.primary.hash_key, self.primary.range_key]
+        if index is not None:
+            names += [index.hash_key, index.range_key]
+        return {n: copy.deepcopy(item[n]) for n in names if n and n in item}
+
+    def store(self, item, operation):
+        key = self.key_of(item, operation)
+        self.remove(key)
+        self.items[key] = item
+        for index in self.indexes.values():
+            index.add(key, item)
+        if self.primary.range_key:
+            self.primary.add(key, item)
+
+    def remove(self, key):
+        old = self.items.pop(key, None)
+        if old is not None:
+            for index in self.indexes.values():
+                index.discard(key, old)
+            self.primary.discard(key, old)
+        return old
+
+
+class FakeDynamoDB:
+    """Thread-safe in-memory stand-in for boto3.client('dynamodb')"""
+
+    def __init__(self, transaction_seconds=0.0):
+        self.transaction_seconds = transaction_seconds
+        self._tables = {}
+        self._tokens = {}  # ClientRequestToken -> (request fingerprint, expires_at)
+        self._in_flight = set()  # (table, key) of the items transactions hold between prepare and commit
+        self._lock = threading.RLock()
+
+    def _table(self, name, operation):
+        table = self._tables.get(name)
+        if table is None:
+            raise _error(operation, 'ResourceNotFoundException', f"Requested resource not found: {name}")
+        return table
+
+    # Schema
+
+    def create_table(self, TableName, KeySchema, AttributeDefinitions, GlobalSecondaryIndexes=(), **_):
+        with self._lock:
+            if TableName in self._tables:
+                raise _error('CreateTable', 'ResourceInUseException', f"Table already exists: {TableName}")
+            table = self._tables[TableName] = _Table(TableName, KeySchema)
+            for gsi in GlobalSecondaryIndexes:
+                self._add_index(table, gsi)
+            return {'TableDescription': self._describe(table)}
+
+    def _add_index(self, table, gsi):
+        index = _Index(gsi['IndexName'], gsi['KeySchema'], gsi['Projection']['ProjectionType'])
+        for key, item in table.items.items():
+            index.add(key, item)
+        table.indexes[index.name] = index
+
+    def _describe(self, table):
+        return {
+            'TableName': table.name,
+            'TableStatus': 'ACTIVE',
+            'ItemCount': len(table.items),
+            'GlobalSecondaryIndexes': [{'IndexName': name, 'IndexStatus': 'ACTIVE'} for name in table.indexes],
+        }
+
+    def describe_table(self, TableName):
+        with self._lock:
+            return {'Table': self._describe(self._table(TableName, 'DescribeTable'))}
+
+    def update_table(self, TableName, GlobalSecondaryIndexUpdates=(), **_):
+        with self._lock:
+            table = self._table(TableName, 'UpdateTable')
+            for update in GlobalSecondaryIndexUpdates:
+                if 'Create' in update:
+                    self._add_index(table, update['Create'])
+            return {'TableDescription': self._describe(table)}
+
+    def describe_time_to_live(self, TableName):
+        with self._lock:
+            table = self._table(TableName, 'DescribeTimeToLive')
+            if table.ttl_attribute is None:
+                return {'TimeToLiveDescription': {'TimeToLiveStatus': 'DISABLED'}}
+            return {'TimeToLiveDescription': {'TimeToLiveStatus': 'ENABLED', 'AttributeName': table.ttl_attribute}}
+
+    def update_time_to_live(self, TableName, TimeToLiveSpecification):
+        # Recorded only; expired items are never removed (nor are they by DynamoDB, promptly)
+        with self._lock:
+            table = self._table(TableName, 'UpdateTimeToLive')
+            spec = TimeToLiveSpecification
+            table.ttl_attribute = spec['AttributeName'] if spec['Enabled'] else None
+            return {'TimeToLiveSpecification': spec}
+
+    # Items
+
+    def get_item(self, TableName, Key, ProjectionExpression=None, ExpressionAttributeNames=None, **_):
+        with self._lock:
+            table = self._table(TableName, 'GetItem')
+            item = table.items.get(table.key_of(Key, 'GetItem'))
+            if item is None:
+                return {}
+            return {'Item': _project(item, ProjectionExpression, ExpressionAttributeNames or {})}
+
+    def _check(self, operation, table, key, kwargs):
+        current = table.items.get(key)
+        if not _condition(kwargs.get('ConditionExpression'), kwargs.get('ExpressionAttributeNames', {}),
+                          kwargs.get('ExpressionAttributeValues', {}), current):
+            raise _error(operation, 'ConditionalCheckFailedException', "The conditional request failed")
+        return current
+
+    def _returned(self, old, new, kwargs):
+        wanted = kwargs.get('ReturnValues', 'NONE')
+        if wanted in ('ALL_OLD', 'UPDATED_OLD') and old is not None:
+            return {'Attributes': copy.deepcopy(old)}
+        if wanted in ('ALL_NEW', 'UPDATED_NEW') and new is not None:
+            return {'Attributes': copy.deepcopy(new)}
+        return {}
+
+    def put_item(self, TableName, Item, **kwargs):
+        with self._lock:
+            table = self._table(TableName, 'PutItem')
+            old = self._check('PutItem', table, table.key_of(Item, 'PutItem'), kwargs)
+            table.store(copy.deepcopy(Item), 'PutItem')
+            return self._returned(old, None, kwargs)
+
+    def _updated(self, table, Key, kwargs):
+        current = table.items.get(table.key_of(Key, 'UpdateItem'))
+        item = copy.deepcopy(current) if current is not None else copy.deepcopy(Key)
+        actions = _Parser(kwargs['UpdateExpression'], kwargs.get('ExpressionAttributeNames', {})).update()
+        _Evaluator(item, kwargs.get('ExpressionAttributeValues', {})).apply(actions)
+        return item
+
+    def update_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            table = self._table(TableName, 'UpdateItem')
+            old = self._check('UpdateItem', table, table.key_of(Key, 'UpdateItem'), kwargs)
+            new = self._updated(table, Key, kwargs)
+            table.store(new, 'UpdateItem')
+            return self._returned(old, new, kwargs)
+
+    def delete_item(self, TableName, Key, **kwargs):
+        with self._lock:
+            table = self._table(TableName, 'DeleteItem')
+            key = table.key_of(Key, 'DeleteItem')
+            self._check('DeleteItem', table, key, kwargs)
+            return self._returned(table.remove(key), None, kwargs)
+
+    # Reads
+
+    def _page(self, operation, table, index, keys, kwargs, after=None):
+        names = kwargs.get('ExpressionAttributeNames', {})
+        values = kwargs.get('ExpressionAttributeValues', {})
+        start = kwargs.get('ExclusiveStartKey')
+        if start is not None:
+            start_key = table.key_of(start, operation)
+            if start_key in keys:
+                keys = keys[keys.index(start_key) + 1:]
+            elif after is not None:
+                # The start item has left the results since: carry on from its position, like DynamoDB
+                keys = [k for k in keys if after(k, start, start_key)]
+            else:
+                keys = []
+        limit = kwargs.get('Limit')
+        page, more = (keys[:limit], len(keys) > limit) if limit else (keys, False)
+
+        items = []
+        for key in page:
+            item = table.items[key]
+            if _condition(kwargs.get('FilterExpression'), names, values, item):
+                if index is not None and index.projection == 'KEYS_ONLY':
+                    items.append(table.key_attributes(item, index))
+                else:
+                    items.append(_project(item, kwargs.get('ProjectionExpression'), names))
+        resp = {'Count': len(items), 'ScannedCount': len(page)}
+        if kwargs.get('Select') != 'COUNT':
+            resp['Items'] = items
+        if more and page:
+            resp['LastEvaluatedKey'] = table.key_attributes(table.items[page[-1]], index)
+        return resp
+
+    def query(self, TableName, KeyConditionExpression, IndexName=None, ScanIndexForward=True, **kwargs):
+        with self._lock:
+            table = self._table(TableName, 'Query')
+            index = table.indexes[IndexName] if IndexName else table.primary
+            names = kwargs.get('ExpressionAttributeNames', {})
+            values = kwargs.get('ExpressionAttributeValues', {})
+            condition = _Parser(KeyConditionExpression, names).condition()
+            hash_value = _hash_value(condition, index.hash_key, values)
+            if hash_value is None:
+                raise _error('Query', 'ValidationException',
+                             f"Query condition missed key schema element: {index.hash_key}")
+            if index is table.primary and not table.primary.range_key:
+                key = (_key_part(hash_value),)
+                candidates = [key] if key in table.items else []
+            else:
+                candidates = list(index.buckets.get(_key_part(hash_value), ()))
+            keys = [k for k in candidates if _Evaluator(table.items[k], values).test(condition)]
+            after = None
+            if index.range_key:
+                keys.sort(key=lambda k: (_comparable(table.items[k][index.range_key]), k),
+                          reverse=not ScanIndexForward)
+                after = _resume_after(table, index.range_key, ScanIndexForward)
+            return self._page('Query', table, None if index is table.primary else index, keys, kwargs, after)
+
+    def scan(self, TableName, Segment=None, TotalSegments=None, IndexName=None, **kwargs):
+        with self._lock:
+            table = self._table(TableName, 'Scan')
+            index = table.indexes[IndexName] if IndexName else None
+            if index is not None:
+                keys = [k for bucket in index.buckets.values() for k in bucket]
+            else:
+                keys = list(table.items)
+            if TotalSegments:
+                keys = [k for k in keys if zlib.crc32(repr(k).encode()) % TotalSegments == Segment]
+            return self._page('Scan', table, index, keys, kwargs)
+
+    # Batches and transactions
+
+    def batch_write_item(self, RequestItems, **_):
+        with self._lock:
+            for table_name, requests in RequestItems.items():
+                table = self._table(table_name, 'BatchWriteItem')
+                for request in requests:
+                    if 'PutRequest' in request:
+                        table.store(copy.deepcopy(request['PutRequest']['Item']), 'BatchWriteItem')
+                    else:
+                        table.remove(table.key_of(request['DeleteRequest']['Key'], 'BatchWriteItem'))
+            return {'UnprocessedItems': {}}
+
+    def batch_get_item(self, RequestItems, **_):
+        with self._lock:
+            responses = {}
+            for table_name, request in RequestItems.items():
+                table = self._table(table_name, 'BatchGetItem')
+                names = request.get('ExpressionAttributeNames', {})
+                found = (table.items.get(table.key_of(key, 'BatchGetItem')) for key in request['Keys'])
+                responses[table_name] = [_project(item, request.get('ProjectionExpression'), names)
+                                         for item in found if item is not None]
+            return {'Responses': responses, 'UnprocessedKeys': {}}
+
+    def transact_write_items(self, TransactItems, ClientRequestToken=None, **_):
+        with self._lock:
+            now = time.monotonic()
+            fingerprint = json.dumps(TransactItems, sort_keys=True, default=repr)
+            if ClientRequestToken:
+                seen = self._tokens.get(ClientRequestToken)
+                if seen and seen[1] > now:
+                    if seen[0] != fingerprint:
+                        raise _error('TransactWriteItems', 'IdempotentParameterMismatchException',
+                                     "The request uses the same client token as a previous, but non-identical request.")
+                    return {}
+            if not 1 <= len(TransactItems) <= MAX_TRANSACTION_ITEMS:
+                raise _error('TransactWriteItems', 'ValidationException',
+                             "1 validation error detected: Value at 'transactItems' failed to satisfy constraint: "
+                             f"Member must have length less than or equal to {MAX_TRANSACTION_ITEMS}")
+
+            writes = []
+            for operation in TransactItems:
+                (action, kwargs), = operation.items()
+                table = self._table(kwargs['TableName'], 'TransactWriteItems')
+                key = table.key_of(kwargs['Item'] if action == 'Put' else kwargs['Key'], 'TransactWriteItems')
+                writes.append((action, table, key, kwargs))
+            held = [(table.name, key) for _, table, key, _ in writes]
+            if len(set(held)) < len(held):
+                raise _error('TransactWriteItems', 'ValidationException',
+                             "Transaction request cannot include multiple operations on one item")
+            if any(item in self._in_flight for item in held):
+                # Another transaction is between its prepare and commit on one of these items
+                reasons = [{'Code': 'TransactionConflict', 'Message': "Transaction is ongoing for the item"}
+                           if item in self._in_flight else {'Code': 'None'} for item in held]
+                raise _cancelled(reasons)
+            self._in_flight.update(held)
+
+        try:
+            if self.transaction_seconds:
+                time.sleep(self.transaction_seconds)
+            with self._lock:
+                reasons = []
+                for _, table, key, kwargs in writes:
+                    try:
+                        self._check('TransactWriteItems', table, key, kwargs)
+                        reasons.append({'Code': 'None'})
+                    except ClientError:
+                        reasons.append({'Code': 'ConditionalCheckFailed', 'Message': "The conditional request failed"})
+                if any(r['Code'] != 'None' for r in reasons):
+                    raise _cancelled(reasons)
+
+                for action, table, key, kwargs in writes:
+                    if action == 'Put':
+                        table.store(copy.deepcopy(kwargs['Item']), 'TransactWriteItems')
+                    elif action == 'Update':
+                        table.store(self._updated(table, kwargs['Key'], kwargs), 'TransactWriteItems')
+                    elif action == 'Delete':
+                        table.remove(key)
+                if ClientRequestToken:
+                    self._tokens[ClientRequestToken] = (fingerprint, now + TOKEN_TTL)
+                return {}
+        finally:
+            with self._lock:
+                self._in_flight.difference_update(held)
+
+
+def _cancelled(reasons):
+    codes = ', '.join(r['Code'] for r in reasons)
+    return _error('TransactWriteItems', 'TransactionCanceledException',
+                  f"Transaction cancelled, please refer cancellation reasons for specific reasons [{codes}]",
+                  CancellationReasons=reasons)
+
+
+def _resume_after(table, range_key, forward):
+    """Whether key `k` sorts after a query's ExclusiveStartKey, in the query's direction"""
+    def after(k, start, start_key):
+        position = (_comparable(table.items[k][range_key]), k)
+        mark = (_comparable(start[range_key]), start_key)
+        return position > mark if forward else position < mark
+    return after
+
+
+def _hash_value(condition, hash_key, values):
+    """The value a key condition pins the partition key to, or None"""
+    if condition[0] == 'and':
+        return _hash_value(condition[1], hash_key, values) or _hash_value(condition[2], hash_key, values)
+    if condition[0] == 'cmp' and condition[1] == '=' and condition[2] == ('path', [hash_key]):
+        return values[condition[3][1]]
+    return None
+
+
+def create_fake(transaction_seconds=0.0):
+    """A FakeDynamoDB holding every table from create_tables.py"""
+    import create_tables
+    client = FakeDynamoDB(transaction_seconds)
+    # bootstrap() reports progress on stdout, which carries the JSON results
+    with contextlib.redirect_stdout(sys.stderr):
+        create_tables.bootstrap(client)
+    return client
+
+
+class LatencyClient:
+    """Proxy for a DynamoDB client: sleep latency +/- jitter, then forward and count"""
+
+    def __init__(self, client, latency_ms=0.0, jitter_ms=0.0, seed=0):
+        self._client = client
+        self.latency = latency_ms / 1000
+        self.jitter = jitter_ms / 1000
+        self.calls = Counter()  # (route, operation) -> calls
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self._client, name)
+        if name.startswith('_') or not callable(attr) or name in ('meta', 'exceptions'):
+            return attr
+
+        def call(*args, **kwargs):
+            with self._lock:
+                self.calls[(current_route.get(), name)] += 1
+                delay = self.latency + self._random.uniform(-self.jitter, self.jitter)
+            if delay > 0:
+                time.sleep(delay)
+            return attr(*args, **kwargs)
+        return call
+
+    def calls_by_route(self):
+        with self._lock:
+            per_route = {}
+            for (route, operation), count in self.calls.items():
+                per_route.setdefault(route, {})[operation] = count
+            return per_route
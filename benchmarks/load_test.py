@@ -0,0 +1,397 @@
+"""Load test for app.py and app_aws.py through their real Flask routes.
+
+    python -m benchmarks.load_test --app local
+    python -m benchmarks.load_test --app aws --latency-ms 5 --concurrency 16 --requests 5000
+    python -m benchmarks.load_test --app aws --output before.json
+
+Seeds users, bookings, sessions, feedback and uploads, then `--concurrency`
+worker threads (each with its own logged-in user and admin test client)
+replay a request plan drawn from MIX. app_aws.py runs against the in-process
+DynamoDB in fake_dynamo.py, with `--latency-ms` added to every call and the
+calls counted per route; a transaction also holds its items for that long,
+so concurrent ones on the same item conflict as they would in DynamoDB. Uploads are PDFs so no thumbnail work competes
+with the requests.
+
+The report is JSON: p50/p95/p99 latency and error count per route,
+throughput, and DynamoDB calls per route. The same --seed gives the same
+data and the same request plan, so two reports differ only by the code
+under test.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import date, timedelta
+
+import dynamo
+import availability
+import ratings
+import search
+import stats
+from availability import DURATIONS, PHOTOGRAPHERS, START_TIMES
+
+# Relative weight of each route in the request plan
+MIX = {
+    'dashboard': 35,
+    'admin': 15,
+    'download': 15,
+    'book_session': 15,
+    'book': 10,
+    'login': 10,
+    'search': 5,
+}
+
+PASSWORD = 'bench-password'
+ADMIN_EMAIL = 'admin@bench.test'
+SESSION_STATUSES = ('Pending', 'Upcoming', 'Completed', 'Cancelled')
+RATINGS = (5, 5, 5, 4, 4, 3, 2, 1)
+
+
+def user_email(i):
+    return f"user{i}@bench.test"
+
+
+def day(offset):
+    return (date.today() + timedelta(days=offset)).isoformat()
+
+
+def git_revision():
+    try:
+        out = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                             capture_output=True, text=True, timeout=5)
+    except OSError:
+        return None
+    return out.stdout.strip() or None
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies):
+    values = sorted(latencies)
+    ms = lambda v: None if v is None else round(v * 1000, 3)
+    return {
+        'count': len(values),
+        'mean_ms': ms(sum(values) / len(values)) if values else None,
+        'p50_ms': ms(percentile(values, 50)),
+        'p95_ms': ms(percentile(values, 95)),
+        'p99_ms': ms(percentile(values, 99)),
+        'max_ms': ms(values[-1]) if values else None,
+    }
+
+
+# --- Seed data ---
+
+def seed_rows(args, rng):
+    """Users, bookings, sessions and feedback as plain dicts (shared by both apps)"""
+    users = [{'email': user_email(i), 'name': f"Client {i}", 'password': PASSWORD, 'role': 'user'}
+             for i in range(args.users)]
+    bookings = [{
+        'id': f"b{i:07d}",
+        'user': rng.choice(users)['email'],
+        'service': f"Retouch: {rng.choice(['Retouching', 'Background Removal'])}",
+        'filename': f"scan{i}.pdf",
+        'status': rng.choice(['Pending', 'Confirmed', 'Cancelled']),
+        'created_at': f"{day(-rng.randrange(365))}T10:00:00",
+    } for i in range(args.bookings)]
+    sessions = []
+    held = availability.Schedule()  # active seeded sessions never overlap, as in production
+    for i in range(args.sessions):
+        user = rng.choice(users)
+        session_type, photographer = rng.choice(list(DURATIONS)), rng.choice(PHOTOGRAPHERS)
+        date_str, time_str = day(rng.randrange(-90, 90)), rng.choice(START_TIMES)
+        status = rng.choice(SESSION_STATUSES)
+        start, end = availability.interval(session_type, time_str)
+        slots = []
+        if status in availability.ACTIVE_STATUSES:
+            if held.reserve(photographer, date_str, start, end, i):
+                slots = availability.blocks(date_str, start, end)
+            else:
+                status = 'Cancelled'
+        sessions.append({
+            'id': f"s{i:07d}",
+            'user': user['email'],
+            'user_name': user['name'],
+            'service': f"{session_type} (with {photographer})",
+            'session_type': session_type,
+            'photographer': photographer,
+            'date': date_str,
+            'time': time_str,
+            'slots': slots,
+            'status': status,
+            'created_at': f"{day(-rng.randrange(365))}T10:00:00",
+        })
+    feedback = []
+    for i in range(args.feedback):
+        user = rng.choice(users)
+        feedback.append({
+            'id': f"f{i:07d}",
+            'user_name': user['name'],
+            'user_email': user['email'],
+            'service': 'Wedding Photography',
+            'rating': rng.choice(RATINGS),
+            'comment': 'Lovely photos, thank you!',
+            'created_at': f"{day(-rng.randrange(365))}T10:00:00",
+        })
+    return users, bookings, sessions, feedback
+
+
+class LocalTarget:
+    """app.py with its --store backend; the database and uploads live in the workdir"""
+    name = 'local'
+    ddb = None
+
+    def __init__(self, args, rng, workdir):
+        os.environ['STORE_BACKEND'] = args.store
+        os.environ['SQLITE_PATH'] = os.path.join(workdir, 'bench.db')
+        import app as local_app
+        from blob_store import LocalBlobStore
+        from memstore import Booking, SessionBooking, Feedback
+
+        self.app = local_app.app
+        self.app.static_folder = workdir
+        local_app.upload_store = LocalBlobStore(os.path.join(workdir, 'uploads'))
+
+        users, bookings, sessions, feedback = seed_rows(args, rng)
+        store = local_app.store
+        for u in users:
+            store.users.add(u['email'], u['name'], u['password'], u['role'])
+        store.users.add(ADMIN_EMAIL, 'Bench Admin', PASSWORD, 'admin')
+        for b in bookings:
+            store.bookings.add(Booking(id=None, user=b['user'], service=b['service'],
+                                       filename=b['filename'], status=b['status'], created_at=b['created_at']))
+        for s in sessions:
+            record = SessionBooking(id=None, **{k: s[k] for k in (
+                'user', 'user_name', 'service', 'photographer', 'date', 'time', 'status')})
+            if s['slots']:
+                store.reserve_session(record, *availability.interval(s['session_type'], s['time']))
+            else:
+                store.sessions.add(record)
+        for f in feedback:
+            store.feedbacks.add(Feedback(**{k: f[k] for k in (
+                'id', 'user_name', 'user_email', 'service', 'rating', 'comment')}))
+
+        self.downloads = []
+        for i in range(args.uploads):
+            key = f"upload{i}.pdf"
+            local_app.upload_store.put_stream(key, io.BytesIO(rng.randbytes(args.upload_kb * 1024)))
+            self.downloads.append(f"/static/uploads/{key}")
+
+
+class AwsTarget:
+    """app_aws.py against the in-process DynamoDB in fake_dynamo.py"""
+    name = 'aws'
+
+    def __init__(self, args, rng, workdir):
+        os.environ['BLOB_BACKEND'] = 'local'
+        os.environ['BLOB_ROOT'] = os.path.join(workdir, 'blobs')
+        with contextlib.redirect_stdout(sys.stderr):
+            import app_aws
+        from benchmarks.fake_dynamo import LatencyClient, create_fake
+
+        self.app = app_aws.app
+        raw = create_fake(transaction_seconds=args.latency_ms / 1000)
+        users, bookings, sessions, feedback = seed_rows(args, rng)
+        for s in sessions:
+            del s['session_type']  # app_aws.py only keeps it inside 'service'
+        admins = [{'email': ADMIN_EMAIL, 'name': 'Bench Admin', 'password': PASSWORD}]
+
+        files = []
+        self.downloads = []
+        for i in range(args.uploads):
+            file_id = f"u{i:07d}"
+            blob = app_aws.blob_store.put_stream(f"{file_id}/scan.pdf",
+                                                 io.BytesIO(rng.randbytes(args.upload_kb * 1024)),
+                                                 'application/pdf')
+            files.append({'id': file_id, 'filename': 'scan.pdf', 'storage_key': blob.key,
+                          'sha256': blob.sha256, 'content_type': 'application/pdf', 'file_type': 'pdf',
+                          'size': blob.size, 'user': rng.choice(users)['email'],
+                          'created_at': f"{day(-1)}T10:00:00"})
+            self.downloads.append(f"/download/{file_id}")
+
+        slots = [{'photographer': s['photographer'], 'slot': slot, 'session_id': s['id']}
+                 for s in sessions for slot in s['slots']]
+        for table_name, items in (('Users', users), ('AdminUsers', admins), ('Bookings', bookings),
+                                  ('Sessions', sessions), ('Feedback', feedback), ('Files', files),
+                                  ('Availability', slots)):
+            for start in range(0, len(items), 25):
+                raw.batch_write_item(RequestItems={table_name: [
+                    {'PutRequest': {'Item': dynamo.serialize(item)}} for item in items[start:start + 25]
+                ]})
+        stats.rebuild(dynamo.DynamoDB(raw))  # batch writes bypass the admin counters, as in bulk_load.py
+        ratings.rebuild(dynamo.DynamoDB(raw))
+        search.rebuild(dynamo.DynamoDB(raw))
+
+        # Everything after seeding goes through the latency/counting proxy
+        self.ddb = LatencyClient(raw, args.latency_ms, args.jitter_ms, args.seed)
+        app_aws.db.client = self.ddb
+
+
+# --- Load ---
+
+def plan(args, rng, count):
+    """One worker's request sequence: (route, parameters) tuples"""
+    routes, weights = zip(*MIX.items())
+    steps = []
+    for route in rng.choices(routes, weights, k=count):
+        if route == 'book_session':
+            params = {'session_type': rng.choice(list(DURATIONS)), 'photographer': rng.choice(PHOTOGRAPHERS),
+                      'session_date': day(rng.randrange(1, 60)), 'session_time': rng.choice(START_TIMES),
+                      'idempotency_key': str(uuid.UUID(int=rng.getrandbits(128)))}
+        elif route == 'book':
+            params = {'service': 'Retouching', 'idempotency_key': str(uuid.UUID(int=rng.getrandbits(128)))}
+        elif route == 'download':
+            params = {'index': rng.randrange(max(args.uploads, 1))}
+        elif route == 'search':
+            # A customer prefix, or one status over a month
+            params = rng.choice([
+                {'section': 'bookings', 'q': user_email(rng.randrange(args.users))[:6]},
+                {'section': 'sessions', 'status': 'Pending', 'from': day(-30), 'to': day(0)},
+            ])
+        else:
+            params = {}
+        steps.append((route, params))
+    return steps
+
+
+def send(target, clients, route, params, payload):
+    user, admin = clients
+    if route == 'login':
+        return user.post('/login', data={'email': params['email'], 'password': PASSWORD})
+    if route == 'dashboard':
+        return user.get('/dashboard')
+    if route == 'admin':
+        return admin.get('/admin')
+    if route == 'book':
+        data = dict(params, file=(io.BytesIO(payload), 'scan.pdf'))
+        return user.post('/book', data=data, content_type='multipart/form-data')
+    if route == 'book_session':
+        return user.post('/book_session', data=params)
+    if route == 'download':
+        return user.get(target.downloads[params['index']])
+    if route == 'search':
+        return admin.get('/admin/search', query_string=params)
+    raise ValueError(route)
+
+
+def worker(target, args, index, steps, results):
+    from benchmarks.fake_dynamo import current_route
+
+    email = user_email(index % args.users)
+    user, admin = target.app.test_client(), target.app.test_client()
+    user.post('/login', data={'email': email, 'password': PASSWORD})
+    admin.post('/admin/login', data={'email': ADMIN_EMAIL, 'password': PASSWORD})
+    payload = random.Random(args.seed + index).randbytes(args.upload_kb * 1024)
+
+    timings = {route: [] for route in MIX}
+    errors = {route: 0 for route in MIX}
+    for route, params in steps:
+        if route == 'download' and not target.downloads:
+            continue
+        if route == 'login':
+            params = dict(params, email=email)
+        token = current_route.set(route)
+        started = time.perf_counter()
+        try:
+            response = send(target, (user, admin), route, params, payload)
+            response.get_data()
+            response.close()
+            failed = response.status_code >= 500
+        except Exception:
+            failed = True
+        finally:
+            elapsed = time.perf_counter() - started
+            current_route.reset(token)
+        timings[route].append(elapsed)
+        errors[route] += failed
+    results[index] = (timings, errors)
+
+
+def run(args):
+    rng = random.Random(args.seed)
+    with tempfile.TemporaryDirectory(prefix='yojeong-bench-') as workdir:
+        target = (AwsTarget if args.app == 'aws' else LocalTarget)(args, rng, workdir)
+
+        per_worker = [args.requests // args.concurrency + (i < args.requests % args.concurrency)
+                      for i in range(args.concurrency)]
+        plans = [plan(args, random.Random(args.seed * 1000 + i), n) for i, n in enumerate(per_worker)]
+        results = [None] * args.concurrency
+        threads = [threading.Thread(target=worker, args=(target, args, i, plans[i], results))
+                   for i in range(args.concurrency)]
+
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        duration = time.perf_counter() - started
+
+    routes = {}
+    all_latencies = []
+    calls = target.ddb.calls_by_route() if target.ddb else {}
+    for route in MIX:
+        latencies = [v for timings, _ in results for v in timings[route]]
+        all_latencies.extend(latencies)
+        summary = summarize(latencies)
+        summary['errors'] = sum(errors[route] for _, errors in results)
+        if target.ddb:
+            route_calls = calls.get(route, {})
+            summary['ddb_calls'] = dict(sorted(route_calls.items()))
+            summary['ddb_calls_per_request'] = (
+                round(sum(route_calls.values()) / len(latencies), 2) if latencies else None)
+        routes[route] = summary
+
+    return {
+        'app': target.name,
+        'revision': git_revision(),
+        'config': {k: v for k, v in vars(args).items() if k != 'output'},
+        'duration_s': round(duration, 3),
+        'throughput_rps': round(len(all_latencies) / duration, 1) if duration else None,
+        'overall': summarize(all_latencies),
+        'routes': routes,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load-test app.py or app_aws.py through their Flask routes")
+    parser.add_argument('--app', choices=['local', 'aws'], default='local')
+    parser.add_argument('--store', choices=['sqlite', 'memory'], default='sqlite', help="app.py's STORE_BACKEND")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--requests', type=int, default=2000, help="total requests across all workers")
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--bookings', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=2000)
+    parser.add_argument('--feedback', type=int, default=1000)
+    parser.add_argument('--uploads', type=int, default=100)
+    parser.add_argument('--upload-kb', type=int, default=256)
+    parser.add_argument('--latency-ms', type=float, default=2.0, help="added to every DynamoDB call (aws only)")
+    parser.add_argument('--jitter-ms', type=float, default=0.5)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', '-o', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.users < 1 or args.concurrency < 1:
+        parser.error("--users and --concurrency must be at least 1")
+
+    report = json.dumps(run(args), indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(report + '\n')
+    else:
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,258 @@
+"""Blob storage for uploaded retouch files.
+
+app_aws.py keeps only file metadata in the DynamoDB `Files` table; the bytes
+live in one of these backends:
+
+* S3BlobStore    - any S3-compatible object store (AWS S3, MinIO, ...)
+* LocalBlobStore - a directory on disk, handy for development and tests
+
+Uploads are streamed through in fixed-size chunks, so a 50MB RAW file never
+has to sit in worker memory in one piece.
+
+Retouch uploads are stored once per content hash under `content_key()`:
+the apps hash the (already spooled) upload with `hash_stream()` first and
+only write the bytes when no copy of that content is stored yet. Reference
+counts live with the metadata (the `Files` table / the SQLite `blobs` table).
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+import boto3
+from botocore.exceptions import ClientError
+
+CHUNK_SIZE = 1024 * 1024          # read/write granularity (1MB)
+PART_SIZE = 8 * 1024 * 1024       # S3 multipart part size (S3 minimum is 5MB)
+
+
+def content_key(sha256, name):
+    """Key of a content-addressed upload: content/<sha256>/<name>"""
+    return f"content/{sha256}/{name}"
+
+
+def hash_stream(stream):
+    """sha256 and size of a seekable stream, rewound afterwards for the upload"""
+    start = stream.tell()
+    digest = hashlib.sha256()
+    size = 0
+    while True:
+        data = stream.read(CHUNK_SIZE)
+        if not data:
+            break
+        digest.update(data)
+        size += len(data)
+    stream.seek(start)
+    return digest.hexdigest(), size
+
+
+class BlobInfo:
+    """What a backend reports back after storing a blob"""
+
+    def __init__(self, key, size, sha256):
+        self.key = key
+        self.size = size
+        self.sha256 = sha256
+
+
+def _read_full(stream, size):
+    """Read exactly `size` bytes unless the stream ends first"""
+    parts = []
+    remaining = size
+    while remaining > 0:
+        data = stream.read(min(remaining, CHUNK_SIZE))
+        if not data:
+            break
+        parts.append(data)
+        remaining -= len(data)
+    return b''.join(parts)
+
+
+class BlobStore:
+    """Interface shared by every backend"""
+
+    def put_stream(self, key, stream, content_type=None):
+        """Store everything readable from `stream` under `key`; returns BlobInfo"""
+        raise NotImplementedError
+
+    def iter_chunks(self, key, start=0, length=None):
+        """Yield `length` bytes of the blob from offset `start` (default: to the end)
+        in CHUNK_SIZE pieces, without reading the parts outside that window"""
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+
+class LocalBlobStore(BlobStore):
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(os.path.abspath(self.root) + os.sep):
+            raise ValueError(f"Invalid blob key: {key}")
+        return path
+
+    def put_stream(self, key, stream, content_type=None):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        # Write to a temp file first so readers never see a half-written blob
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as out:
+                while True:
+                    data = stream.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    digest.update(data)
+                    size += len(data)
+                    out.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return BlobInfo(key, size, digest.hexdigest())
+
+    def iter_chunks(self, key, start=0, length=None):
+        f = open(self._path(key), 'rb')  # opened eagerly so a missing blob fails here
+        f.seek(start)
+        return self._stream(f, length)
+
+    @staticmethod
+    def _stream(f, length):
+        with f:
+            remaining = length
+            while remaining is None or remaining > 0:
+                size = CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining)
+                data = f.read(size)
+                if not data:
+                    return
+                if remaining is not None:
+                    remaining -= len(data)
+                yield data
+
+    def delete(self, key):
+        try:
+            os.unlink(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def exists(self, key):
+        return os.path.exists(self._path(key))
+
+    def clear(self):
+        """Remove every blob (used by tests and local resets)"""
+        shutil.rmtree(self.root, ignore_errors=True)
+        os.makedirs(self.root, exist_ok=True)
+
+
+class S3BlobStore(BlobStore):
+    def __init__(self, bucket, prefix='', client=None, region=None, endpoint_url=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self.region = region
+        self.endpoint_url = endpoint_url
+        self.client = client or self._make_client()
+
+    def _make_client(self):
+        return boto3.client('s3', region_name=self.region, endpoint_url=self.endpoint_url)
+
+    # boto3 clients can't be pickled, so a store sent to a worker process
+    # (see thumbnails.py) travels without one and builds its own on arrival
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['client']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.client = self._make_client()
+
+    def put_stream(self, key, stream, content_type=None):
+        full_key = self.prefix + key
+        extra = {'ContentType': content_type} if content_type else {}
+        digest = hashlib.sha256()
+
+        part = _read_full(stream, PART_SIZE)
+        digest.update(part)
+        size = len(part)
+
+        # Small files: a single PUT is cheaper than a multipart round trip
+        if len(part) < PART_SIZE:
+            self.client.put_object(Bucket=self.bucket, Key=full_key, Body=part, **extra)
+            return BlobInfo(key, size, digest.hexdigest())
+
+        upload_id = self.client.create_multipart_upload(
+            Bucket=self.bucket, Key=full_key, **extra
+        )['UploadId']
+        parts = []
+        try:
+            while part:
+                number = len(parts) + 1
+                resp = self.client.upload_part(
+                    Bucket=self.bucket, Key=full_key, UploadId=upload_id,
+                    PartNumber=number, Body=part
+                )
+                parts.append({'PartNumber': number, 'ETag': resp['ETag']})
+                part = _read_full(stream, PART_SIZE)
+                digest.update(part)
+                size += len(part)
+            self.client.complete_multipart_upload(
+                Bucket=self.bucket, Key=full_key, UploadId=upload_id,
+                MultipartUpload={'Parts': parts}
+            )
+        except BaseException:
+            self.client.abort_multipart_upload(Bucket=self.bucket, Key=full_key, UploadId=upload_id)
+            raise
+        return BlobInfo(key, size, digest.hexdigest())
+
+    def iter_chunks(self, key, start=0, length=None):
+        kwargs = {'Bucket': self.bucket, 'Key': self.prefix + key}
+        if start or length is not None:
+            end = '' if length is None else start + length - 1
+            kwargs['Range'] = f"bytes={start}-{end}"
+        # Fetched eagerly so a missing object fails before any bytes are sent
+        body = self.client.get_object(**kwargs)['Body']
+        return self._stream(body)
+
+    @staticmethod
+    def _stream(body):
+        try:
+            for data in body.iter_chunks(CHUNK_SIZE):
+                yield data
+        finally:
+            body.close()
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+        except ClientError as e:
+            if e.response['Error']['Code'] in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+        return True
+
+
+def from_env():
+    """Build the backend selected by the BLOB_* environment variables"""
+    backend = os.environ.get('BLOB_BACKEND', 's3')
+    if backend == 'local':
+        return LocalBlobStore(os.environ.get('BLOB_ROOT', 'blob_data'))
+    if backend == 's3':
+        return S3BlobStore(
+            bucket=os.environ.get('BLOB_BUCKET', 'yojeong-retouch-uploads'),
+            prefix=os.environ.get('BLOB_PREFIX', 'uploads/'),
+            region=os.environ.get('AWS_REGION', 'us-east-1'),
+            endpoint_url=os.environ.get('BLOB_ENDPOINT_URL') or None,
+        )
+    raise ValueError(f"Unknown BLOB_BACKEND: {backend}")
@@ -0,0 +1,79 @@
+"""Bulk-load historical bookings or sessions from a JSON-lines file.
+
+    python bulk_load.py bookings.jsonl                  # into Bookings
+    python bulk_load.py sessions.jsonl --table Sessions
+
+Each line is one item, e.g.
+
+    {"id": "a1b2c3d4", "user": "jane@test.com", "user_name": "Jane Doe",
+     "service": "Retouch: Retouching", "status": "Confirmed",
+     "created_at": "2025-03-01T10:00:00"}
+
+Items are written through `batch_writer`, which groups them into 25-item
+BatchWriteItem calls and retries unprocessed items, so imports cost one
+round trip per 25 rows instead of one per row. This bypasses the
+idempotent single-booking path in app_aws.py on purpose: re-running an
+import simply overwrites items with the same id.
+"""
+import argparse
+import json
+import os
+from decimal import Decimal
+
+import boto3
+
+import changes
+import dynamo
+import stats
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+# The per-user GSIs in create_tables.py need both of these on every row
+REQUIRED = ('id', 'user', 'created_at')
+
+
+def read_items(path):
+    with open(path, encoding='utf-8') as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            # DynamoDB rejects floats; Decimal keeps the exact value
+            item = json.loads(line, parse_float=Decimal)
+            missing = [field for field in REQUIRED if item.get(field) in (None, '')]
+            if missing:
+                print(f"line {line_no}: skipped, missing {', '.join(missing)}")
+                continue
+            item['id'] = str(item['id'])
+            yield changes.stamp(item)
+
+
+def load(table, items):
+    count = 0
+    # overwrite_by_pkeys drops earlier duplicates of an id within a batch,
+    # which BatchWriteItem would otherwise reject
+    with table.batch_writer(overwrite_by_pkeys=['id']) as batch:
+        for item in items:
+            batch.put_item(Item=item)
+            count += 1
+            if count % 1000 == 0:
+                print(f"{count} items queued...")
+    return count
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-load bookings/sessions from JSON lines")
+    parser.add_argument('path')
+    parser.add_argument('--table', default='Bookings', choices=['Bookings', 'Sessions'])
+    args = parser.parse_args()
+
+    table = boto3.resource('dynamodb', region_name=REGION).Table(args.table)
+    count = load(table, read_items(args.path))
+    print(f"Loaded {count} items into {args.table}.")
+    # Batch writes skip the per-booking counter updates; recount once instead
+    stats.rebuild(dynamo.DynamoDB(region_name=REGION))
+    print("Rebuilt the admin counters.")
+
+
+if __name__ == '__main__':
+    main()
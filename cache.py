@@ -0,0 +1,177 @@
+"""Read-through cache in front of DynamoDB for app_aws.py.
+
+Two tiers:
+
+* LRUCache   - per-worker, thread-safe LRU with a TTL on every entry
+* RedisCache - optional shared tier (any Redis-compatible server), enabled by
+               setting CACHE_REDIS_URL; needs the `redis` package
+
+Point lookups (`user:<email>`) are dropped from both tiers on write. Cached
+listings such as admin pages live in a *namespace*; bumping the namespace's
+generation number invalidates every key in it at once. With a shared tier
+the generation lives in Redis, so one worker's write invalidates the
+listings of every worker. The local tier of other workers can still serve a
+point lookup for up to its TTL, which is why it is kept short when a shared
+tier is configured.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+
+class LRUCache:
+    def __init__(self, maxsize=2048, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or entry[0] <= now:
+                if entry is not None:
+                    del self._data[key]
+                self.misses += 1
+                return MISSING
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, value, ttl=None):
+        expires_at = time.monotonic() + (ttl or self.ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'size': len(self._data), 'hits': self.hits,
+                    'misses': self.misses, 'evictions': self.evictions}
+
+
+class RedisCache:
+    """Shared tier; values are stored as JSON. `client` replaces the one built from `url`"""
+
+    def __init__(self, url=None, ttl=60, prefix='yojeong:', client=None):
+        if client is None:
+            import redis  # optional dependency, only needed when CACHE_REDIS_URL is set
+            client = redis.Redis.from_url(url)
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.hits = self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        raw = self.client.get(self.prefix + key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return MISSING
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value, ttl=None):
+        self.client.set(self.prefix + key, json.dumps(value), ex=ttl or self.ttl)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def generation(self, namespace):
+        return int(self.client.get(f"{self.prefix}gen:{namespace}") or 0)
+
+    def bump(self, namespace):
+        self.client.incr(f"{self.prefix}gen:{namespace}")
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses}
+
+
+class Cache:
+    """Local LRU, optionally backed by a shared tier"""
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+        self._generations = {}
+        self._lock = threading.Lock()
+        self.loads = 0
+
+    def get_or_load(self, key, loader, ttl=None):
+        value = self.local.get(key)
+        if value is not MISSING:
+            return value
+        if self.shared is not None:
+            value = self.shared.get(key)
+            if value is not MISSING:
+                self.local.set(key, value)
+                return value
+        value = loader()
+        with self._lock:
+            self.loads += 1
+        self.set(key, value, ttl)
+        return value
+
+    def set(self, key, value, ttl=None):
+        # `ttl` overrides the shared tier's default; the local tier always
+        # uses its own (possibly shorter) TTL
+        self.local.set(key, value, None if self.shared is not None else ttl)
+        if self.shared is not None:
+            self.shared.set(key, value, ttl)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+    def key(self, namespace, *parts):
+        """Key inside a namespace; changes whenever the namespace is invalidated"""
+        if self.shared is not None:
+            generation = self.shared.generation(namespace)
+        else:
+            with self._lock:
+                generation = self._generations.get(namespace, 0)
+        return ':'.join([namespace, str(generation), *map(str, parts)])
+
+    def invalidate_namespace(self, namespace):
+        if self.shared is not None:
+            self.shared.bump(namespace)
+        else:
+            with self._lock:
+                self._generations[namespace] = self._generations.get(namespace, 0) + 1
+
+    def stats(self):
+        stats = {'local': self.local.stats(), 'loads': self.loads}
+        if self.shared is not None:
+            stats['shared'] = self.shared.stats()
+        return stats
+
+
+def from_env(environ):
+    """Build the cache described by CACHE_* settings"""
+    ttl = int(environ.get('CACHE_TTL', 60))
+    size = int(environ.get('CACHE_SIZE', 2048))
+    redis_url = environ.get('CACHE_REDIS_URL')
+    if not redis_url:
+        return Cache(LRUCache(size, ttl))
+    # Keep the per-worker tier short-lived so other workers' writes show up quickly
+    local_ttl = int(environ.get('CACHE_LOCAL_TTL', 5))
+    return Cache(LRUCache(size, local_ttl), RedisCache(redis_url, ttl))
@@ -0,0 +1,103 @@
+"""Change tracking behind the admin page's delta sync (/admin/changes).
+
+Every write to a row the admin page shows stamps it with `updated_at`, a
+UTC timestamp with millisecond precision that sorts as a string:
+
+* app_aws.py - items also carry `updated_day`, the partition key of each
+               table's updated_day-updated_at-index, so "changed since" is
+               one Query per day; deletes leave a tombstone in `Deletions`
+* app.py     - SQLite triggers stamp the rows and record deletions, with an
+               index on updated_at (sqlstore.py); the in-memory store keeps
+               a change log ordered by write time (memstore.py)
+
+A client keeps the cursor from its last response and asks for what changed
+after it. Cursors trail the clock by OVERLAP seconds, so a write whose
+timestamp was taken just before a poll but committed just after it (or one
+made on a worker whose clock is a little behind) is picked up by the next
+poll (as is a row that has not reached a DynamoDB index yet); a change can
+be sent twice, which the client treats as a replace.
+A cursor older than MAX_AGE, or a delta larger than LIMIT, gets a reset:
+the client reloads the page instead.
+"""
+from datetime import datetime, timedelta, timezone
+
+OVERLAP = 5                  # seconds every poll re-reads
+MAX_AGE = timedelta(days=7)  # oldest cursor served; also how long tombstones are kept
+LIMIT = 500                  # changes per response before the client is told to reload
+SECTIONS = ('users', 'bookings', 'sessions', 'feedback')
+
+
+def format_time(moment):
+    return moment.strftime('%Y-%m-%dT%H:%M:%S.') + f"{moment.microsecond // 1000:03d}Z"
+
+
+def now():
+    return format_time(datetime.now(timezone.utc))
+
+
+def cursor():
+    """The cursor handed to a client that has seen everything up to now"""
+    return format_time(datetime.now(timezone.utc) - timedelta(seconds=OVERLAP))
+
+
+def parse_cursor(text):
+    """The cursor's time; ValueError if it isn't one"""
+    return datetime.strptime(text or '', '%Y-%m-%dT%H:%M:%S.%fZ').replace(tzinfo=timezone.utc)
+
+
+def normalize(text):
+    """A client's cursor in the exact form written rows carry, so they compare as strings"""
+    return format_time(parse_cursor(text))
+
+
+def horizon():
+    """The oldest cursor still served"""
+    return format_time(datetime.now(timezone.utc) - MAX_AGE)
+
+
+def days(since):
+    """Every updated_day from the cursor's day to today"""
+    first = parse_cursor(since).date()
+    today = datetime.now(timezone.utc).date()
+    return [(first + timedelta(days=n)).isoformat() for n in range((today - first).days + 1)]
+
+
+# --- DynamoDB items (app_aws.py) ---
+
+def stamp(item, at=None):
+    """Set updated_at/updated_day on an item about to be put"""
+    at = at or now()
+    item['updated_at'] = at
+    item['updated_day'] = at[:10]
+    return item
+
+
+def touch(kwargs, at=None):
+    """UpdateItem kwargs (also for transactions) that set updated_at/updated_day as well"""
+    at = at or now()
+    expression = kwargs['UpdateExpression']
+    fields = 'updated_at = :updated_at, updated_day = :updated_day'
+    if expression[:4].lower() == 'set ':
+        expression = f"SET {fields}, {expression[4:]}"
+    else:
+        expression = f"SET {fields} {expression}"
+    return {
+        **kwargs,
+        'UpdateExpression': expression,
+        'ExpressionAttributeValues': {**kwargs.get('ExpressionAttributeValues', {}),
+                                      ':updated_at': at, ':updated_day': at[:10]},
+    }
+
+
+def tombstone(section, record_id, at=None):
+    """Deletions item recording that `record_id` left `section`"""
+    at = at or now()
+    return {
+        'updated_day': at[:10],
+        'change_id': f"{at}#{section}#{record_id}",
+        'updated_at': at,
+        'section': section,
+        'id': record_id,
+        # DynamoDB TTL removes tombstones nobody can ask for any more
+        'expires_at': int((parse_cursor(at) + MAX_AGE + timedelta(days=1)).timestamp()),
+    }
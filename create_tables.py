@@ -0,0 +1,177 @@
+"""Create (or upgrade) the DynamoDB tables and indexes used by app_aws.py.
+
+Run once per environment, and again after pulling changes that add indexes:
+
+    python create_tables.py
+
+Existing tables are left in place; any missing global secondary index is
+added with UpdateTable (DynamoDB only allows one index build at a time, so
+the script waits for each one to become ACTIVE before starting the next).
+"""
+import os
+import time
+
+import boto3
+from botocore.exceptions import ClientError
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+# Index names shared with app_aws.py
+USER_INDEX = 'user-created_at-index'
+FEEDBACK_USER_INDEX = 'user_email-created_at-index'
+STATUS_DATE_INDEX = 'status-date-index'
+STATUS_CREATED_INDEX = 'status-created_at-index'
+PHOTOGRAPHER_DATE_INDEX = 'photographer-date-index'
+UPDATED_INDEX = 'updated_day-updated_at-index'
+
+
+def _key_schema(key):
+    hash_key, range_key = key if isinstance(key, tuple) else (key, None)
+    schema = [{'AttributeName': hash_key, 'KeyType': 'HASH'}]
+    if range_key:
+        schema.append({'AttributeName': range_key, 'KeyType': 'RANGE'})
+    return schema
+
+
+def _gsi(name, hash_key, range_key=None, projection='ALL'):
+    return {
+        'IndexName': name,
+        'KeySchema': _key_schema((hash_key, range_key)),
+        'Projection': {'ProjectionType': projection},
+    }
+
+
+# /admin/changes: rows written on one day, in write order (see changes.py).
+# Sparse, so rows that were never written since the index was added stay out.
+_UPDATED = [('updated_day', 'S'), ('updated_at', 'S')]
+
+
+def _updated_gsi():
+    return _gsi(UPDATED_INDEX, 'updated_day', 'updated_at')
+
+
+# table name -> (hash key or (hash, range) keys, [(attribute, type) for every key attribute], [GSIs])
+TABLES = {
+    'Users': ('email', [('email', 'S')] + _UPDATED, [_updated_gsi()]),
+    'AdminUsers': ('email', [('email', 'S')], []),
+    'Bookings': (
+        'id',
+        [('id', 'S'), ('user', 'S'), ('created_at', 'S'), ('status', 'S')] + _UPDATED,
+        [
+            _gsi(USER_INDEX, 'user', 'created_at'),
+            # /admin/search: bookings of one status, newest first (see search.py)
+            _gsi(STATUS_CREATED_INDEX, 'status', 'created_at'),
+            _updated_gsi(),
+        ],
+    ),
+    'Sessions': (
+        'id',
+        [('id', 'S'), ('user', 'S'), ('created_at', 'S'), ('status', 'S'), ('date', 'S'),
+         ('photographer', 'S')] + _UPDATED,
+        [
+            _gsi(USER_INDEX, 'user', 'created_at'),
+            # session_sweeper.py: sessions of one status around a given date
+            _gsi(STATUS_DATE_INDEX, 'status', 'date', projection='KEYS_ONLY'),
+            # /admin/search: one photographer's sessions by date
+            _gsi(PHOTOGRAPHER_DATE_INDEX, 'photographer', 'date'),
+            _updated_gsi(),
+        ],
+    ),
+    'Feedback': (
+        'id',
+        [('id', 'S'), ('user_email', 'S'), ('created_at', 'S')] + _UPDATED,
+        [_gsi(FEEDBACK_USER_INDEX, 'user_email', 'created_at'), _updated_gsi()],
+    ),
+    'Files': ('id', [('id', 'S')], []),  # id is the content sha256 (legacy uploads: a form id)
+    # One item per photographer-hour held by a session; slot is 'YYYY-MM-DD#HH:MM'
+    'Availability': (('photographer', 'slot'), [('photographer', 'S'), ('slot', 'S')], []),
+    'Stats': ('id', [('id', 'S')], []),  # admin counters, see stats.py
+    # Tombstones of deleted admin rows for /admin/changes; change_id is 'updated_at#section#id'
+    'Deletions': (('updated_day', 'change_id'), [('updated_day', 'S'), ('change_id', 'S')], []),
+    # Jobs moving a customer's rows to their new email, keyed by that email (see email_change.py)
+    'EmailChanges': ('email', [('email', 'S')], []),
+    # Name and email prefixes of every user for /admin/search, one item per (prefix, email) (see search.py)
+    'SearchTerms': (('term', 'email'), [('term', 'S'), ('email', 'S')], []),
+}
+
+# table name -> attribute holding the epoch second DynamoDB may delete the item after
+TIME_TO_LIVE = {
+    'Deletions': 'expires_at',
+    'EmailChanges': 'expires_at',
+}
+
+
+def _attribute_definitions(attributes):
+    return [{'AttributeName': name, 'AttributeType': kind} for name, kind in attributes]
+
+
+def _wait_until_active(client, table_name):
+    while True:
+        desc = client.describe_table(TableName=table_name)['Table']
+        building = [
+            g['IndexName'] for g in desc.get('GlobalSecondaryIndexes', [])
+            if g['IndexStatus'] != 'ACTIVE'
+        ]
+        if desc['TableStatus'] == 'ACTIVE' and not building:
+            return desc
+        time.sleep(5)
+
+
+def create_table(client, table_name, key, attributes, indexes):
+    params = {
+        'TableName': table_name,
+        'KeySchema': _key_schema(key),
+        'AttributeDefinitions': _attribute_definitions(attributes),
+        'BillingMode': 'PAY_PER_REQUEST',
+    }
+    if indexes:
+        params['GlobalSecondaryIndexes'] = indexes
+    client.create_table(**params)
+    print(f"Creating {table_name}...")
+    _wait_until_active(client, table_name)
+
+
+def add_missing_indexes(client, table_name, attributes, indexes):
+    desc = _wait_until_active(client, table_name)
+    existing = {g['IndexName'] for g in desc.get('GlobalSecondaryIndexes', [])}
+    for index in indexes:
+        if index['IndexName'] in existing:
+            continue
+        print(f"Adding {index['IndexName']} to {table_name}...")
+        client.update_table(
+            TableName=table_name,
+            AttributeDefinitions=_attribute_definitions(attributes),
+            GlobalSecondaryIndexUpdates=[{'Create': index}],
+        )
+        _wait_until_active(client, table_name)
+
+
+def enable_time_to_live(client, table_name, attribute):
+    desc = client.describe_time_to_live(TableName=table_name)['TimeToLiveDescription']
+    if desc.get('TimeToLiveStatus') in ('ENABLED', 'ENABLING'):
+        return
+    print(f"Enabling TTL on {table_name}.{attribute}...")
+    client.update_time_to_live(
+        TableName=table_name,
+        TimeToLiveSpecification={'Enabled': True, 'AttributeName': attribute},
+    )
+
+
+def bootstrap(client=None):
+    client = client or boto3.client('dynamodb', region_name=REGION)
+    for table_name, (key, attributes, indexes) in TABLES.items():
+        try:
+            client.describe_table(TableName=table_name)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            create_table(client, table_name, key, attributes, indexes)
+        else:
+            add_missing_indexes(client, table_name, attributes, indexes)
+    for table_name, attribute in TIME_TO_LIVE.items():
+        enable_time_to_live(client, table_name, attribute)
+    print("All tables ready.")
+
+
+if __name__ == '__main__':
+    bootstrap()
@@ -0,0 +1,343 @@
+"""Thin DynamoDB data access layer on top of the low-level boto3 client.
+
+The boto3 *resource* layer deserializes every attribute into Decimal, which
+app_aws.py then had to walk a second time (convert_decimal) to get ints and
+floats the templates can use. `Table` here keeps the familiar resource-style
+calls (get_item/put_item/query/scan/... with Key/Attr conditions) but talks
+to the low-level client and turns the wire format straight into native
+Python values in one pass:
+
+    N -> int, or float when it has a fractional part
+    S -> str, BOOL -> bool, NULL -> None, M -> dict, L -> list,
+    SS/NS/BS -> set, B -> bytes
+
+The low-level client is thread-safe, so one client (and one Table object per
+table) is shared by the whole worker, including the fan-out read threads.
+It is built on first use in each process (see aws_clients.py), so Table
+objects can be made at import time, before gunicorn forks.
+
+Listeners added with `DynamoDB.add_listener` see every call with its
+round-trip and decode time (metrics.py uses this); while any are attached,
+requests ask for ConsumedCapacity.
+
+Calls made inside `with deadline(at):` (app_aws.fan_out's reads) get only
+the time left until `at`: each goes out on a client whose timeouts fit in
+it (see aws_clients.py), and once it is up a call raises DeadlineExceeded
+instead of starting, so a slow read stops at its next page.
+"""
+import contextvars
+import random
+import threading
+import time
+from contextlib import contextmanager
+from decimal import Decimal
+
+from boto3.dynamodb.conditions import ConditionBase, ConditionExpressionBuilder
+from botocore.exceptions import ClientError
+
+import aws_clients
+
+
+# --- Wire format -> Python ---
+
+def _number(text):
+    if '.' not in text and 'e' not in text and 'E' not in text:
+        return int(text)
+    value = float(text)
+    return int(value) if value.is_integer() else value
+
+
+def _value(av):
+    for kind, raw in av.items():
+        if kind == 'S':
+            return raw
+        if kind == 'N':
+            return _number(raw)
+        if kind == 'M':
+            return {k: _value(v) for k, v in raw.items()}
+        if kind == 'L':
+            return [_value(v) for v in raw]
+        if kind == 'BOOL':
+            return raw
+        if kind == 'NULL':
+            return None
+        if kind == 'SS':
+            return set(raw)
+        if kind == 'NS':
+            return {_number(v) for v in raw}
+        if kind == 'B':
+            return raw
+        if kind == 'BS':
+            return set(raw)
+        raise TypeError(f"Unknown DynamoDB type: {kind}")
+
+
+def deserialize(item):
+    """Wire-format item -> dict of native Python values"""
+    return {k: _value(v) for k, v in item.items()}
+
+
+# --- Python -> wire format ---
+
+def _attribute(value):
+    if isinstance(value, str):
+        return {'S': value}
+    if isinstance(value, bool):  # before int: bool is an int subclass
+        return {'BOOL': value}
+    if isinstance(value, (int, float, Decimal)):
+        return {'N': str(value)}
+    if value is None:
+        return {'NULL': True}
+    if isinstance(value, dict):
+        return {'M': {k: _attribute(v) for k, v in value.items()}}
+    if isinstance(value, (list, tuple)):
+        return {'L': [_attribute(v) for v in value]}
+    if isinstance(value, (bytes, bytearray)):
+        return {'B': bytes(value)}
+    if isinstance(value, (set, frozenset)):
+        if all(isinstance(v, str) for v in value):
+            return {'SS': list(value)}
+        if all(isinstance(v, (bytes, bytearray)) for v in value):
+            return {'BS': [bytes(v) for v in value]}
+        return {'NS': [str(v) for v in value]}
+    raise TypeError(f"Can't store {type(value).__name__} in DynamoDB")
+
+
+def serialize(item):
+    """dict of Python values -> wire-format item"""
+    return {k: _attribute(v) for k, v in item.items()}
+
+
+# --- Tables ---
+
+_deadline = contextvars.ContextVar('dynamo_deadline', default=None)
+
+
+class DeadlineExceeded(TimeoutError):
+    """A call that would have started after its deadline"""
+
+
+@contextmanager
+def deadline(at):
+    """Bound the calls made in this block (and this context) by `at`, a time.monotonic() value"""
+    token = _deadline.set(at)
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+BATCH_GET_SIZE = 100  # BatchGetItem limit per call
+BATCH_GET_ATTEMPTS = 5  # BatchGetItem calls per chunk while some keys come back unprocessed
+TRANSACTION_ATTEMPTS = 4  # TransactWriteItems tries while it only loses TransactionConflicts
+
+_EXPRESSIONS = (
+    ('KeyConditionExpression', True),
+    ('FilterExpression', False),
+    ('ConditionExpression', False),
+)
+_ITEM_ARGS = ('Key', 'Item', 'ExclusiveStartKey')
+
+
+def build_request(table_name, kwargs):
+    """Resource-style keyword arguments -> low-level request parameters"""
+    params = dict(kwargs, TableName=table_name)
+    names = dict(params.pop('ExpressionAttributeNames', {}))
+    values = {k: _attribute(v) for k, v in params.pop('ExpressionAttributeValues', {}).items()}
+
+    builder = ConditionExpressionBuilder()
+    for arg, is_key_condition in _EXPRESSIONS:
+        condition = params.get(arg)
+        if isinstance(condition, ConditionBase):
+            built = builder.build_expression(condition, is_key_condition=is_key_condition)
+            params[arg] = built.condition_expression
+            names.update(built.attribute_name_placeholders)
+            values.update({k: _attribute(v) for k, v in built.attribute_value_placeholders.items()})
+
+    for arg in _ITEM_ARGS:
+        if arg in params:
+            params[arg] = serialize(params[arg])
+    if names:
+        params['ExpressionAttributeNames'] = names
+    if values:
+        params['ExpressionAttributeValues'] = values
+    return params
+
+
+class Table:
+    """Resource-style access to one table that returns native Python values"""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def _call(self, operation, kwargs, decode=None):
+        return self.db.call(self.name, operation, build_request(self.name, kwargs), decode)
+
+    def get_item(self, **kwargs):
+        return self._call('get_item', kwargs, self._item)
+
+    def put_item(self, **kwargs):
+        return self._call('put_item', kwargs)
+
+    def update_item(self, **kwargs):
+        return self._call('update_item', kwargs, self._attributes)
+
+    def delete_item(self, **kwargs):
+        return self._call('delete_item', kwargs, self._attributes)
+
+    def query(self, **kwargs):
+        return self._call('query', kwargs, self._page)
+
+    def scan(self, **kwargs):
+        return self._call('scan', kwargs, self._page)
+
+    @staticmethod
+    def _item(resp):
+        if 'Item' in resp:
+            resp['Item'] = deserialize(resp['Item'])
+
+    @staticmethod
+    def _attributes(resp):
+        if 'Attributes' in resp:
+            resp['Attributes'] = deserialize(resp['Attributes'])
+
+    @staticmethod
+    def _page(resp):
+        resp['Items'] = [deserialize(item) for item in resp.get('Items', [])]
+        if 'LastEvaluatedKey' in resp:
+            resp['LastEvaluatedKey'] = deserialize(resp['LastEvaluatedKey'])
+
+
+class DynamoDB:
+    """One shared low-level client plus cached Table objects.
+
+    The client comes from `factory` (an aws_clients.ClientFactory, by
+    default one built from `client_kwargs`) unless one is given or assigned
+    to `client`, as the benchmarks do with their in-process fake.
+    """
+
+    def __init__(self, client=None, factory=None, **client_kwargs):
+        self._client = client
+        if factory is None and client is None:
+            factory = aws_clients.ClientFactory('dynamodb', **client_kwargs)
+        self.factory = factory
+        self._tables = {}
+        self._lock = threading.Lock()
+        self._listeners = []
+
+    @property
+    def client(self):
+        return self._client if self._client is not None else self.factory.client()
+
+    def _client_for_call(self, table_name, operation):
+        at = _deadline.get()
+        if at is None:
+            return self.client
+        remaining = at - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceeded(f"{table_name} {operation}: out of time")
+        if self._client is not None:
+            return self._client  # an assigned client has no bounded variants
+        return self.factory.client(timeout=remaining)
+
+    @client.setter
+    def client(self, client):
+        self._client = client
+
+    def add_listener(self, listener):
+        """`listener(table, operation, seconds, decode_seconds, response=None, error=None)`"""
+        self._listeners.append(listener)
+
+    def call(self, table_name, operation, params, decode=None):
+        """Run one low-level operation, decode its response in place and notify listeners"""
+        if self._listeners:
+            params.setdefault('ReturnConsumedCapacity', 'TOTAL')
+        client = self._client_for_call(table_name, operation)
+        started = time.perf_counter()
+        try:
+            resp = getattr(client, operation)(**params)
+        except Exception as e:
+            for listener in self._listeners:
+                listener(table_name, operation, time.perf_counter() - started, 0.0, error=e)
+            raise
+        received = time.perf_counter()
+        if decode is not None:
+            decode(resp)
+        for listener in self._listeners:
+            listener(table_name, operation, received - started, time.perf_counter() - received, response=resp)
+        return resp
+
+    def Table(self, name):
+        with self._lock:
+            if name not in self._tables:
+                self._tables[name] = Table(self, name)
+            return self._tables[name]
+
+    def batch_get(self, table_name, keys, consistent=True):
+        """Fetch many items of one table by key; returns the ones that exist (any order).
+
+        Keys go out 100 per BatchGetItem call, and UnprocessedKeys (throttling)
+        are retried with a short backoff, up to BATCH_GET_ATTEMPTS calls per
+        chunk; keys still unprocessed then raise a ClientError
+        (ProvisionedThroughputExceededException), like any other throttled call.
+        """
+        items = []
+        for start in range(0, len(keys), BATCH_GET_SIZE):
+            pending = {table_name: {
+                'Keys': [serialize(key) for key in keys[start:start + BATCH_GET_SIZE]],
+                'ConsistentRead': consistent,
+            }}
+            attempt = 0
+            while pending:
+                resp = self.call(table_name, 'batch_get_item', {'RequestItems': pending})
+                items.extend(deserialize(item) for item in resp.get('Responses', {}).get(table_name, []))
+                pending = resp.get('UnprocessedKeys')
+                if pending:
+                    attempt += 1
+                    if attempt >= BATCH_GET_ATTEMPTS:
+                        left = len(pending[table_name]['Keys'])
+                        raise ClientError({'Error': {
+                            'Code': 'ProvisionedThroughputExceededException',
+                            'Message': f"{left} keys still unprocessed after {attempt} BatchGetItem calls",
+                        }}, 'BatchGetItem')
+                    time.sleep(min(0.05 * 2 ** (attempt - 1), 1.0))
+        return items
+
+    def transact_write(self, operations, token=None):
+        """Run TransactWriteItems; `operations` are ('Put'|'Update'|'Delete'|'ConditionCheck',
+        table name, resource-style kwargs) tuples.
+
+        A transaction cancelled only because another one held some of its
+        items (TransactionConflict, which botocore doesn't retry) is retried
+        with a short jittered backoff, up to TRANSACTION_ATTEMPTS tries in
+        all; then, or on any other error, the ClientError is raised.
+        """
+        params = {'TransactItems': [
+            {action: build_request(table_name, kwargs)}
+            for action, table_name, kwargs in operations
+        ]}
+        if token:
+            params['ClientRequestToken'] = token
+        attempt = 0
+        while True:
+            try:
+                return self.call('(transaction)', 'transact_write_items', params)
+            except ClientError as e:
+                attempt += 1
+                if attempt >= TRANSACTION_ATTEMPTS or not conflicted(e):
+                    raise
+            time.sleep(random.uniform(0, min(0.02 * 2 ** attempt, 0.5)))
+
+
+def cancellation_reasons(error):
+    """Per-operation codes of a cancelled transaction ('None' for the ones that were fine)"""
+    if error.response['Error']['Code'] != 'TransactionCanceledException':
+        return []
+    return [reason.get('Code') for reason in error.response.get('CancellationReasons', [])]
+
+
+def conflicted(error):
+    """Whether a transaction failed only on items another transaction held, so trying again may work"""
+    reasons = cancellation_reasons(error)
+    return 'TransactionConflict' in reasons and all(r in (None, 'None', 'TransactionConflict') for r in reasons)
@@ -0,0 +1,218 @@
+"""Move a customer's records to their new email after an admin changes it.
+
+app_aws.py swaps the Users row in one transaction and records a job in the
+`EmailChanges` table (keyed by the new email). The rows that reference the
+customer are then moved by the job, a bounded batch at a time:
+
+    Bookings, Sessions  `user`        (user-created_at-index)
+    Feedback            `user_email`  (user_email-created_at-index)
+    Files               `user`        (reached through the bookings' file_id)
+
+* rows are found through the per-user indexes, never a scan
+* each step moves at most BATCH_SIZE rows, then records the index cursor
+  and the count on the job item, so a job that stops (a worker restart, a
+  deploy) resumes where it left off
+* every row update is conditional on the row still holding the old email,
+  so a step that runs twice changes nothing the second time
+* the job's `step` counter only advances from the value the step started
+  at, so if two workers pick up the same job the slower one stops
+
+app_aws.py runs a new job on a background thread of the worker that took
+the edit. Jobs that stopped are resumed by (cron, or by hand after a deploy):
+
+    python email_change.py
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+
+import changes
+import dynamo
+from create_tables import USER_INDEX, FEEDBACK_USER_INDEX
+
+logger = logging.getLogger(__name__)
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+TABLE = 'EmailChanges'
+BATCH_SIZE = 25         # rows moved per step
+STALE_AFTER = 60        # seconds without progress before the command line resumes a job
+KEEP_DONE = timedelta(days=7)  # finished jobs are kept this long (TTL), for the record
+
+# Tables moved in order: (table, per-user index, field holding the email)
+SECTIONS = (
+    ('Bookings', USER_INDEX, 'user'),
+    ('Sessions', USER_INDEX, 'user'),
+    ('Feedback', FEEDBACK_USER_INDEX, 'user_email'),
+)
+
+_pool = None
+
+
+def new_job(old_email, new_email, name):
+    """EmailChanges item for a job that has not moved anything yet"""
+    at = changes.now()
+    return {
+        'email': new_email,
+        'old_email': old_email,
+        'name': name,
+        'status': 'running',
+        'section': 0,
+        'moved': 0,
+        'step': 0,
+        'created_at': at,
+        'updated_at': at,
+    }
+
+
+def job_operations(job):
+    """Transaction operations that claim `job`'s emails and record it.
+
+    Refused (ConditionalCheckFailed) while a job into the old email is still
+    running, since its rows would be moved after this one had finished, and
+    while another job into the new email is running.
+    """
+    not_running = 'attribute_not_exists(email) OR #st = :done'
+    condition = {'ExpressionAttributeNames': {'#st': 'status'}, 'ExpressionAttributeValues': {':done': 'done'}}
+    return [
+        ('ConditionCheck', TABLE, {'Key': {'email': job['old_email']},
+                                   'ConditionExpression': not_running, **condition}),
+        ('Put', TABLE, {'Item': job, 'ConditionExpression': not_running, **condition}),
+    ]
+
+
+def _move_row(table, field, record_id, job):
+    try:
+        table.update_item(**changes.touch(dict(
+            Key={'id': record_id},
+            UpdateExpression='SET #u = :new, user_name = :name',
+            ConditionExpression='#u = :old',
+            ExpressionAttributeNames={'#u': field},
+            ExpressionAttributeValues={':new': job['email'], ':old': job['old_email'], ':name': job['name']}
+        )))
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False  # moved by an earlier run of this step
+        raise
+    return True
+
+
+def _move_file(files_table, file_id, job):
+    """Files items record their first uploader; shared content uploaded by someone else stays theirs"""
+    try:
+        files_table.update_item(
+            Key={'id': file_id},
+            UpdateExpression='SET #u = :new',
+            ConditionExpression='#u = :old',
+            ExpressionAttributeNames={'#u': 'user'},
+            ExpressionAttributeValues={':new': job['email'], ':old': job['old_email']}
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
+
+def step(db, job):
+    """Move the next batch of `job`'s rows; returns the job as saved, or None if another worker has it"""
+    table_name, index_name, field = SECTIONS[job['section']]
+    table = db.Table(table_name)
+    kwargs = {
+        'IndexName': index_name,
+        'KeyConditionExpression': Key(field).eq(job['old_email']),
+        'Limit': BATCH_SIZE,
+    }
+    if job.get('cursor_key'):
+        kwargs['ExclusiveStartKey'] = job['cursor_key']
+    resp = table.query(**kwargs)
+    items = resp.get('Items', [])
+    moved = sum(_move_row(table, field, item['id'], job) for item in items)
+    if table_name == 'Bookings':
+        for file_id in {item['file_id'] for item in items if item.get('file_id')}:
+            _move_file(db.Table('Files'), file_id, job)
+
+    section, cursor = job['section'], resp.get('LastEvaluatedKey')
+    if cursor is None:
+        section += 1
+    done = section == len(SECTIONS)
+    values = {':section': section, ':status': 'done' if done else 'running', ':at': changes.now(),
+              ':moved': moved, ':one': 1, ':step': job['step']}
+    sets = ['#sec = :section', '#st = :status', 'updated_at = :at']
+    if cursor is not None:
+        sets.append('cursor_key = :cursor')
+        values[':cursor'] = cursor
+    if done:
+        sets.append('expires_at = :expires')
+        values[':expires'] = int((datetime.now(timezone.utc) + KEEP_DONE).timestamp())
+    expression = f"SET {', '.join(sets)} ADD #moved :moved, #step :one"
+    if cursor is None:
+        expression += ' REMOVE cursor_key'
+    try:
+        return db.Table(TABLE).update_item(
+            Key={'email': job['email']},
+            UpdateExpression=expression,
+            ConditionExpression='#step = :step',
+            ExpressionAttributeNames={'#sec': 'section', '#st': 'status', '#moved': 'moved', '#step': 'step'},
+            ExpressionAttributeValues=values,
+            ReturnValues='ALL_NEW'
+        )['Attributes']
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return None
+        raise
+
+
+def run(db, job, on_step=None):
+    """Step `job` until it is done (or another worker takes it over); returns rows moved by this run"""
+    moved = 0
+    while job is not None and job['status'] != 'done':
+        before = job['moved']
+        job = step(db, job)
+        if job is not None:
+            moved += job['moved'] - before
+            if on_step is not None:
+                on_step(job)
+    return moved
+
+
+def _run_logged(db, job, on_step):
+    try:
+        moved = run(db, job, on_step)
+        logger.info("Moved %s rows from %s to %s", moved, job['old_email'], job['email'])
+    except Exception:
+        logger.exception("Email change %s -> %s stopped; `python email_change.py` resumes it",
+                         job['old_email'], job['email'])
+
+
+def start(db, job, on_step=None):
+    """Run `job` on this process's background thread; returns the Future"""
+    global _pool
+    if _pool is None:
+        _pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='email-change')
+    return _pool.submit(_run_logged, db, job, on_step)
+
+
+def stalled(db, older_than=STALE_AFTER):
+    """Running jobs that have not advanced for `older_than` seconds (the table only holds jobs, so a scan is cheap)"""
+    cutoff = changes.format_time(datetime.now(timezone.utc) - timedelta(seconds=older_than))
+    kwargs = {}
+    jobs = []
+    while True:
+        resp = db.Table(TABLE).scan(**kwargs)
+        for job in resp.get('Items', []):
+            if job['status'] == 'running' and job['updated_at'] < cutoff:
+                jobs.append(job)
+        if 'LastEvaluatedKey' not in resp:
+            return jobs
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    db = dynamo.DynamoDB(region_name=REGION)
+    jobs = stalled(db)
+    for job in jobs:
+        print(f"{job['old_email']} -> {job['email']}: moved {run(db, job)} more rows.")
+    print(f"Resumed {len(jobs)} email changes.")
@@ -0,0 +1,475 @@
+"""Indexed in-memory store used by app.py (STORE_BACKEND=memory).
+
+Every table keeps an id -> record map plus secondary indexes on the owning
+user and on status, so the routes can look a record up in O(1) and list a
+customer's or a status's rows in O(k) instead of walking every row. Writes
+are also recorded in a change log ordered by time, for /admin/changes, and
+accounts in a sorted index of name and email words, for /admin/search.
+
+Records use __slots__ (they are the bulk of the memory at 1M rows) but still
+answer `record['field']` and `record.get('field')`, so templates and helpers
+that were written for plain dicts keep working.
+"""
+import bisect
+import contextlib
+import itertools
+import threading
+from collections import Counter, defaultdict
+
+import availability
+import changes
+import ratings
+import search
+from stats import status_counter
+
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, **fields):
+        for name in self.__slots__:
+            setattr(self, name, fields.pop(name, None))
+        if fields:
+            raise TypeError(f"Unknown fields for {type(self).__name__}: {', '.join(fields)}")
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def get(self, name, default=None):
+        value = getattr(self, name, None)
+        return default if value is None else value
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.to_dict()!r})"
+
+
+class Booking(Record):
+    """Retouching request (upload)"""
+    __slots__ = ('id', 'user', 'service', 'filename', 'sha256', 'storage_key', 'status', 'created_at', 'updated_at')
+
+
+class SessionBooking(Record):
+    """Photography session (calendar)"""
+    __slots__ = ('id', 'user', 'user_name', 'service', 'photographer', 'date', 'time', 'status', 'updated_at')
+
+
+class Feedback(Record):
+    """Customer review"""
+    __slots__ = ('id', 'user_name', 'user_email', 'service', 'photographer', 'rating', 'comment', 'updated_at')
+
+
+class ChangeLog:
+    """When each record was last written or deleted, oldest first.
+
+    A write moves its record to the end, so the changes after a cursor are
+    read backwards from the end in O(k), however many records there are.
+    """
+
+    def __init__(self):
+        self.entries = {}  # (section, id) -> (updated_at, deleted)
+        self._last = ''
+        self._lock = threading.Lock()
+
+    def touch(self, section, record_id, deleted=False):
+        with self._lock:
+            at = self._last = max(changes.now(), self._last)  # never goes back, so entries stay sorted
+            self.entries.pop((section, record_id), None)
+            self.entries[(section, record_id)] = (at, deleted)
+            # Nobody can ask for anything older than the horizon any more
+            horizon = changes.horizon()
+            oldest = next(iter(self.entries))
+            while self.entries[oldest][0] < horizon:
+                del self.entries[oldest]
+                oldest = next(iter(self.entries))
+            return at
+
+    def since(self, cursor, limit=None):
+        """(updated_at, section, id, deleted) for every write after `cursor`, oldest first.
+
+        Stops after `limit` + 1 entries (the newest ones), enough to tell
+        the caller there are more than it wants.
+        """
+        found = []
+        with self._lock:
+            for (section, record_id), (at, deleted) in reversed(self.entries.items()):
+                if at <= cursor or (limit is not None and len(found) > limit):
+                    break
+                found.append((at, section, record_id, deleted))
+        found.reverse()
+        return found
+
+
+class Table:
+    """Rows of one record type with id, user and status indexes.
+
+    `date_field` adds a sorted index by day (the first ten characters, so a
+    timestamp works too) and `index_fields` an index per other field.
+    The index buckets are dicts (not sets) so listings come back in
+    insertion order, matching what the old list-based code displayed.
+    Writes are stamped with `updated_at` and recorded in `log` under `section`.
+    """
+
+    def __init__(self, section, log, user_field='user', first_id=1, date_field=None, index_fields=()):
+        self.section = section
+        self.log = log
+        self.user_field = user_field
+        self.date_field = date_field
+        self.rows = {}
+        self.by_user = defaultdict(dict)
+        self.by_status = defaultdict(dict)
+        self.by_field = {field: defaultdict(dict) for field in index_fields}
+        self.by_date = {}
+        self.dates = []  # sorted keys of by_date, for range lookups
+        self._ids = itertools.count(first_id)
+
+    def next_id(self):
+        return next(self._ids)
+
+    def add(self, record):
+        if record.id is None:
+            record.id = self.next_id()
+        record.updated_at = self.log.touch(self.section, record.id)
+        self.rows[record.id] = record
+        self.by_user[getattr(record, self.user_field)][record.id] = record
+        status = getattr(record, 'status', None)
+        if status is not None:
+            self.by_status[status][record.id] = record
+        for field, index in self.by_field.items():
+            index[getattr(record, field)][record.id] = record
+        if self.date_field:
+            date = self._day(record)
+            if date not in self.by_date:
+                bisect.insort(self.dates, date)
+                self.by_date[date] = {}
+            self.by_date[date][record.id] = record
+        return record
+
+    def _day(self, record):
+        return (getattr(record, self.date_field) or '')[:10]
+
+    def get(self, record_id):
+        return self.rows.get(record_id)
+
+    def all(self):
+        return list(self.rows.values())
+
+    def having(self, field, value):
+        bucket = self.by_field[field].get(value)
+        return list(bucket.values()) if bucket else []
+
+    def for_user(self, user):
+        bucket = self.by_user.get(user)
+        return list(bucket.values()) if bucket else []
+
+    def with_status(self, status):
+        bucket = self.by_status.get(status)
+        return list(bucket.values()) if bucket else []
+
+    def on_date(self, date):
+        bucket = self.by_date.get(date)
+        return list(bucket.values()) if bucket else []
+
+    def between(self, first, last):
+        """Records dated first..last inclusive, in date order (O(log n + k))"""
+        lo = bisect.bisect_left(self.dates, first)
+        hi = bisect.bisect_right(self.dates, last)
+        return [record for date in self.dates[lo:hi] for record in self.by_date[date].values()]
+
+    def reassign(self, old_user, new_user, user_name=None):
+        """Move every record of `old_user` to `new_user` (O(k)); returns how many moved"""
+        bucket = self.by_user.pop(old_user, None)
+        if not bucket:
+            return 0
+        target = self.by_user[new_user]
+        for record in bucket.values():
+            setattr(record, self.user_field, new_user)
+            if user_name is not None and 'user_name' in record.__slots__:
+                record.user_name = user_name
+            record.updated_at = self.log.touch(self.section, record.id)
+            target[record.id] = record
+        return len(bucket)
+
+    def set_status(self, record_id, status):
+        """Change a record's status and move it between status buckets"""
+        record = self.rows.get(record_id)
+        if record is None or getattr(record, 'status', None) == status:
+            return record
+        self._unindex_status(record)
+        record.status = status
+        record.updated_at = self.log.touch(self.section, record.id)
+        if status is not None:
+            self.by_status[status][record.id] = record
+        return record
+
+    def delete(self, record_id):
+        record = self.rows.pop(record_id, None)
+        if record is None:
+            return None
+        self.log.touch(self.section, record.id, deleted=True)
+        user_bucket = self.by_user[getattr(record, self.user_field)]
+        user_bucket.pop(record.id, None)
+        if not user_bucket:
+            del self.by_user[getattr(record, self.user_field)]
+        self._unindex_status(record)
+        for field, index in self.by_field.items():
+            bucket = index[getattr(record, field)]
+            bucket.pop(record.id, None)
+            if not bucket:
+                del index[getattr(record, field)]
+        if self.date_field:
+            date = self._day(record)
+            bucket = self.by_date[date]
+            bucket.pop(record.id, None)
+            if not bucket:
+                del self.by_date[date]
+                del self.dates[bisect.bisect_left(self.dates, date)]
+        return record
+
+    def _unindex_status(self, record):
+        status = getattr(record, 'status', None)
+        if status is None:
+            return
+        bucket = self.by_status[status]
+        bucket.pop(record.id, None)
+        if not bucket:
+            del self.by_status[status]
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class Feedbacks(Table):
+    """Feedback rows plus the rating counts they add up to (see ratings.py)"""
+
+    def __init__(self, log):
+        super().__init__('feedback', log, user_field='user_email')
+        self.ratings = Counter()
+        self._ratings_lock = threading.Lock()
+
+    def add(self, record):
+        record = super().add(record)
+        with self._ratings_lock:
+            self.ratings.update(ratings.added(record))
+        return record
+
+    def delete(self, record_id):
+        record = super().delete(record_id)
+        if record is not None:
+            with self._ratings_lock:
+                self.ratings.update(ratings.removed(record))
+        return record
+
+    def counts(self):
+        with self._ratings_lock:
+            return {name: n for name, n in self.ratings.items() if n > 0}
+
+    def recount(self):
+        with self._ratings_lock:
+            self.ratings = Counter()
+            for record in self.all():
+                self.ratings.update(ratings.added(record))
+        return self.counts()
+
+
+class Users:
+    """Accounts keyed by email, with a sorted (token, email) index for prefix search (see search.py)"""
+
+    def __init__(self, log, accounts=None):
+        self.log = log
+        self.rows = {email: dict(data) for email, data in (accounts or {}).items()}
+        self.terms = sorted((token, email) for email, data in self.rows.items()
+                            for token in search.tokens(email, data['name']))
+        self._lock = threading.Lock()
+
+    def _index(self, email, name):
+        for token in search.tokens(email, name):
+            bisect.insort(self.terms, (token, email))
+
+    def _unindex(self, email, name):
+        for token in search.tokens(email, name):
+            i = bisect.bisect_left(self.terms, (token, email))
+            if i < len(self.terms) and self.terms[i] == (token, email):
+                del self.terms[i]
+
+    def get(self, email):
+        return self.rows.get(email)
+
+    def add(self, email, name, password, role='user'):
+        """Create an account; False if the email is taken"""
+        with self._lock:
+            if email in self.rows:
+                return False
+            self.rows[email] = {'name': name, 'password': password, 'role': role,
+                                'updated_at': self.log.touch('users', email)}
+            self._index(email, name)
+            return True
+
+    def find(self, prefix, limit=search.MAX_RESULTS + 1):
+        """Emails of the accounts with a name word or email starting with `prefix` (O(log n + k))"""
+        found = {}
+        with self._lock:
+            i = bisect.bisect_left(self.terms, (prefix,))
+            while i < len(self.terms) and self.terms[i][0].startswith(prefix) and len(found) < limit:
+                found[self.terms[i][1]] = None
+                i += 1
+        return list(found)
+
+    def update(self, old_email, new_email, name):
+        """Rename an account; False if it is gone or the new email is taken"""
+        with self._lock:
+            if old_email not in self.rows or (new_email != old_email and new_email in self.rows):
+                return False
+            data = self.rows.pop(old_email)
+            if new_email != old_email:
+                self.log.touch('users', old_email, deleted=True)
+            self._unindex(old_email, data['name'])
+            self._index(new_email, name)
+            data['name'] = name
+            data['updated_at'] = self.log.touch('users', new_email)
+            self.rows[new_email] = data
+            return True
+
+    def delete(self, email):
+        with self._lock:
+            data = self.rows.pop(email, None)
+            if data is not None:
+                self.log.touch('users', email, deleted=True)
+                self._unindex(email, data['name'])
+
+    def all(self):
+        return dict(self.rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+
+class Store:
+    """All of app.py's tables"""
+
+    def __init__(self, accounts=None):
+        self.changes = ChangeLog()
+        self.users = Users(self.changes, accounts)
+        self.bookings = Table('bookings', self.changes, first_id=1, date_field='created_at')
+        self.sessions = Table('sessions', self.changes, first_id=1000, date_field='date',
+                              index_fields=('photographer',))
+        self.feedbacks = Feedbacks(self.changes)
+        self.schedule = availability.Schedule()  # photographer time held by sessions
+        self.blobs = {}  # sha256 -> {'key', 'size', 'refs'} of each stored upload
+        self._blob_lock = threading.Lock()
+
+    def batch(self):
+        """Group several writes (a no-op here; every write is already applied in place)"""
+        return contextlib.nullcontext()
+
+    def stats(self):
+        """Admin counters (see stats.py), straight from the index sizes"""
+        counts = {'users': len(self.users), 'bookings': len(self.bookings),
+                  'sessions': len(self.sessions), 'feedback': len(self.feedbacks)}
+        for kind, table in (('bookings', self.bookings), ('sessions', self.sessions)):
+            for status, bucket in list(table.by_status.items()):
+                counts[status_counter(kind, status)] = len(bucket)
+        return counts
+
+    def rebuild_stats(self):
+        return self.stats()  # nothing is materialized, so nothing can drift
+
+    def ratings(self):
+        """Rating counters (see ratings.py), kept as feedback is added and deleted"""
+        return self.feedbacks.counts()
+
+    def rebuild_ratings(self):
+        return self.feedbacks.recount()
+
+    def update_user(self, old_email, new_email, name):
+        """Rename an account; a new email takes its bookings, sessions and feedback along.
+
+        False if the account is gone or the new email is taken.
+        """
+        if not self.users.update(old_email, new_email, name):
+            return False
+        if new_email != old_email:
+            for table in (self.bookings, self.sessions, self.feedbacks):
+                table.reassign(old_email, new_email, name)
+        return True
+
+    def search(self, filters):
+        """Rows matching search.parse() `filters`, unsorted, at most MAX_RESULTS + 1.
+
+        Starts from the narrowest index the filters allow: the customer's
+        rows, a photographer's sessions, a date range, then a status.
+        """
+        section = filters['section']
+        if section == 'users':
+            accounts = ((email, self.users.get(email)) for email in self.users.find(filters['q']))
+            return [{'email': email, **account} for email, account in accounts if account is not None]
+        table = self.bookings if section == 'bookings' else self.sessions
+        if filters['q']:
+            rows = (record for email in self.users.find(filters['q']) for record in table.for_user(email))
+        elif section == 'sessions' and filters['photographer']:
+            rows = table.having('photographer', filters['photographer'])
+        elif filters['first'] or filters['last']:
+            rows = table.between(*search.date_range(filters))
+        else:
+            rows = table.with_status(filters['status'])
+        return list(itertools.islice((record for record in rows if search.matches(section, record, filters)),
+                                     search.MAX_RESULTS + 1))
+
+    def changed_since(self, cursor, limit=changes.LIMIT):
+        """(updated_at, section, id, record) for every write after `cursor`, oldest first; record None if deleted"""
+        tables = {'users': self.users, 'bookings': self.bookings, 'sessions': self.sessions, 'feedback': self.feedbacks}
+        return [(at, section, record_id, None if deleted else tables[section].get(record_id))
+                for at, section, record_id, deleted in self.changes.since(cursor, limit)]
+
+    def add_upload(self, record, size, storage_key=None):
+        """Add a retouch booking that references its upload by content hash.
+
+        Reuses the stored copy of the content when there is one; otherwise
+        records `storage_key`, which the caller has just written. Returns None
+        when neither exists, so the caller stores the bytes and calls again.
+        """
+        with self._blob_lock:
+            blob = self.blobs.get(record.sha256)
+            if blob is not None:
+                blob['refs'] += 1
+            elif storage_key is None:
+                return None
+            else:
+                blob = self.blobs[record.sha256] = {'key': storage_key, 'size': size, 'refs': 1}
+            record.storage_key = blob['key']
+            return self.bookings.add(record)
+
+    def delete_booking(self, booking_id, delete_blob):
+        """Delete a booking; `delete_blob(key, sha256)` runs, outside the lock, if it held the last reference"""
+        unreferenced = None
+        with self._blob_lock:
+            record = self.bookings.delete(booking_id)
+            if record is not None and record.storage_key:
+                blob = self.blobs[record.sha256]
+                blob['refs'] -= 1
+                if blob['refs'] <= 0:
+                    unreferenced = self.blobs.pop(record.sha256)
+        if unreferenced is not None:
+            delete_blob(unreferenced['key'], record.sha256)
+        return record
+
+    def reserve_session(self, record, start, end):
+        """Add a session unless it overlaps its photographer's other sessions"""
+        record.id = self.sessions.next_id()
+        if not self.schedule.reserve(record.photographer, record.date, start, end, record.id):
+            return None
+        return self.sessions.add(record)
+
+    def cancel_session(self, session_id):
+        record = self.sessions.set_status(session_id, 'Cancelled')
+        if record is not None:
+            self.schedule.release(record.photographer, record.date, record.id)
+        return record
+
+    def free_slots(self, photographer, dates, duration):
+        return self.schedule.free_slots(photographer, dates, duration)
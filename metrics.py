@@ -0,0 +1,257 @@
+"""Request and DynamoDB instrumentation for app_aws.py, exposed on /metrics.
+
+What is recorded:
+
+* every route           - http_request_duration_seconds{route, method, status}
+* every template render - template_render_seconds{template}
+* every table operation - dynamodb_request_seconds / dynamodb_decode_seconds
+                          {table, operation}, plus ConsumedCapacity and the
+                          item counts queries and scans return
+* named code sections   - section_seconds{section}, via `timed()`
+
+Metrics live in the worker process and are rendered in the Prometheus text
+format, so with several gunicorn workers each scrape sees one worker (add
+the pod/worker as a target label, or scrape each worker port).
+
+Requests are recorded when their context is torn down, so a request that
+raised is counted too, as status 500.
+
+When SLOW_REQUEST_MS is set, any request slower than that is logged with
+the per-call breakdown (each DynamoDB call, template and section, in order).
+
+/metrics answers only scrapers: with METRICS_TOKEN set, requests carrying
+`Authorization: Bearer <token>`; without it, requests made straight from a
+loopback or private address (not forwarded by a proxy or load balancer).
+"""
+import bisect
+import contextvars
+import hmac
+import ipaddress
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Calls made while handling the current request: (kind, name, seconds, detail)
+_calls = contextvars.ContextVar('metrics_calls', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+class Counter:
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_labels(self.labelnames, key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels[n] for n in self.labelnames)
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if i < len(self.buckets):
+                series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', bound)])} {cumulative}")
+                lines.append(f"{self.name}_bucket{_labels(self.labelnames, key, [('le', '+Inf')])} {series[-1]}")
+                lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {series[-2]}")
+                lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, *args, **kwargs):
+        metric = Counter(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, *args, **kwargs):
+        metric = Histogram(*args, **kwargs)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        return '\n'.join(line for metric in self._metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
+
+REQUEST_SECONDS = registry.histogram(
+    'http_request_duration_seconds', "Time spent handling a request", ('route', 'method', 'status'))
+TEMPLATE_SECONDS = registry.histogram(
+    'template_render_seconds', "Time spent rendering a template", ('template',))
+SECTION_SECONDS = registry.histogram(
+    'section_seconds', "Time spent in an instrumented code section", ('section',))
+DYNAMODB_SECONDS = registry.histogram(
+    'dynamodb_request_seconds', "DynamoDB round-trip time", ('table', 'operation'))
+DYNAMODB_DECODE_SECONDS = registry.histogram(
+    'dynamodb_decode_seconds', "Time spent decoding DynamoDB responses", ('table', 'operation'))
+DYNAMODB_ERRORS = registry.counter(
+    'dynamodb_errors_total', "DynamoDB calls that raised", ('table', 'operation', 'code'))
+DYNAMODB_CAPACITY = registry.counter(
+    'dynamodb_consumed_capacity_units_total', "ConsumedCapacity reported by DynamoDB", ('table', 'operation'))
+DYNAMODB_ITEMS = registry.counter(
+    'dynamodb_items_returned_total', "Items returned by queries and scans", ('table', 'operation'))
+DYNAMODB_SCANNED = registry.counter(
+    'dynamodb_items_scanned_total', "Items read by queries and scans before filtering", ('table', 'operation'))
+
+
+def _record(kind, name, seconds, detail=''):
+    calls = _calls.get()
+    if calls is not None:
+        calls.append((kind, name, seconds, detail))
+
+
+@contextmanager
+def timed(section):
+    """Time a block of code as section_seconds{section}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        SECTION_SECONDS.observe(elapsed, section=section)
+        _record('section', section, elapsed)
+
+
+def observe_dynamodb(table, operation, seconds, decode_seconds, response=None, error=None):
+    """dynamo.DynamoDB listener: one finished (or failed) table operation"""
+    DYNAMODB_SECONDS.observe(seconds, table=table, operation=operation)
+    if error is not None:
+        code = getattr(error, 'response', {}).get('Error', {}).get('Code', type(error).__name__)
+        DYNAMODB_ERRORS.inc(table=table, operation=operation, code=code)
+        _record('dynamodb', f"{table}.{operation}", seconds, f"error={code}")
+        return
+    DYNAMODB_DECODE_SECONDS.observe(decode_seconds, table=table, operation=operation)
+
+    capacity = response.get('ConsumedCapacity')
+    for entry in capacity if isinstance(capacity, list) else [capacity] if capacity else []:
+        DYNAMODB_CAPACITY.inc(entry.get('CapacityUnits', 0), table=entry.get('TableName', table), operation=operation)
+    detail = ''
+    if 'Count' in response:
+        DYNAMODB_ITEMS.inc(response['Count'], table=table, operation=operation)
+        DYNAMODB_SCANNED.inc(response.get('ScannedCount', response['Count']), table=table, operation=operation)
+        detail = f"items={response['Count']}"
+    _record('dynamodb', f"{table}.{operation}", seconds + decode_seconds, detail)
+
+
+def _internal(remote_addr, forwarded):
+    """Whether a request came straight from this host or the private network"""
+    if forwarded or not remote_addr:
+        return False
+    try:
+        address = ipaddress.ip_address(remote_addr)
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+def init_app(app, db=None, slow_request_ms=None, token=None):
+    """Time every request and template render of `app` (and `db`'s calls), and add /metrics.
+
+    `token` is the bearer token /metrics requires; without one it only
+    answers internal addresses.
+    """
+    from flask import Response, request, template_rendered, before_render_template
+
+    if db is not None:
+        db.add_listener(observe_dynamodb)
+    render_started = threading.local()
+
+    @before_render_template.connect_via(app)
+    def _render_start(sender, template, context, **extra):
+        render_started.at = time.perf_counter()
+
+    @template_rendered.connect_via(app)
+    def _render_done(sender, template, context, **extra):
+        elapsed = time.perf_counter() - getattr(render_started, 'at', time.perf_counter())
+        TEMPLATE_SECONDS.observe(elapsed, template=template.name)
+        _record('template', template.name, elapsed)
+
+    @app.before_request
+    def _start_request():
+        request.environ['metrics.started'] = time.perf_counter()
+        request.environ['metrics.token'] = _calls.set([])
+
+    @app.after_request
+    def _response_status(response):
+        request.environ['metrics.status'] = response.status_code
+        return response
+
+    @app.teardown_request
+    def _finish_request(exc):
+        # Runs for every request, also the ones that raised and never reached after_request
+        started = request.environ.pop('metrics.started', None)
+        calls_token = request.environ.pop('metrics.token', None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        status = 500 if exc is not None else request.environ.get('metrics.status', 500)
+        route = request.url_rule.rule if request.url_rule else '(unmatched)'
+        REQUEST_SECONDS.observe(elapsed, route=route, method=request.method, status=status)
+        calls = _calls.get() or []
+        if slow_request_ms is not None and elapsed * 1000 >= slow_request_ms:
+            breakdown = '\n'.join(
+                f"  {kind:<9} {name:<40} {seconds * 1000:8.1f}ms {detail}" for kind, name, seconds, detail in calls)
+            app.logger.warning("Slow request %s %s -> %s in %.1fms (%d calls)\n%s", request.method,
+                               request.path, status, elapsed * 1000, len(calls), breakdown)
+        if calls_token is not None:
+            _calls.reset(calls_token)
+
+    @app.route('/metrics')
+    def metrics():
+        if token:
+            allowed = hmac.compare_digest(request.headers.get('Authorization', ''), f"Bearer {token}")
+        else:
+            allowed = _internal(request.remote_addr, request.headers.get('X-Forwarded-For'))
+        if not allowed:
+            return "Forbidden", 403
+        return Response(registry.render(), mimetype='text/plain; version=0.0.4')
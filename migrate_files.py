@@ -0,0 +1,94 @@
+"""Move legacy base64 `data` attributes out of the Files table into the blob store.
+
+    python migrate_files.py            # migrate everything
+    python migrate_files.py --dry-run  # just report what would move
+
+Each item is copied to the blob store first and then updated with a
+condition on `data` still being present, so the script is safe to stop and
+re-run: already-migrated items are skipped, and a crash between the two steps
+only leaves an orphaned blob that the next run overwrites.
+"""
+import argparse
+import base64
+import io
+import os
+
+import boto3
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+
+import blob_store as blobs
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'jpeg': 'image/jpeg',
+    'png': 'image/png',
+    'gif': 'image/gif',
+    'pdf': 'application/pdf',
+}
+
+
+def legacy_items(files_table):
+    """Yield Files items that still carry inline base64 data, one page at a time"""
+    kwargs = {'FilterExpression': Attr('data').exists()}
+    while True:
+        resp = files_table.scan(**kwargs)
+        yield from resp.get('Items', [])
+        if 'LastEvaluatedKey' not in resp:
+            return
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def migrate_item(files_table, store, item):
+    content_type = CONTENT_TYPES.get(item.get('file_type'), 'application/octet-stream')
+    blob = store.put_stream(
+        f"{item['id']}/{item['filename']}",
+        io.BytesIO(base64.b64decode(item['data'])),
+        content_type
+    )
+    files_table.update_item(
+        Key={'id': item['id']},
+        UpdateExpression="SET storage_key = :k, sha256 = :h, content_type = :t, #sz = :s REMOVE #d",
+        ConditionExpression=Attr('data').exists(),
+        ExpressionAttributeNames={'#d': 'data', '#sz': 'size'},
+        ExpressionAttributeValues={
+            ':k': blob.key,
+            ':h': blob.sha256,
+            ':t': content_type,
+            ':s': blob.size,
+        }
+    )
+    return blob
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--dry-run', action='store_true', help="list items without moving them")
+    args = parser.parse_args()
+
+    files_table = boto3.resource('dynamodb', region_name=REGION).Table('Files')
+    store = blobs.from_env()
+
+    moved = skipped = 0
+    for item in legacy_items(files_table):
+        if args.dry_run:
+            print(f"would migrate {item['id']} ({item['filename']})")
+            moved += 1
+            continue
+        try:
+            blob = migrate_item(files_table, store, item)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            skipped += 1  # migrated concurrently by another run
+            continue
+        moved += 1
+        print(f"migrated {item['id']} -> {blob.key} ({blob.size} bytes)")
+
+    print(f"Done: {moved} migrated, {skipped} skipped.")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,345 @@
+"""Booking notifications for app_aws.py, sent off the request path.
+
+Routes call `notifier.notify(...)`, which only puts the event on a bounded
+in-process queue. Background dispatcher threads drain the queue. They gather
+up to BATCH_SIZE events, waiting at most `linger` seconds for a burst to
+fill a batch, and send each batch with one publish call (SNS PublishBatch
+takes up to 10 messages). Entries that fail are retried with exponential
+backoff.
+
+Events that cannot be delivered are appended to a spill file in
+NOTIFY_SPILL_DIR. This covers a full queue, retries running out, and events
+still queued when the worker exits. A worker claims the spill files it
+finds and sends them when it starts (including ones a worker died while
+replaying), and again after a batch goes out, at most every
+`replay_interval` seconds, so events spilled during an outage follow once
+publishing works again instead of waiting for a restart. A file another
+live worker still appends to is left to that worker. A batch still being
+sent when the exit timeout runs out is spilled as well, so delivery is
+at-least-once.
+
+Backends:
+
+* SNSPublisher   - SNS_TOPIC_ARN is set
+* LocalPublisher - NOTIFY_FILE is set: appends each message to a JSON-lines
+                   file, a stand-in for SNS in development and tests
+* neither        - notifications are switched off
+"""
+import atexit
+import glob
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+
+import boto3
+
+logger = logging.getLogger(__name__)
+
+BATCH_SIZE = 10        # SNS PublishBatch limit
+QUEUE_SIZE = 1000
+MAX_ATTEMPTS = 5
+BACKOFF = 0.5          # seconds before the first retry; doubles each attempt
+REPLAY_INTERVAL = 30   # seconds between spill file checks while batches go out
+
+_STOP = object()
+
+
+class SNSPublisher:
+    """Publish batches to one SNS topic; returns the ids worth retrying"""
+
+    def __init__(self, topic_arn, client=None, region=None):
+        self.topic_arn = topic_arn
+        self.client = client or boto3.client('sns', region_name=region)
+
+    def __call__(self, events):
+        resp = self.client.publish_batch(
+            TopicArn=self.topic_arn,
+            PublishBatchRequestEntries=[{
+                'Id': event['id'],
+                'Subject': event['subject'][:100],
+                'Message': json.dumps(event, sort_keys=True),
+                'MessageAttributes': {'event_type': {'DataType': 'String', 'StringValue': event['type']}},
+            } for event in events]
+        )
+        retry = set()
+        for failure in resp.get('Failed', []):
+            if failure.get('SenderFault'):
+                # a malformed message will never go through; don't retry it
+                logger.error("SNS rejected notification %s: %s", failure['Id'], failure.get('Message'))
+            else:
+                retry.add(failure['Id'])
+        return retry
+
+
+class LocalPublisher:
+    """Append every message to a JSON-lines file instead of SNS"""
+
+    def __init__(self, path):
+        self.path = path
+        self.batches = 0
+        self._lock = threading.Lock()
+
+    def __call__(self, events):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                for event in events:
+                    f.write(json.dumps(event, sort_keys=True) + '\n')
+            self.batches += 1
+        return set()
+
+
+class Notifier:
+    def __init__(self, publish=None, spill_dir='notify_spool', workers=1, linger=0.5,
+                 maxsize=QUEUE_SIZE, max_attempts=MAX_ATTEMPTS, backoff=BACKOFF,
+                 replay_interval=REPLAY_INTERVAL):
+        self.publish = publish
+        self.spill_dir = spill_dir
+        self.workers = workers
+        self.linger = linger
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.replay_interval = replay_interval
+        self.stats = {'queued': 0, 'sent': 0, 'retried': 0, 'spilled': 0, 'replayed': 0}
+        self._queue = queue.Queue(maxsize)
+        self._threads = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self._pid = None
+        self._inflight = {}  # dispatcher thread -> batch it is sending
+        self._next_replay = 0.0  # time.monotonic() of the next spill file check
+        self._replaying = threading.Lock()
+
+    # --- Producer side (request threads) ---
+
+    def notify(self, event_type, subject, **details):
+        """Queue one event; never blocks and never raises into the request"""
+        if self.publish is None:
+            return
+        event = {
+            'id': uuid.uuid4().hex,
+            'type': event_type,
+            'subject': subject,
+            'details': details,
+            'at': datetime.now(timezone.utc).isoformat(),
+        }
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(event)
+            self._count('queued')
+        except queue.Full:
+            logger.warning("Notification queue full; spilling %s", event_type)
+            self._spill([event])
+
+    def _ensure_started(self):
+        # Threads don't survive fork, so (re)start them in whichever process notifies
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            self._pid = os.getpid()
+            self._threads = [
+                threading.Thread(target=self._run, args=(n == 0,), name=f'notify-{n}', daemon=True)
+                for n in range(self.workers)
+            ]
+            for t in self._threads:
+                t.start()
+
+    def _count(self, name, n=1):
+        with self._lock:
+            self.stats[name] += n
+
+    # --- Dispatcher threads ---
+
+    def _run(self, replay):
+        if replay:
+            self._maybe_replay()
+        while True:
+            event = self._queue.get()
+            if event is _STOP:
+                return
+            batch = [event]
+            deadline = time.monotonic() + self.linger
+            stop = False
+            while len(batch) < BATCH_SIZE:
+                try:
+                    event = self._queue.get(timeout=max(0, deadline - time.monotonic()))
+                except queue.Empty:
+                    break
+                if event is _STOP:
+                    stop = True
+                    break
+                batch.append(event)
+            if self._send(batch) and not stop:
+                self._maybe_replay()  # publishing works, so spilled events can go too
+            if stop:
+                return
+
+    def _send(self, batch):
+        """Deliver one batch; True if all of it went out"""
+        me = threading.current_thread()
+        self._inflight[me] = batch
+        try:
+            return self._deliver(batch)
+        finally:
+            self._inflight.pop(me, None)
+
+    def _deliver(self, batch):
+        pending = batch
+        for attempt in range(self.max_attempts):
+            try:
+                retry = self.publish(pending)
+            except Exception as e:
+                logger.warning("Publishing %d notifications failed: %s", len(pending), e)
+                retry = {event['id'] for event in pending}
+            self._count('sent', len(pending) - len(retry))
+            pending = [event for event in pending if event['id'] in retry]
+            if not pending:
+                return True
+            if attempt + 1 < self.max_attempts and not self._stopping.is_set():
+                self._count('retried', len(pending))
+                delay = self.backoff * 2 ** attempt
+                time.sleep(delay + random.uniform(0, delay / 2))
+            else:
+                break
+        self._spill(pending)
+        return False
+
+    # --- Spill files ---
+
+    def _spill(self, events):
+        os.makedirs(self.spill_dir, exist_ok=True)
+        path = os.path.join(self.spill_dir, f"spill-{os.getpid()}.jsonl")
+        with self._lock:
+            with open(path, 'a', encoding='utf-8') as f:
+                for event in events:
+                    f.write(json.dumps(event, sort_keys=True) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self.stats['spilled'] += len(events)
+
+    def _maybe_replay(self):
+        """Replay spill files unless another thread is, or the last check was under replay_interval ago"""
+        if time.monotonic() < self._next_replay or not self._replaying.acquire(blocking=False):
+            return
+        try:
+            self._next_replay = time.monotonic() + self.replay_interval
+            self._replay_spilled()
+        finally:
+            self._replaying.release()
+
+    def _replay_spilled(self):
+        """Send events spilled by this, earlier or crashed workers.
+
+        A file is claimed by renaming it to `<name>.<pid>.replaying` (atomic:
+        only one worker gets each file), and removed only once every batch
+        in it has been sent or spilled again. Another live worker's own
+        spill file is left to it, as it may still be appending. A claim
+        whose worker died mid-replay is taken over; if sending raises, the
+        file goes back under a spill-*.jsonl name for the next worker to find.
+        """
+        pattern = os.path.join(self.spill_dir, 'spill-*.jsonl')
+        spilled = [path for path in glob.glob(pattern) if not _alive(_writer(path))]
+        abandoned = [path for path in glob.glob(pattern + '.*.replaying') if not _alive(_claimant(path))]
+        for path in sorted(spilled + abandoned):
+            claimed = f"{_unclaimed(path)}.{os.getpid()}.replaying"
+            try:
+                with self._lock:  # not while _spill is appending to our own file
+                    os.rename(path, claimed)
+            except OSError:
+                continue  # another worker got it first
+            try:
+                with open(claimed, encoding='utf-8') as f:
+                    events = [json.loads(line) for line in f if line.strip()]
+                for start in range(0, len(events), BATCH_SIZE):
+                    self._send(events[start:start + BATCH_SIZE])
+            except Exception as e:
+                logger.error("Replaying %s failed, leaving it for the next worker: %s", claimed, e)
+                os.rename(claimed, os.path.join(self.spill_dir, f"spill-{os.getpid()}-{uuid.uuid4().hex[:8]}.jsonl"))
+                return
+            self._count('replayed', len(events))
+            os.remove(claimed)
+
+    # --- Shutdown ---
+
+    def close(self, timeout=5):
+        """Flush what can be sent within `timeout`, spill the rest"""
+        if self._pid != os.getpid():
+            return
+        self._stopping.set()
+        for _ in self._threads:
+            try:
+                self._queue.put_nowait(_STOP)
+            except queue.Full:
+                break
+        deadline = time.monotonic() + timeout
+        for t in self._threads:
+            t.join(max(0, deadline - time.monotonic()))
+        leftover = [event for t in self._threads if t.is_alive() for event in self._inflight.get(t, ())]
+        while True:
+            try:
+                event = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if event is not _STOP:
+                leftover.append(event)
+        if leftover:
+            self._spill(leftover)
+
+
+def _writer(path):
+    """pid of the worker that appends to a `spill-<pid>.jsonl` file (None for one put back after a failed replay)"""
+    stem = os.path.basename(path)[len('spill-'):-len('.jsonl')]
+    return int(stem) if stem.isdigit() else None
+
+
+def _claimant(path):
+    """pid in a `<name>.<pid>.replaying` file name"""
+    try:
+        return int(path.rsplit('.', 2)[1])
+    except ValueError:
+        return None
+
+
+def _unclaimed(path):
+    """The spill file name a claimed file had"""
+    return path.rsplit('.', 2)[0] if path.endswith('.replaying') else path
+
+
+def _alive(pid):
+    """Whether another process with this pid is running (ours replays only what it claims itself)"""
+    if pid is None or pid == os.getpid():
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def from_env(environ, region=None):
+    """Build the notifier described by SNS_TOPIC_ARN / NOTIFY_* settings"""
+    topic_arn = environ.get('SNS_TOPIC_ARN')
+    local_file = environ.get('NOTIFY_FILE')
+    if topic_arn:
+        publish = SNSPublisher(topic_arn, region=region)
+    elif local_file:
+        publish = LocalPublisher(local_file)
+    else:
+        publish = None
+    notifier = Notifier(
+        publish,
+        spill_dir=environ.get('NOTIFY_SPILL_DIR', 'notify_spool'),
+        workers=int(environ.get('NOTIFY_WORKERS', 1)),
+        linger=float(environ.get('NOTIFY_LINGER', 0.5)),
+    )
+    atexit.register(notifier.close)
+    return notifier
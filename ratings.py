@@ -0,0 +1,140 @@
+"""Rating aggregates per service and per photographer for the admin page and /ratings.
+
+Working out how a service is rated used to mean reading every feedback row.
+Instead, each (service or photographer, stars) pair has a running count
+that a new review adds to and a deleted one takes back, so averages,
+counts and star histograms are one read however much feedback there is:
+
+* app_aws.py - the counts are attributes of one `Stats` item (id 'ratings'),
+               changed with ADD right after the feedback write, not in a
+               transaction with it, so concurrent reviews don't conflict on
+               the item
+* app.py     - SQLite triggers keep a `ratings` table in step (sqlstore.py);
+               the in-memory store counts as rows are added and deleted
+
+Counter names are `<dimension>#<name>#<stars>`, dimension `service` or
+`photographer`; a review without a photographer only counts for its service.
+Both apps only accept the SERVICES below and availability.PHOTOGRAPHERS, so
+the number of counters (and the size of the DynamoDB item) stays fixed.
+Recount from the feedback rows (a full scan) after an import that bypasses
+the app, or if a count looks off:
+
+    python ratings.py
+    python ratings.py --sqlite database.db     # app.py's SQLite store
+"""
+import argparse
+import os
+
+import stats
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+KEY = {'id': 'ratings'}  # item in the Stats table
+STARS = (1, 2, 3, 4, 5)
+MAX_AGE = 60  # seconds browsers and proxies may reuse a /ratings response
+DIMENSIONS = ('service', 'photographer')
+# What a review can be for: the choices of the feedback form in dashboard.html
+SERVICES = ('Wedding Photography', 'Portrait Session', 'Photo Retouching')
+
+
+def parse_rating(value):
+    """The star rating a form sent, or None if it isn't one"""
+    try:
+        rating = int(value)
+    except (TypeError, ValueError):
+        return None
+    return rating if rating in STARS else None
+
+
+def counter(dimension, name, stars):
+    return f"{dimension}#{name}#{stars}"
+
+
+def added(feedback):
+    """Counter deltas for a new review (a dict or a memstore record)"""
+    rating = parse_rating(feedback.get('rating'))
+    if rating is None:
+        return {}
+    return {counter(dimension, feedback.get(dimension), rating): 1
+            for dimension in DIMENSIONS if feedback.get(dimension)}
+
+
+def removed(feedback):
+    return {name: -delta for name, delta in added(feedback).items()}
+
+
+def update(deltas):
+    """UpdateItem kwargs that ADD every delta to the ratings item"""
+    return stats.update(deltas, key=KEY)
+
+
+def apply(stats_table, deltas):
+    """ADD `deltas` to the ratings item on their own; a failure is logged, not raised"""
+    stats.apply(stats_table, deltas, key=KEY)
+
+
+def read(stats_table):
+    item = stats_table.get_item(Key=KEY).get('Item', {})
+    return {name: value for name, value in item.items() if name != 'id'}
+
+
+def summarize(counters):
+    """{'service': [...], 'photographer': [...]} with each name's count, average and histogram.
+
+    Entries are sorted by name; `stars` maps '1'..'5' to how many reviews gave that many.
+    """
+    found = {dimension: {} for dimension in DIMENSIONS}
+    for name, value in counters.items():
+        dimension, _, rest = name.partition('#')
+        subject, _, stars = rest.rpartition('#')
+        if dimension in found and value > 0:
+            found[dimension].setdefault(subject, {})[int(stars)] = int(value)
+    summary = {}
+    for dimension, subjects in found.items():
+        summary[dimension] = []
+        for subject, histogram in sorted(subjects.items()):
+            count = sum(histogram.values())
+            summary[dimension].append({
+                'name': subject,
+                'count': count,
+                'average': round(sum(stars * n for stars, n in histogram.items()) / count, 2),
+                'stars': {str(stars): histogram.get(stars, 0) for stars in STARS},
+            })
+    return summary
+
+
+def count(db):
+    """Every counter, computed from a full scan of Feedback"""
+    counts = {}
+    kwargs = {'ProjectionExpression': '#sv, #ph, #rt',
+              'ExpressionAttributeNames': {'#sv': 'service', '#ph': 'photographer', '#rt': 'rating'}}
+    table = db.Table('Feedback')
+    while True:
+        resp = table.scan(**kwargs)
+        for item in resp['Items']:
+            for name, delta in added(item).items():
+                counts[name] = counts.get(name, 0) + delta
+        if 'LastEvaluatedKey' not in resp:
+            return counts
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def rebuild(db):
+    """Replace the ratings item with freshly counted totals"""
+    counts = count(db)
+    db.Table('Stats').put_item(Item={**KEY, **counts})
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the rating aggregates from a full scan")
+    parser.add_argument('--sqlite', metavar='PATH', help="rebuild app.py's SQLite store instead of DynamoDB")
+    args = parser.parse_args()
+    if args.sqlite:
+        from sqlstore import SQLiteStore
+        totals = SQLiteStore(args.sqlite).rebuild_ratings()
+    else:
+        import dynamo
+        totals = rebuild(dynamo.DynamoDB(region_name=REGION))
+    for dimension, subjects in summarize(totals).items():
+        for subject in subjects:
+            print(f"{dimension:<13} {subject['name']:<24} {subject['average']:>5} ({subject['count']} reviews)")
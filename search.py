@@ -0,0 +1,250 @@
+"""Admin search (/admin/search): bookings, sessions and users by customer, status,
+service, photographer and date range, sorted and paginated.
+
+Every search starts from an index lookup sized by what it finds, never by
+the table; the remaining filters narrow those rows in memory:
+
+* customer - `q` is a prefix of a customer's email or of a word of their
+             name; a prefix index of users gives their emails, then the
+             per-user indexes give their rows
+* photographer, status, date range - the per-table indexes on those fields
+* service  - a prefix of the service ("Wedding", "Retouch: Retouching") that
+             only narrows, since a handful of services would each match a
+             large share of the table
+
+The prefix index differs per store:
+
+* app_aws.py - the `SearchTerms` table holds one item per (prefix, email) for
+               prefixes of MIN_PREFIX..MAX_PREFIX characters, written in the
+               same transaction as the Users row; longer queries look up
+               their first MAX_PREFIX characters and check the full tokens
+* app.py     - a sorted (token, email) index, range-read for the prefix
+               (sqlstore.py's search_terms table, memstore.py's Users)
+
+A search that matches more than MAX_RESULTS rows returns the first ones and
+says so. Rebuild the DynamoDB prefix index from Users (after an import that
+bypasses the app) with:
+
+    python search.py
+"""
+import math
+import os
+
+from boto3.dynamodb.conditions import Key
+
+from create_tables import USER_INDEX, STATUS_DATE_INDEX, STATUS_CREATED_INDEX, PHOTOGRAPHER_DATE_INDEX
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+TABLE = 'SearchTerms'
+SECTIONS = ('bookings', 'sessions', 'users')
+STATUSES = {
+    'bookings': ('Pending', 'Confirmed', 'Cancelled'),
+    'sessions': ('Pending', 'Upcoming', 'Today', 'Completed', 'Cancelled'),
+}
+PAGE_SIZE = 50
+MAX_RESULTS = 1000   # rows a search reads before it stops and reports truncated results
+MIN_PREFIX = 2       # shortest customer prefix searched
+MAX_PREFIX = 8       # longest prefix kept in SearchTerms
+MAX_NAME_WORDS = 4   # name words indexed per user, which bounds the items per user
+
+
+class SearchError(ValueError):
+    """A search the indexes can't answer; the message is meant for the admin"""
+
+
+# --- Filters ---
+
+def parse(args):
+    """Filters from the query string (a werkzeug MultiDict or a plain dict)"""
+    filters = {
+        'section': args.get('section', 'bookings'),
+        'q': (args.get('q') or '').strip().lower(),
+        'status': args.get('status') or None,
+        'service': (args.get('service') or '').strip().lower(),
+        'photographer': args.get('photographer') or None,
+        'first': args.get('from') or None,
+        'last': args.get('to') or None,
+    }
+    try:
+        filters['page'] = max(1, int(args.get('page', 1)))
+    except ValueError:
+        raise SearchError("page must be a number") from None
+    if filters['section'] not in SECTIONS:
+        raise SearchError(f"section must be one of {', '.join(SECTIONS)}")
+    if filters['q'] and len(filters['q']) < MIN_PREFIX:
+        raise SearchError(f"Type at least {MIN_PREFIX} characters of the customer's name or email")
+    if filters['photographer'] and filters['section'] != 'sessions':
+        raise SearchError("Only sessions have a photographer")
+    if filters['status'] and filters['status'] not in STATUSES.get(filters['section'], ()):
+        raise SearchError(f"Unknown status for {filters['section']}: {filters['status']}")
+    for bound in ('first', 'last'):
+        value = filters[bound]
+        if value and (len(value) != 10 or value[4] != '-' or value[7] != '-'):
+            raise SearchError("Dates must be YYYY-MM-DD")
+    if filters['section'] == 'users':
+        if not filters['q']:
+            raise SearchError("Search users by name or email")
+    elif not (filters['q'] or filters['status'] or filters['photographer'] or filters['first'] or filters['last']):
+        raise SearchError("Search by customer, status, photographer or date range")
+    return filters
+
+
+def date_range(filters):
+    """(first, last) days, open ends filled in so they work as index bounds"""
+    return filters['first'] or '0000-00-00', filters['last'] or '9999-99-99'
+
+
+def tokens(email, name):
+    """What a customer can be found by: their email and the words of their name, lower case"""
+    words = (name or '').lower().split()[:MAX_NAME_WORDS]
+    return {(email or '').lower(), *words} - {''}
+
+
+def record_day(section, record):
+    """The day a row is filed under: a session's date, a booking's creation day"""
+    value = record.get('date') if section == 'sessions' else record.get('created_at')
+    return (value or '')[:10]
+
+
+def matches(section, record, filters):
+    """Whether a row an index returned passes the rest of the filters"""
+    if filters['status'] and record.get('status') != filters['status']:
+        return False
+    if filters['photographer'] and record.get('photographer') != filters['photographer']:
+        return False
+    if filters['service'] and not (record.get('service') or '').lower().startswith(filters['service']):
+        return False
+    if filters['first'] or filters['last']:
+        first, last = date_range(filters)
+        if not first <= record_day(section, record) <= last:
+            return False
+    return True
+
+
+def sort_key(section):
+    """Newest first for bookings and sessions, by name for users"""
+    if section == 'users':
+        return lambda user: ((user.get('name') or '').lower(), user['email'])
+    return lambda record: (record_day(section, record), record.get('time') or '', str(record.get('id')))
+
+
+def paginate(section, found, page):
+    """(rows of `page`, total, pages) of `found` in display order"""
+    reverse = section != 'users'
+    ordered = sorted(found, key=sort_key(section), reverse=reverse)
+    start = (page - 1) * PAGE_SIZE
+    return ordered[start:start + PAGE_SIZE], len(ordered), max(1, math.ceil(len(ordered) / PAGE_SIZE))
+
+
+# --- DynamoDB (app_aws.py) ---
+
+def _prefixes(email, name):
+    return {token[:n] for token in tokens(email, name)
+            for n in range(MIN_PREFIX, min(len(token), MAX_PREFIX) + 1)}
+
+
+def term_operations(email, name, old=None):
+    """Transaction operations that index a user's prefixes; `old` (email, name) unindexes the previous ones.
+
+    Terms both versions share are only rewritten when the tokens stored with
+    them change. `email` None unindexes `old` alone (a deleted user).
+    """
+    new_terms = {(term, email) for term in _prefixes(email, name)} if email else set()
+    old_terms = {(term, old[0]) for term in _prefixes(*old)} if old else set()
+    user_tokens = sorted(tokens(email, name))
+    puts = new_terms
+    if old and old[0] == email and tokens(*old) == set(user_tokens):
+        puts = new_terms - old_terms
+    operations = [('Delete', TABLE, {'Key': {'term': term, 'email': owner}})
+                  for term, owner in sorted(old_terms - new_terms)]
+    operations += [('Put', TABLE, {'Item': {'term': term, 'email': owner, 'tokens': user_tokens}})
+                   for term, owner in sorted(puts)]
+    return operations
+
+
+def _query(table, limit, **kwargs):
+    items = []
+    while len(items) < limit:
+        resp = table.query(**kwargs)
+        items.extend(resp.get('Items', []))
+        if 'LastEvaluatedKey' not in resp:
+            break
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+    return items[:limit]
+
+
+def find_emails(db, prefix):
+    """Emails of the customers with a token starting with `prefix`"""
+    items = _query(db.Table(TABLE), MAX_RESULTS + 1, KeyConditionExpression=Key('term').eq(prefix[:MAX_PREFIX]))
+    return [item['email'] for item in items if any(token.startswith(prefix) for token in item.get('tokens', ()))]
+
+
+def find(db, filters):
+    """Rows matching `filters`, unsorted, at most MAX_RESULTS + 1 (one more means truncated)"""
+    section, limit = filters['section'], MAX_RESULTS + 1
+    first, last = date_range(filters)
+    table = db.Table(section.capitalize())
+    if section == 'users':
+        emails = find_emails(db, filters['q'])
+        return db.batch_get('Users', [{'email': email} for email in emails], consistent=False)
+
+    if filters['q']:
+        found = []
+        for email in find_emails(db, filters['q']):
+            found += _query(table, limit - len(found), IndexName=USER_INDEX,
+                            KeyConditionExpression=Key('user').eq(email))
+            if len(found) >= limit:
+                break
+    elif section == 'sessions' and filters['photographer']:
+        found = _query(table, limit, IndexName=PHOTOGRAPHER_DATE_INDEX, KeyConditionExpression=(
+            Key('photographer').eq(filters['photographer']) & Key('date').between(first, last)))
+    else:
+        found = []
+        for status in [filters['status']] if filters['status'] else STATUSES[section]:
+            if section == 'sessions':
+                # KEYS_ONLY index: the ids, then the items themselves
+                keys = _query(table, limit - len(found), IndexName=STATUS_DATE_INDEX, KeyConditionExpression=(
+                    Key('status').eq(status) & Key('date').between(first, last)))
+                found += db.batch_get('Sessions', [{'id': key['id']} for key in keys], consistent=False)
+            else:
+                found += _query(table, limit - len(found), IndexName=STATUS_CREATED_INDEX, KeyConditionExpression=(
+                    Key('status').eq(status) & Key('created_at').between(first, last + 'T~')))
+            if len(found) >= limit:
+                break
+    return [item for item in found if matches(section, item, filters)]
+
+
+def rebuild(db):
+    """Make SearchTerms match Users: index every user, drop terms of users that are gone"""
+    wanted = {}
+    kwargs = {'ProjectionExpression': 'email, #nm', 'ExpressionAttributeNames': {'#nm': 'name'}}
+    while True:
+        resp = db.Table('Users').scan(**kwargs)
+        for user in resp.get('Items', []):
+            for operation in term_operations(user['email'], user.get('name')):
+                item = operation[2]['Item']
+                wanted[(item['term'], item['email'])] = item
+        if 'LastEvaluatedKey' not in resp:
+            break
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+    table = db.Table(TABLE)
+    stale = []
+    kwargs = {'ProjectionExpression': 'term, email'}
+    while True:
+        resp = table.scan(**kwargs)
+        stale += [item for item in resp.get('Items', []) if (item['term'], item['email']) not in wanted]
+        if 'LastEvaluatedKey' not in resp:
+            break
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+    for item in stale:
+        table.delete_item(Key={'term': item['term'], 'email': item['email']})
+    for item in wanted.values():
+        table.put_item(Item=item)
+    return len(wanted), len(stale)
+
+
+if __name__ == '__main__':
+    import dynamo
+    written, removed = rebuild(dynamo.DynamoDB(region_name=REGION))
+    print(f"Indexed {written} prefixes, removed {removed} stale ones.")
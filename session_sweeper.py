@@ -0,0 +1,78 @@
+"""Keep confirmed sessions' Upcoming/Today status in step with the calendar.
+
+Statuses are stored precomputed so the admin page can just read them. Once a
+day, right after midnight, the sessions sitting on the boundary that just
+passed are moved:
+
+    Upcoming -> Today      sessions dated today
+    Today    -> Upcoming   sessions left over from earlier days
+
+Both sets are read from the Sessions status-date-index (status + date), so
+the sweep never touches past or far-future sessions. Run it from cron or an
+EventBridge schedule:
+
+    5 0 * * *  python session_sweeper.py
+
+app_aws.py also runs it lazily once per day per worker in case the
+schedule is missed.
+"""
+import os
+from datetime import datetime
+
+from boto3.dynamodb.conditions import Key, Attr
+from botocore.exceptions import ClientError
+
+import changes
+import dynamo
+import stats
+from create_tables import STATUS_DATE_INDEX
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+
+
+def _session_ids(sessions_table, key_condition):
+    kwargs = {'IndexName': STATUS_DATE_INDEX, 'KeyConditionExpression': key_condition}
+    while True:
+        resp = sessions_table.query(**kwargs)
+        for item in resp.get('Items', []):
+            yield item['id']
+        if 'LastEvaluatedKey' not in resp:
+            return
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+
+
+def _move(sessions_table, session_id, old_status, new_status):
+    """Change one session's status unless an admin changed it in the meantime"""
+    try:
+        sessions_table.update_item(**changes.touch(dict(
+            Key={'id': session_id},
+            UpdateExpression="set #st = :s",
+            ConditionExpression=Attr('status').eq(old_status),
+            ExpressionAttributeNames={'#st': 'status'},
+            ExpressionAttributeValues={':s': new_status}
+        )))
+    except ClientError as e:
+        if e.response['Error']['Code'] == 'ConditionalCheckFailedException':
+            return False
+        raise
+    return True
+
+
+def sweep(sessions_table, today_str, stats_table=None):
+    """Apply the day boundary for `today_str` (YYYY-MM-DD); returns sessions moved"""
+    to_upcoming = sum(_move(sessions_table, session_id, 'Today', 'Upcoming') for session_id in
+                      list(_session_ids(sessions_table, Key('status').eq('Today') & Key('date').lt(today_str))))
+    to_today = sum(_move(sessions_table, session_id, 'Upcoming', 'Today') for session_id in
+                   list(_session_ids(sessions_table, Key('status').eq('Upcoming') & Key('date').eq(today_str))))
+    if stats_table is not None and to_today != to_upcoming:
+        stats.apply(stats_table, {
+            stats.status_counter('sessions', 'Today'): to_today - to_upcoming,
+            stats.status_counter('sessions', 'Upcoming'): to_upcoming - to_today,
+        })
+    return to_upcoming + to_today
+
+
+if __name__ == '__main__':
+    db = dynamo.DynamoDB(region_name=REGION)
+    today = datetime.now().strftime('%Y-%m-%d')
+    print(f"Moved {sweep(db.Table('Sessions'), today, db.Table('Stats'))} sessions for {today}.")
@@ -0,0 +1,686 @@
+"""SQLite store for app.py (STORE_BACKEND=sqlite, the default).
+
+Same interface as memstore.Store, so the routes don't care which one they
+get, but the data lives in one database file that survives restarts and is
+shared by every gunicorn worker:
+
+* WAL journal, so readers never wait for the writer and workers can read
+  while another one commits
+* indexes on the user/email columns, status and date, so every lookup the
+  routes make is an index search rather than a table scan
+* a small pool of connections per worker process (rebuilt after fork)
+* every statement is a fixed SQL string with ? parameters, so each
+  connection's statement cache prepares it once and reuses it
+* the admin counters (stats.py) are kept by triggers, in the same
+  transaction as the write that changes them
+* triggers also stamp every row with `updated_at` and record deletions, so
+  /admin/changes is an index range read (changes.py)
+* the words of each account's name and email are kept in `search_terms`,
+  in the same transaction as the account, so an /admin/search for a
+  customer is an index range read (search.py)
+* photographer overlap checks and upload reference counts run inside
+  BEGIN IMMEDIATE, so two workers can't both book the same slot or both
+  collect a blob that is still referenced
+"""
+import os
+import queue
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import availability
+import changes
+import ratings
+import search
+from memstore import Booking, SessionBooking, Feedback
+
+POOL_SIZE = 8
+BUSY_TIMEOUT = 5  # seconds a writer waits for another worker's transaction
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    email TEXT PRIMARY KEY,
+    name TEXT,
+    password TEXT,
+    role TEXT NOT NULL DEFAULT 'user',
+    updated_at TEXT
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    service TEXT,
+    filename TEXT,
+    sha256 TEXT,
+    storage_key TEXT,
+    status TEXT,
+    created_at TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS bookings_user ON bookings (user);
+CREATE INDEX IF NOT EXISTS bookings_status ON bookings (status);
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user TEXT NOT NULL,
+    user_name TEXT,
+    service TEXT,
+    photographer TEXT,
+    date TEXT,
+    time TEXT,
+    status TEXT,
+    start_min INTEGER,
+    end_min INTEGER,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS sessions_user ON sessions (user);
+CREATE INDEX IF NOT EXISTS sessions_status_date ON sessions (status, date);
+CREATE INDEX IF NOT EXISTS sessions_date ON sessions (date);
+CREATE INDEX IF NOT EXISTS sessions_photographer_date ON sessions (photographer, date);
+CREATE TABLE IF NOT EXISTS feedbacks (
+    id TEXT PRIMARY KEY,
+    user_name TEXT,
+    user_email TEXT NOT NULL,
+    service TEXT,
+    photographer TEXT,
+    rating INTEGER,
+    comment TEXT,
+    updated_at TEXT
+);
+CREATE INDEX IF NOT EXISTS feedbacks_user_email ON feedbacks (user_email);
+CREATE TABLE IF NOT EXISTS blobs (
+    sha256 TEXT PRIMARY KEY,
+    storage_key TEXT NOT NULL,
+    size INTEGER,
+    refs INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    dimension TEXT NOT NULL,
+    name TEXT NOT NULL,
+    stars INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (dimension, name, stars)
+);
+CREATE TABLE IF NOT EXISTS search_terms (
+    token TEXT NOT NULL,
+    email TEXT NOT NULL,
+    PRIMARY KEY (token, email)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS search_terms_email ON search_terms (email);
+CREATE TABLE IF NOT EXISTS stats (
+    name TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS deletions (
+    section TEXT NOT NULL,
+    id TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS deletions_updated_at ON deletions (updated_at);
+"""
+
+# stats.py counter -> (table, counts rows per status?)
+COUNTED_TABLES = {
+    'users': ('users', False),
+    'bookings': ('bookings', True),
+    'sessions': ('sessions', True),
+    'feedback': ('feedbacks', False),
+}
+
+
+def _bump(name_sql, delta):
+    return (f"INSERT INTO stats (name, value) VALUES ({name_sql}, {delta})"
+            f" ON CONFLICT (name) DO UPDATE SET value = value + {delta};")
+
+
+def _status_name(kind, row):
+    # Same names as stats.status_counter()
+    return f"'{kind}_' || lower(ifnull({row}.status, 'none'))"
+
+
+def _counter_triggers(kind, table, by_status):
+    """Triggers that keep the `kind` counters in step with `table`"""
+    on_insert = [_bump(f"'{kind}'", 1)]
+    on_delete = [_bump(f"'{kind}'", -1)]
+    if by_status:
+        on_insert.append(_bump(_status_name(kind, 'NEW'), 1))
+        on_delete.append(_bump(_status_name(kind, 'OLD'), -1))
+    triggers = [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_count_insert AFTER INSERT ON {table} BEGIN {' '.join(on_insert)} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_count_delete AFTER DELETE ON {table} BEGIN {' '.join(on_delete)} END;",
+    ]
+    if by_status:
+        triggers.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_count_status AFTER UPDATE OF status ON {table}"
+            f" WHEN OLD.status IS NOT NEW.status BEGIN"
+            f" {_bump(_status_name(kind, 'OLD'), -1)} {_bump(_status_name(kind, 'NEW'), 1)} END;")
+    return triggers
+
+
+def _rated(dimension, row):
+    # Same rule as ratings.added(): a 1-5 rating and a non-empty name
+    return f"{row}.{dimension} IS NOT NULL AND {row}.{dimension} <> '' AND {row}.rating BETWEEN 1 AND 5"
+
+
+def _rating_triggers():
+    """Triggers that keep the ratings table in step with feedbacks"""
+    on_insert = [f"INSERT INTO ratings (dimension, name, stars, count) SELECT '{d}', NEW.{d}, NEW.rating, 1"
+                 f" WHERE {_rated(d, 'NEW')} ON CONFLICT (dimension, name, stars) DO UPDATE SET count = count + 1;"
+                 for d in ratings.DIMENSIONS]
+    on_delete = [f"UPDATE ratings SET count = count - 1 WHERE dimension = '{d}' AND name = OLD.{d}"
+                 f" AND stars = OLD.rating;" for d in ratings.DIMENSIONS]
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS feedbacks_rating_insert AFTER INSERT ON feedbacks BEGIN {' '.join(on_insert)} END;",
+        f"CREATE TRIGGER IF NOT EXISTS feedbacks_rating_delete AFTER DELETE ON feedbacks BEGIN {' '.join(on_delete)} END;",
+    ]
+
+
+# changes.py section -> (table, key column)
+SYNCED_TABLES = {
+    'users': ('users', 'email'),
+    'bookings': ('bookings', 'id'),
+    'sessions': ('sessions', 'id'),
+    'feedback': ('feedbacks', 'id'),
+}
+
+# Same format as changes.now()
+_NOW = "strftime('%Y-%m-%dT%H:%M:%fZ', 'now')"
+
+
+def _deleted(section, key_sql):
+    # Tombstones nobody can ask for any more are dropped as new ones arrive
+    return (f"INSERT INTO deletions (section, id, updated_at) VALUES ('{section}', {key_sql}, {_NOW});"
+            f" DELETE FROM deletions WHERE updated_at < strftime('%Y-%m-%dT%H:%M:%fZ', 'now',"
+            f" '-{changes.MAX_AGE.days} days');")
+
+
+def _change_triggers(section, table, key):
+    """Triggers that stamp `table`'s rows with updated_at and record its deletions"""
+    stamp = f"UPDATE {table} SET updated_at = {_NOW} WHERE rowid = NEW.rowid;"
+    triggers = [
+        f"CREATE TRIGGER IF NOT EXISTS {table}_stamp_insert AFTER INSERT ON {table} BEGIN {stamp} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_stamp_update AFTER UPDATE ON {table}"
+        f" WHEN NEW.updated_at IS OLD.updated_at BEGIN {stamp} END;",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_record_delete AFTER DELETE ON {table}"
+        f" BEGIN {_deleted(section, f'OLD.{key}')} END;",
+    ]
+    if key != 'id':
+        # A row whose key changes leaves its old key behind
+        triggers.append(
+            f"CREATE TRIGGER IF NOT EXISTS {table}_record_rekey AFTER UPDATE OF {key} ON {table}"
+            f" WHEN OLD.{key} IS NOT NEW.{key} BEGIN {_deleted(section, f'OLD.{key}')} END;")
+    return triggers
+
+
+TRIGGERS = [sql for kind, (table, by_status) in COUNTED_TABLES.items()
+            for sql in _counter_triggers(kind, table, by_status)]
+TRIGGERS += [sql for section, (table, key) in SYNCED_TABLES.items()
+             for sql in _change_triggers(section, table, key)]
+TRIGGERS += _rating_triggers()
+
+# Columns added after their table first shipped: (table, column, type)
+MIGRATIONS = [
+    ('bookings', 'storage_key', 'TEXT'),
+    ('users', 'updated_at', 'TEXT'),
+    ('bookings', 'updated_at', 'TEXT'),
+    ('sessions', 'updated_at', 'TEXT'),
+    ('feedbacks', 'updated_at', 'TEXT'),
+    ('feedbacks', 'photographer', 'TEXT'),
+    ('bookings', 'created_at', 'TEXT'),
+]
+
+# Indexes on migrated columns, created once the columns exist
+INDEXES = [f"CREATE INDEX IF NOT EXISTS {table}_updated_at ON {table} (updated_at)"
+           for table, _ in SYNCED_TABLES.values()]
+INDEXES += [
+    "CREATE INDEX IF NOT EXISTS bookings_status_created_at ON bookings (status, created_at)",
+    "CREATE INDEX IF NOT EXISTS bookings_created_at ON bookings (created_at)",
+]
+
+
+class Database:
+    """Per-process pool of connections to one SQLite file"""
+
+    def __init__(self, path, pool_size=POOL_SIZE):
+        self.path = path
+        self.pool_size = pool_size
+        self._pool = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._local = threading.local()  # connection of this thread's open transaction
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT, isolation_level=None,
+                               check_same_thread=False, cached_statements=256)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable at checkpoints; safe with WAL
+        return conn
+
+    @contextmanager
+    def connection(self):
+        current = getattr(self._local, 'conn', None)
+        if current is not None:
+            # Inside transaction(): run on its connection so the statement joins it
+            yield current
+            return
+        if self._pid != os.getpid():
+            # Connections must not cross fork(); start a fresh pool in this process
+            with self._lock:
+                if self._pid != os.getpid():
+                    self._pool = queue.LifoQueue(self.pool_size)
+                    self._pid = os.getpid()
+        pool = self._pool
+        try:
+            conn = pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            try:
+                pool.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+    @contextmanager
+    def transaction(self):
+        """BEGIN IMMEDIATE ... COMMIT: takes the write lock up front.
+
+        Store calls made on this thread until it ends are part of it.
+        """
+        if getattr(self._local, 'conn', None) is not None:
+            yield self._local.conn
+            return
+        with self.connection() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            self._local.conn = conn
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            else:
+                conn.execute("COMMIT")
+            finally:
+                self._local.conn = None
+
+    def query(self, sql, params=()):
+        with self.connection() as conn:
+            return conn.execute(sql, params).fetchall()
+
+    def execute(self, sql, params=()):
+        with self.connection() as conn:
+            cursor = conn.execute(sql, params)
+            return cursor.rowcount, cursor.lastrowid
+
+
+class SQLTable:
+    """memstore.Table's interface over one SQLite table"""
+
+    def __init__(self, db, name, record_type, user_field='user', date_field=None):
+        self.db = db
+        self.name = name
+        self.record_type = record_type
+        columns = ', '.join(record_type.__slots__)
+        select = f"SELECT {columns} FROM {name}"
+        # Built once here, so every call reuses the same prepared statement
+        self._get = f"{select} WHERE id = ?"
+        self._all = f"{select} ORDER BY rowid"
+        self._for_user = f"{select} WHERE {user_field} = ? ORDER BY rowid"
+        self._with_status = f"{select} WHERE status = ? ORDER BY rowid"
+        self._on_date = f"{select} WHERE {date_field} = ? ORDER BY rowid"
+        self._between = f"{select} WHERE {date_field} BETWEEN ? AND ? ORDER BY {date_field}, rowid"
+        self._set_status = f"UPDATE {name} SET status = ? WHERE id = ?"
+        self._delete = f"DELETE FROM {name} WHERE id = ?"
+        self._count = f"SELECT COUNT(*) FROM {name}"
+        self._changed = f"{select} WHERE updated_at > ? ORDER BY updated_at LIMIT ?"
+        fields = [f for f in record_type.__slots__ if f != 'id']
+        self._insert = f"INSERT INTO {name} ({', '.join(fields)}) VALUES ({', '.join('?' * len(fields))})"
+        self._insert_with_id = f"INSERT INTO {name} ({columns}) VALUES ({', '.join('?' * len(record_type.__slots__))})"
+        self._insert_fields = fields
+
+    def _records(self, rows):
+        slots = self.record_type.__slots__
+        return [self.record_type(**dict(zip(slots, row))) for row in rows]
+
+    def add(self, record):
+        """Insert a record; a record without an id gets the next one"""
+        if record.id is None:
+            sql, params = self._insert, [getattr(record, f) for f in self._insert_fields]
+        else:
+            sql, params = self._insert_with_id, [getattr(record, f) for f in self.record_type.__slots__]
+        _, record.id = self.db.execute(sql, params)
+        return record
+
+    def get(self, record_id):
+        rows = self._records(self.db.query(self._get, (record_id,)))
+        return rows[0] if rows else None
+
+    def all(self):
+        return self._records(self.db.query(self._all))
+
+    def for_user(self, user):
+        return self._records(self.db.query(self._for_user, (user,)))
+
+    def with_status(self, status):
+        return self._records(self.db.query(self._with_status, (status,)))
+
+    def on_date(self, date):
+        return self._records(self.db.query(self._on_date, (date,)))
+
+    def between(self, first, last):
+        return self._records(self.db.query(self._between, (first, last)))
+
+    def changed_since(self, cursor, limit):
+        """Records written after `cursor`, oldest first (updated_at index)"""
+        return self._records(self.db.query(self._changed, (cursor, limit)))
+
+    def set_status(self, record_id, status):
+        self.db.execute(self._set_status, (status, record_id))
+        return self.get(record_id)
+
+    def delete(self, record_id):
+        record = self.get(record_id)
+        if record is not None:
+            self.db.execute(self._delete, (record_id,))
+        return record
+
+    def __len__(self):
+        return self.db.query(self._count)[0][0]
+
+
+class SQLUsers:
+    """memstore.Users' interface over the users table, with its search_terms kept in step"""
+
+    def __init__(self, db):
+        self.db = db
+
+    @staticmethod
+    def _index(conn, email, name):
+        conn.execute("DELETE FROM search_terms WHERE email = ?", (email,))
+        conn.executemany("INSERT INTO search_terms (token, email) VALUES (?, ?)",
+                         [(token, email) for token in search.tokens(email, name)])
+
+    def get(self, email):
+        rows = self.db.query("SELECT name, password, role FROM users WHERE email = ?", (email,))
+        if not rows:
+            return None
+        name, password, role = rows[0]
+        return {'name': name, 'password': password, 'role': role}
+
+    def add(self, email, name, password, role='user'):
+        with self.db.transaction() as conn:
+            count = conn.execute(
+                "INSERT OR IGNORE INTO users (email, name, password, role) VALUES (?, ?, ?, ?)",
+                (email, name, password, role)).rowcount
+            if count == 1:
+                self._index(conn, email, name)
+        return count == 1
+
+    def update(self, old_email, new_email, name):
+        """Rename an account; False if it is gone or the new email is taken"""
+        with self.db.transaction() as conn:
+            try:
+                count = conn.execute("UPDATE users SET email = ?, name = ? WHERE email = ?",
+                                     (new_email, name, old_email)).rowcount
+            except sqlite3.IntegrityError:
+                return False
+            if count == 1:
+                conn.execute("DELETE FROM search_terms WHERE email = ?", (old_email,))
+                self._index(conn, new_email, name)
+        return count == 1
+
+    def delete(self, email):
+        with self.db.transaction() as conn:
+            conn.execute("DELETE FROM users WHERE email = ?", (email,))
+            conn.execute("DELETE FROM search_terms WHERE email = ?", (email,))
+
+    def find(self, prefix, limit=search.MAX_RESULTS + 1):
+        """Emails of the accounts with a name word or email starting with `prefix` (primary key range)"""
+        return [email for email, in self.db.query(_FIND_TERMS, (prefix, prefix + _LAST_CHAR, limit))]
+
+    def all(self):
+        rows = self.db.query("SELECT email, name, password, role FROM users ORDER BY rowid")
+        return {email: {'name': name, 'password': password, 'role': role} for email, name, password, role in rows}
+
+    def changed_since(self, cursor, limit):
+        """(email, account) written after `cursor`, oldest first"""
+        rows = self.db.query("SELECT email, name, password, role, updated_at FROM users"
+                             " WHERE updated_at > ? ORDER BY updated_at LIMIT ?", (cursor, limit))
+        return [(email, {'name': name, 'password': password, 'role': role, 'updated_at': updated_at})
+                for email, name, password, role, updated_at in rows]
+
+    def __len__(self):
+        return self.db.query("SELECT COUNT(*) FROM users")[0][0]
+
+
+_OVERLAP = ("SELECT 1 FROM sessions WHERE photographer = ? AND date = ? AND status <> 'Cancelled'"
+            " AND start_min < ? AND end_min > ? LIMIT 1")
+_INSERT_SESSION = ("INSERT INTO sessions (user, user_name, service, photographer, date, time, status,"
+                   " start_min, end_min) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)")
+_FIND_BLOB = "SELECT storage_key FROM blobs WHERE sha256 = ?"
+_ADD_REF = "UPDATE blobs SET refs = refs + 1 WHERE sha256 = ?"
+_INSERT_BLOB = "INSERT INTO blobs (sha256, storage_key, size, refs) VALUES (?, ?, ?, 1)"
+_DROP_REF = "UPDATE blobs SET refs = refs - 1 WHERE sha256 = ?"
+_UNREFERENCED = "SELECT storage_key FROM blobs WHERE sha256 = ? AND refs <= 0"
+_DELETE_BLOB = "DELETE FROM blobs WHERE sha256 = ?"
+# The rows a customer's email appears in, moved along when it changes (indexed columns)
+_REASSIGN = (
+    "UPDATE bookings SET user = ? WHERE user = ?",
+    "UPDATE sessions SET user = ?, user_name = ? WHERE user = ?",
+    "UPDATE feedbacks SET user_email = ?, user_name = ? WHERE user_email = ?",
+)
+_LAST_CHAR = '\U0010ffff'  # sorts after every character, so prefix..prefix+_LAST_CHAR spans the prefix
+_FIND_TERMS = "SELECT DISTINCT email FROM search_terms WHERE token >= ? AND token < ? LIMIT ?"
+_SEARCH_USERS = ("SELECT email, name, password, role FROM users WHERE email IN"
+                 " (SELECT email FROM search_terms WHERE token >= ? AND token < ?) LIMIT ?")
+_HELD = ("SELECT id, date, start_min, end_min FROM sessions WHERE photographer = ? AND date BETWEEN ? AND ?"
+         " AND status <> 'Cancelled' AND start_min IS NOT NULL")
+
+
+def _escape_like(text):
+    return text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+
+
+class SQLiteStore:
+    """All of app.py's tables in one SQLite database"""
+
+    def __init__(self, path, accounts=None, pool_size=POOL_SIZE):
+        self.db = Database(path, pool_size)
+        with self.db.connection() as conn:
+            conn.executescript(SCHEMA)
+        with self.db.transaction() as conn:
+            for table, column, column_type in MIGRATIONS:
+                if column not in {row[1] for row in conn.execute(f"PRAGMA table_info({table})")}:
+                    conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}")
+            for sql in INDEXES:
+                conn.execute(sql)
+            # Session ids start at 1000, like the in-memory store
+            conn.execute("INSERT INTO sqlite_sequence (name, seq) SELECT 'sessions', 999"
+                         " WHERE NOT EXISTS (SELECT 1 FROM sqlite_sequence WHERE name = 'sessions')")
+            for sql in TRIGGERS:
+                conn.execute(sql)
+            # A database that predates the counters gets them filled in once
+            if conn.execute("SELECT 1 FROM stats LIMIT 1").fetchone() is None:
+                self._count_rows(conn)
+            if conn.execute("SELECT 1 FROM ratings LIMIT 1").fetchone() is None:
+                self._count_ratings(conn)
+            if conn.execute("SELECT 1 FROM search_terms LIMIT 1").fetchone() is None:
+                for email, name in conn.execute("SELECT email, name FROM users").fetchall():
+                    SQLUsers._index(conn, email, name)
+        self.users = SQLUsers(self.db)
+        for email, data in (accounts or {}).items():
+            self.users.add(email, data['name'], data['password'], data['role'])
+        self.bookings = SQLTable(self.db, 'bookings', Booking)
+        self.sessions = SQLTable(self.db, 'sessions', SessionBooking, date_field='date')
+        self.feedbacks = SQLTable(self.db, 'feedbacks', Feedback, user_field='user_email')
+
+    def batch(self):
+        """Run the store calls made inside it as one transaction (one commit)"""
+        return self.db.transaction()
+
+    def stats(self):
+        return dict(self.db.query("SELECT name, value FROM stats"))
+
+    def rebuild_stats(self):
+        """Recount every counter from the tables themselves"""
+        with self.db.transaction() as conn:
+            self._count_rows(conn)
+        return self.stats()
+
+    def update_user(self, old_email, new_email, name):
+        """Rename an account; a new email takes its bookings, sessions and feedback along.
+
+        One transaction, so nobody sees the account without its rows; each
+        UPDATE finds the rows through the user column's index. False if the
+        account is gone or the new email is taken.
+        """
+        with self.db.transaction() as conn:
+            if not self.users.update(old_email, new_email, name):
+                return False
+            if new_email != old_email:
+                bookings, sessions, feedbacks = _REASSIGN
+                conn.execute(bookings, (new_email, old_email))
+                conn.execute(sessions, (new_email, name, old_email))
+                conn.execute(feedbacks, (new_email, name, old_email))
+        return True
+
+    def ratings(self):
+        """Rating counters (see ratings.py), kept by triggers"""
+        return {ratings.counter(dimension, name, stars): count for dimension, name, stars, count in
+                self.db.query("SELECT dimension, name, stars, count FROM ratings WHERE count > 0")}
+
+    def rebuild_ratings(self):
+        """Recount the rating counters from the feedback rows"""
+        with self.db.transaction() as conn:
+            self._count_ratings(conn)
+        return self.ratings()
+
+    def search(self, filters):
+        """Rows matching search.parse() `filters`, newest first, at most MAX_RESULTS + 1.
+
+        One statement per combination of filters, so there are only a few
+        dozen and each is prepared once per connection; SQLite picks the
+        index (the customer's emails from search_terms, photographer/date,
+        status/date or the date alone).
+        """
+        q, limit = filters['q'], search.MAX_RESULTS + 1
+        if filters['section'] == 'users':
+            return [{'email': email, 'name': name, 'password': password, 'role': role}
+                    for email, name, password, role in self.db.query(_SEARCH_USERS, (q, q + _LAST_CHAR, limit))]
+        table = self.bookings if filters['section'] == 'bookings' else self.sessions
+        day = 'created_at' if filters['section'] == 'bookings' else 'date'
+        where, params = [], []
+        if q:
+            where.append("user IN (SELECT email FROM search_terms WHERE token >= ? AND token < ?)")
+            params += [q, q + _LAST_CHAR]
+        for field in ('status', 'photographer'):
+            if filters[field]:
+                where.append(f"{field} = ?")
+                params.append(filters[field])
+        if filters['service']:
+            where.append("service LIKE ? ESCAPE '\\'")
+            params.append(_escape_like(filters['service']) + '%')
+        if filters['first']:
+            where.append(f"{day} >= ?")
+            params.append(filters['first'])
+        if filters['last']:
+            where.append(f"{day} < ?")  # created_at is a timestamp, so the whole last day is below this
+            params.append(filters['last'] + _LAST_CHAR)
+        columns = ', '.join(table.record_type.__slots__)
+        rows = self.db.query(f"SELECT {columns} FROM {table.name} WHERE {' AND '.join(where)}"
+                             f" ORDER BY {day} DESC, id DESC LIMIT ?", params + [limit])
+        return table._records(rows)
+
+    def changed_since(self, cursor, limit=changes.LIMIT):
+        """(updated_at, section, id, record) for every write after `cursor`, oldest first; record None if deleted.
+
+        Reads at most `limit` + 1 changes per table, enough to tell the
+        caller there are more than it wants.
+        """
+        found = [(account['updated_at'], 'users', email, account)
+                 for email, account in self.users.changed_since(cursor, limit + 1)]
+        for section, table in (('bookings', self.bookings), ('sessions', self.sessions), ('feedback', self.feedbacks)):
+            found += [(record.updated_at, section, record.id, record)
+                      for record in table.changed_since(cursor, limit + 1)]
+        found += [(updated_at, section, record_id, None) for section, record_id, updated_at in self.db.query(
+            "SELECT section, id, updated_at FROM deletions WHERE updated_at > ? ORDER BY updated_at LIMIT ?",
+            (cursor, limit + 1))]
+        found.sort(key=lambda change: (change[0], change[3] is not None))  # a deletion first on a tie
+        return found
+
+    @staticmethod
+    def _count_rows(conn):
+        conn.execute("DELETE FROM stats")
+        for kind, (table, by_status) in COUNTED_TABLES.items():
+            conn.execute(f"INSERT INTO stats (name, value) SELECT '{kind}', COUNT(*) FROM {table}")
+            if by_status:
+                conn.execute(f"INSERT INTO stats (name, value) SELECT {_status_name(kind, table)}, COUNT(*)"
+                             f" FROM {table} GROUP BY 1")
+
+    @staticmethod
+    def _count_ratings(conn):
+        conn.execute("DELETE FROM ratings")
+        for dimension in ratings.DIMENSIONS:
+            conn.execute(f"INSERT INTO ratings (dimension, name, stars, count)"
+                         f" SELECT '{dimension}', {dimension}, rating, COUNT(*) FROM feedbacks"
+                         f" WHERE {_rated(dimension, 'feedbacks')} GROUP BY {dimension}, rating")
+
+    def reserve_session(self, record, start, end):
+        """Add a session unless it overlaps its photographer's other sessions"""
+        with self.db.transaction() as conn:
+            if conn.execute(_OVERLAP, (record.photographer, record.date, end, start)).fetchone():
+                return None
+            record.id = conn.execute(_INSERT_SESSION, (
+                record.user, record.user_name, record.service, record.photographer, record.date,
+                record.time, record.status, start, end)).lastrowid
+        return record
+
+    def cancel_session(self, session_id):
+        return self.sessions.set_status(session_id, 'Cancelled')
+
+    def free_slots(self, photographer, dates, duration):
+        if not dates:
+            return {}  # e.g. a range entirely in the past
+        schedule = availability.Schedule()
+        for session_id, date, start, end in self.db.query(_HELD, (photographer, dates[0], dates[-1])):
+            schedule.reserve(photographer, date, start, end, session_id)
+        return schedule.free_slots(photographer, dates, duration)
+
+    def add_upload(self, record, size, storage_key=None):
+        """Add a retouch booking that references its upload by content hash.
+
+        Reuses the stored copy of the content when there is one; otherwise
+        records `storage_key`, which the caller has just written. Returns None
+        when neither exists, so the caller stores the bytes and calls again.
+        """
+        with self.db.transaction() as conn:
+            row = conn.execute(_FIND_BLOB, (record.sha256,)).fetchone()
+            if row is not None:
+                conn.execute(_ADD_REF, (record.sha256,))
+                record.storage_key = row[0]
+            elif storage_key is None:
+                return None
+            else:
+                conn.execute(_INSERT_BLOB, (record.sha256, storage_key, size))
+                record.storage_key = storage_key
+            return self.bookings.add(record)
+
+    def delete_booking(self, booking_id, delete_blob):
+        """Delete a booking; `delete_blob(key, sha256)` runs if it held the last reference.
+
+        The blob row goes in the same transaction as the booking, and the
+        bytes only once that has committed: an upload of the same content
+        meanwhile finds no row and stores a copy under a key of its own.
+        """
+        unreferenced = None
+        with self.db.transaction() as conn:
+            record = self.bookings.delete(booking_id)
+            if record is not None and record.storage_key:
+                conn.execute(_DROP_REF, (record.sha256,))
+                unreferenced = conn.execute(_UNREFERENCED, (record.sha256,)).fetchone()
+                if unreferenced is not None:
+                    conn.execute(_DELETE_BLOB, (record.sha256,))
+        if unreferenced is not None:
+            delete_blob(unreferenced[0], record.sha256)
+        return record
@@ -0,0 +1,128 @@
+"""Materialized counters for the admin header and /admin/stats.
+
+Counting rows to show three numbers meant reading every row of every table
+on each admin page load. Instead, the write paths keep running totals:
+
+* app_aws.py - one item in the DynamoDB `Stats` table, changed with atomic
+               ADD updates right after the write they count (`apply`); never
+               inside the write's transaction, where every booking, session
+               and signup would hold the one item and concurrent ones would
+               cancel each other (TransactionConflict)
+* app.py     - SQLite triggers keep a `stats` table in step (sqlstore.py);
+               the in-memory store counts its status index buckets
+
+Counter names are `users`, `feedback`, `bookings` and `sessions`, plus
+`bookings_<status>` / `sessions_<status>` (status in lower case).
+
+An ADD made after its write is lost if a worker dies between the two (or
+made twice when a request replays its ClientRequestToken), so rebuild the DynamoDB totals from a full scan every
+now and then (a quiet hour is best, writes during the scan can be missed):
+
+    30 3 * * *  python stats.py
+    python stats.py --sqlite database.db     # app.py's SQLite store
+"""
+import argparse
+import logging
+import os
+
+logger = logging.getLogger(__name__)
+
+REGION = os.environ.get('AWS_REGION', 'us-east-1')
+KEY = {'id': 'totals'}
+
+# counter -> (table, counts rows per status?)
+COUNTED_TABLES = {
+    'users': ('Users', False),
+    'bookings': ('Bookings', True),
+    'sessions': ('Sessions', True),
+    'feedback': ('Feedback', False),
+}
+
+
+def status_counter(kind, status):
+    return f"{kind}_{(status or 'none').lower()}"
+
+
+def added(kind, status=None):
+    deltas = {kind: 1}
+    if status is not None:
+        deltas[status_counter(kind, status)] = 1
+    return deltas
+
+
+def removed(kind, status=None):
+    return {name: -delta for name, delta in added(kind, status).items()}
+
+
+def moved(kind, old_status, new_status):
+    if old_status == new_status:
+        return {}
+    return {status_counter(kind, old_status): -1, status_counter(kind, new_status): 1}
+
+
+def update(deltas, key=KEY):
+    """UpdateItem kwargs that ADD every delta to its counter"""
+    names = list(deltas)
+    return {
+        'Key': key,
+        'UpdateExpression': 'ADD ' + ', '.join(f"#c{i} :d{i}" for i in range(len(names))),
+        'ExpressionAttributeNames': {f"#c{i}": name for i, name in enumerate(names)},
+        'ExpressionAttributeValues': {f":d{i}": deltas[name] for i, name in enumerate(names)},
+    }
+
+
+def apply(stats_table, deltas, key=KEY):
+    """ADD `deltas` on their own; a failure is logged, not raised (the rebuild repairs it)"""
+    if not deltas:
+        return
+    try:
+        stats_table.update_item(**update(deltas, key))
+    except Exception as e:
+        logger.warning("Could not update stats %s: %s", deltas, e)
+
+
+def read(stats_table):
+    item = stats_table.get_item(Key=KEY, ConsistentRead=True).get('Item', {})
+    return {name: value for name, value in item.items() if name != 'id'}
+
+
+def count(db):
+    """Every counter, computed from a full scan of the counted tables"""
+    counts = {}
+    for kind, (table_name, by_status) in COUNTED_TABLES.items():
+        table = db.Table(table_name)
+        kwargs = ({'ProjectionExpression': '#st', 'ExpressionAttributeNames': {'#st': 'status'}}
+                  if by_status else {'Select': 'COUNT'})
+        total = 0
+        while True:
+            resp = table.scan(**kwargs)
+            total += resp['Count']
+            for item in resp['Items']:
+                name = status_counter(kind, item.get('status'))
+                counts[name] = counts.get(name, 0) + 1
+            if 'LastEvaluatedKey' not in resp:
+                break
+            kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+        counts[kind] = total
+    return counts
+
+
+def rebuild(db):
+    """Replace the Stats item with freshly counted totals"""
+    counts = count(db)
+    db.Table('Stats').put_item(Item={**KEY, **counts})
+    return counts
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Rebuild the admin counters from a full scan")
+    parser.add_argument('--sqlite', metavar='PATH', help="rebuild app.py's SQLite store instead of DynamoDB")
+    args = parser.parse_args()
+    if args.sqlite:
+        from sqlstore import SQLiteStore
+        totals = SQLiteStore(args.sqlite).rebuild_stats()
+    else:
+        import dynamo
+        totals = rebuild(dynamo.DynamoDB(region_name=REGION))
+    for name, value in sorted(totals.items()):
+        print(f"{name:<24} {value}")
@@ -0,0 +1,58 @@
+"""Shared fixtures: the repo root on sys.path, app.py on a fresh store of each backend,
+and app_aws.py on the in-process DynamoDB stand-in."""
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def local_app(request, tmp_path, tmp_path_factory, monkeypatch):
+    """The app.py module on an empty memstore.Store or sqlstore.SQLiteStore, uploads under tmp_path"""
+    # Imported once; the store it builds at import time is swapped out below
+    os.environ.setdefault('SQLITE_PATH', str(tmp_path_factory.getbasetemp() / 'import.db'))
+    import app
+    from blob_store import LocalBlobStore
+    from memstore import Store
+    from sqlstore import SQLiteStore
+    if request.param == 'memory':
+        store = Store(app.DEFAULT_USERS)
+    else:
+        store = SQLiteStore(str(tmp_path / 'app.db'), app.DEFAULT_USERS)
+    monkeypatch.setattr(app, 'store', store)
+    monkeypatch.setattr(app, 'upload_store', LocalBlobStore(str(tmp_path / 'uploads')))
+    app.app.config['TESTING'] = True
+    return app
+
+
+@pytest.fixture
+def fake_db():
+    """dynamo.DynamoDB over a fresh benchmarks/fake_dynamo.py holding every table"""
+    import dynamo
+    from benchmarks.fake_dynamo import create_fake
+    return dynamo.DynamoDB(create_fake())
+
+
+@pytest.fixture
+def aws_app(tmp_path_factory, fake_db):
+    """The app_aws module, its tables on `fake_db` and its cache empty"""
+    os.environ.setdefault('BLOB_BACKEND', 'local')
+    os.environ.setdefault('BLOB_ROOT', str(tmp_path_factory.getbasetemp() / 'blobs'))
+    import app_aws
+    app_aws.db.client = fake_db.client
+    app_aws.cache.local.clear()
+    app_aws.app.config['TESTING'] = True
+    return app_aws
+
+
+def login(client, email, name='Test User', role='user'):
+    with client.session_transaction() as s:
+        s.update(email=email, user=name, role=role)
+
+
+def flashes(client):
+    with client.session_transaction() as s:
+        return [message for _, message in s.pop('_flashes', [])]
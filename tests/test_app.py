@@ -0,0 +1,170 @@
+"""app.py routes on both local stores (see the local_app fixture)."""
+import io
+import os
+
+from memstore import Booking, Feedback, SessionBooking
+
+from conftest import flashes, login
+
+
+def _booking(app, user, filename='a.jpg', status='Pending'):
+    return app.store.bookings.add(Booking(id=None, user=user, service='Retouch: Portrait', filename=filename,
+                                          status=status, created_at='2030-01-01T10:00:00'))
+
+
+def _admin(app):
+    client = app.app.test_client()
+    login(client, 'admin@yojeong.com', name='Admin User', role='admin')
+    return client
+
+
+# --- Customer pages ---
+
+def test_dashboard_shows_only_the_customers_rows(local_app):
+    _booking(local_app, 'a@x', filename='mine.jpg')
+    _booking(local_app, 'b@x', filename='theirs.jpg')
+    local_app.store.feedbacks.add(Feedback(id='f1', user_name='A', user_email='a@x', service='Portrait Session',
+                                           rating=5, comment='Lovely'))
+    client = local_app.app.test_client()
+    login(client, 'a@x')
+    page = client.get('/dashboard').get_data(as_text=True)
+    assert 'mine.jpg' in page and 'Lovely' in page
+    assert 'theirs.jpg' not in page
+
+
+def test_availability(local_app):
+    client = local_app.app.test_client()
+    login(client, 'a@x')
+    client.post('/book_session', data={'session_type': 'Portrait', 'photographer': 'Sora Lee',
+                                       'session_time': '09:00 AM', 'session_date': '2099-01-01'})
+    query = {'photographer': 'Sora Lee', 'session_type': 'Portrait'}
+    free = client.get('/availability', query_string={**query, 'date_from': '2099-01-01',
+                                                     'date_to': '2099-01-02'}).get_json()['free']
+    assert '09:00 AM' not in free['2099-01-01'] and '09:00 AM' in free['2099-01-02']
+
+    past = client.get('/availability', query_string={**query, 'date_from': '2000-01-01', 'date_to': '2000-01-31'})
+    assert past.status_code == 200 and past.get_json()['free'] == {}
+
+
+def test_uploads_are_stored_once_per_content_and_collected_with_the_last_booking(local_app):
+    client = local_app.app.test_client()
+    login(client, 'a@x')
+    for name in ('first.pdf', 'second.pdf'):
+        client.post('/book', data={'service': 'Portrait', 'file': (io.BytesIO(b'%PDF same'), name)})
+    first, second = local_app.store.bookings.for_user('a@x')
+    assert first.storage_key == second.storage_key and first.storage_key.endswith('.pdf')
+    path = local_app.upload_store._path(first.storage_key)
+
+    admin = _admin(local_app)
+    admin.get(f"/admin/delete_booking/{first.id}")
+    assert os.path.exists(path)
+    admin.get(f"/admin/delete_booking/{second.id}")
+    assert not os.path.exists(path)
+
+    # A later upload of the same content is a new copy under a key of its own
+    client.post('/book', data={'service': 'Portrait', 'file': (io.BytesIO(b'%PDF same'), 'third.pdf')})
+    (third,) = local_app.store.bookings.for_user('a@x')
+    assert third.storage_key != first.storage_key and os.path.exists(local_app.upload_store._path(third.storage_key))
+
+
+# --- Admin actions ---
+
+def test_booking_status_routes(local_app):
+    approved, rejected = _booking(local_app, 'a@x'), _booking(local_app, 'a@x')
+    client = _admin(local_app)
+    client.get(f"/admin/approve/{approved.id}")
+    client.get(f"/admin/reject/{rejected.id}")
+    assert local_app.store.bookings.get(approved.id).status == 'Confirmed'
+    assert local_app.store.bookings.get(rejected.id).status == 'Cancelled'
+    assert local_app.store.stats()['bookings_confirmed'] == 1
+
+
+def test_session_status_routes(local_app):
+    sessions = [local_app.store.sessions.add(SessionBooking(
+        id=None, user='a@x', user_name='A', service='Portrait (with Sora Lee)', photographer='Sora Lee',
+        date='2099-01-01', time=time, status='Pending')) for time in ('09:00 AM', '01:00 PM')]
+    client = _admin(local_app)
+    client.get(f"/admin/confirm_session/{sessions[0].id}")
+    assert local_app.store.sessions.get(sessions[0].id).status == 'Upcoming'
+    client.get(f"/admin/complete_session/{sessions[0].id}")
+    client.get(f"/admin/cancel_session/{sessions[1].id}")
+    assert [local_app.store.sessions.get(s.id).status for s in sessions] == ['Completed', 'Cancelled']
+
+
+def test_a_cancelled_session_cannot_be_confirmed_back(local_app):
+    form = {'session_type': 'Portrait', 'photographer': 'Sora Lee', 'session_time': '09:00 AM',
+            'session_date': '2099-01-01'}
+    client = local_app.app.test_client()
+    login(client, 'a@x')
+    assert client.post('/book_session', data=form).status_code == 302
+    session_id = local_app.store.sessions.for_user('a@x')[0].id
+
+    admin = _admin(local_app)
+    admin.get(f"/admin/cancel_session/{session_id}")
+    admin.get(f"/admin/confirm_session/{session_id}")
+    admin.get(f"/admin/complete_session/{session_id}")
+    assert flashes(admin) == [f"Session {session_id} was cancelled and its time released. "
+                              "The customer has to book again."] * 2
+    assert local_app.store.sessions.get(session_id).status == 'Cancelled'
+
+    # The released time can go to someone else, and only once
+    login(client, 'b@x')
+    assert client.post('/book_session', data=form).status_code == 302
+    assert 'already booked' in client.post('/book_session', data=form).get_data(as_text=True)
+    assert [s.status for s in local_app.store.sessions.for_user('b@x')] == ['Pending']
+
+
+def _sessions(app, *times, date='2099-01-01'):
+    return [app.store.reserve_session(SessionBooking(
+        id=None, user='a@x', user_name='A', service='Portrait (with Sora Lee)', photographer='Sora Lee',
+        date=date, time=time, status='Pending'), start, start + 60) for time, start in times]
+
+
+def test_bulk_update_json_reports_each_id(local_app):
+    confirmed, pending = _booking(local_app, 'a@x', status='Confirmed'), _booking(local_app, 'a@x')
+    response = _admin(local_app).post('/admin/bulk/bookings', json={
+        'ids': [confirmed.id, pending.id, pending.id, 999999, 'x'], 'status': 'Confirmed'})
+    assert response.get_json()['results'] == {str(confirmed.id): 'unchanged', str(pending.id): 'updated',
+                                              '999999': 'not_found', 'x': 'not_found'}
+    assert response.get_json()['summary'] == {'unchanged': 1, 'updated': 1, 'not_found': 2}
+    assert local_app.store.stats()['bookings_confirmed'] == 2
+
+
+def test_bulk_update_form_flashes_a_summary(local_app):
+    bookings = [_booking(local_app, 'a@x') for _ in range(3)]
+    client = _admin(local_app)
+    response = client.post('/admin/bulk/bookings', data={'ids': [b.id for b in bookings], 'status': 'Cancelled'})
+    assert response.status_code == 302 and 'section=uploads' in response.headers['Location']
+    assert flashes(client) == ["Bookings set to Cancelled: 3 updated"]
+    client.post('/admin/bulk/bookings', data={'ids': [bookings[0].id], 'status': 'Pending'})
+    client.post('/admin/bulk/bookings', data={'status': 'Confirmed'})
+    assert flashes(client) == ["Status must be one of: Confirmed, Cancelled", "Nothing selected."]
+    assert client.post('/admin/bulk/bookings?format=json', data={'status': 'Confirmed'}).status_code == 400
+
+
+def test_bulk_cancel_releases_session_time(local_app):
+    cancelled, upcoming = _sessions(local_app, ('09:00 AM', 540), ('01:00 PM', 780))
+    client = _admin(local_app)
+    client.post('/admin/bulk/sessions', json={'ids': [cancelled.id], 'status': 'Cancelled'})
+    results = client.post('/admin/bulk/sessions', json={'ids': [cancelled.id, upcoming.id],
+                                                        'status': 'Confirmed'}).get_json()['results']
+    assert results == {str(cancelled.id): 'not_allowed', str(upcoming.id): 'updated'}
+    assert local_app.store.sessions.get(upcoming.id).status == 'Upcoming'  # not today: Confirmed reads Upcoming
+    free = local_app.store.free_slots('Sora Lee', ['2099-01-01'], 60)['2099-01-01']
+    assert '09:00 AM' in free and '01:00 PM' not in free
+
+
+def test_delete_feedback(local_app):
+    local_app.store.feedbacks.add(Feedback(id='f1', user_name='A', user_email='a@x', service='Portrait Session',
+                                           rating=4, comment='Nice'))
+    _admin(local_app).get('/admin/delete_feedback/f1')
+    assert local_app.store.feedbacks.get('f1') is None
+    assert local_app.store.ratings() == {}
+
+
+def test_admin_routes_need_an_admin(local_app):
+    booking = _booking(local_app, 'a@x')
+    client = local_app.app.test_client()
+    login(client, 'a@x')
+    assert client.get(f"/admin/approve/{booking.id}").status_code == 403
+    assert local_app.store.bookings.get(booking.id).status == 'Pending'
@@ -0,0 +1,273 @@
+"""app_aws.py routes on the in-process DynamoDB stand-in: per-user index reads and transactional writes."""
+import hashlib
+import io
+
+from botocore.exceptions import ClientError
+
+import ratings
+import stats
+from create_tables import USER_INDEX
+
+from conftest import flashes, login
+
+
+def _booking(booking_id, user, created_at, **extra):
+    return {'id': booking_id, 'user': user, 'user_name': 'A', 'service': 'Retouch: Retouching',
+            'status': 'Pending', 'created_at': created_at, **extra}
+
+
+class _Paged:
+    """Table whose queries return `limit` items per page, like a table past DynamoDB's 1MB pages"""
+
+    def __init__(self, table, limit):
+        self.table = table
+        self.limit = limit
+        self.calls = 0
+
+    def query(self, **kwargs):
+        self.calls += 1
+        return self.table.query(Limit=self.limit, **kwargs)
+
+
+# --- Reads through the per-user indexes ---
+
+def test_query_all_reads_every_page_newest_first(aws_app, fake_db):
+    table = fake_db.Table('Bookings')
+    for n in range(5):
+        table.put_item(Item=_booking(f"b{n}", 'a@x', f"2030-01-0{n + 1}T10:00:00"))
+    table.put_item(Item=_booking('other', 'b@x', '2030-01-09T10:00:00'))
+
+    paged = _Paged(table, limit=2)
+    items = aws_app.query_all(paged, USER_INDEX, 'user', 'a@x')
+    assert [item['id'] for item in items] == ['b4', 'b3', 'b2', 'b1', 'b0']
+    assert paged.calls == 3
+
+
+def test_dashboard_shows_only_the_customers_rows(aws_app, fake_db):
+    fake_db.Table('Bookings').put_item(Item=_booking('b1', 'a@x', '2030-01-01T10:00:00', filename='mine.jpg'))
+    fake_db.Table('Bookings').put_item(Item=_booking('b2', 'b@x', '2030-01-01T10:00:00', filename='theirs.jpg'))
+    fake_db.Table('Feedback').put_item(Item={'id': 'f1', 'user_email': 'a@x', 'user_name': 'A',
+                                             'service': 'Portrait Session', 'rating': 5,
+                                             'comment': 'Lovely', 'created_at': '2030-01-02T10:00:00'})
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    page = client.get('/dashboard').get_data(as_text=True)
+    assert 'mine.jpg' in page and 'Lovely' in page
+    assert 'theirs.jpg' not in page
+
+
+def test_dashboard_lists_bookings_and_sessions_newest_first(aws_app, fake_db):
+    for booking_id, day in (('b1', '01'), ('b3', '03')):
+        fake_db.Table('Bookings').put_item(Item=_booking(booking_id, 'a@x', f"2030-01-{day}T10:00:00",
+                                                         filename=f"upload-{day}.jpg"))
+    for session_id, day in (('s2', '02'), ('s4', '04')):
+        fake_db.Table('Sessions').put_item(Item={'id': session_id, 'user': 'a@x', 'service': 'Portrait',
+                                                 'date': f"2031-02-{day}", 'time': '09:00 AM', 'status': 'Pending',
+                                                 'created_at': f"2030-01-{day}T10:00:00"})
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    page = client.get('/dashboard').get_data(as_text=True)
+    rows = [page.index(text) for text in ('2031-02-04', 'upload-03.jpg', '2031-02-02', 'upload-01.jpg')]
+    assert rows == sorted(rows)
+
+
+# --- Transactional writes ---
+
+def test_signup_reports_an_existing_account(aws_app, fake_db):
+    client = aws_app.app.test_client()
+    form = {'name': 'Ann Lee', 'email': 'a@x', 'password': 'pw', 'confirm': 'pw'}
+    client.post('/signup', data=form)
+    assert flashes(client) == ["Account created! Please login."]
+    aws_app.cache.local.clear()  # so the transaction, not the cached lookup, finds the account
+    client.post('/signup', data=form)
+    assert flashes(client) == ["Account already exists!"]
+    assert stats.read(aws_app.stats_table)['users'] == 1
+
+
+def test_signup_failure_is_not_reported_as_an_existing_account(aws_app, fake_db, monkeypatch):
+    def throttled(*args, **kwargs):
+        raise ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'TransactWriteItems')
+    monkeypatch.setattr(aws_app.db, 'transact_write', throttled)
+    client = aws_app.app.test_client()
+    client.post('/signup', data={'name': 'Ann', 'email': 'a@x', 'password': 'pw', 'confirm': 'pw'})
+    assert flashes(client) == ["We couldn't create your account just now. Please try again."]
+
+
+def _session_form(**extra):
+    return {'session_type': 'Portrait', 'photographer': 'Sora Lee', 'session_time': '09:00 AM',
+            'session_date': '2099-01-01', 'idempotency_key': 'k1', **extra}
+
+
+def test_reserve_session_holds_the_photographer(aws_app, fake_db):
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    client.post('/book_session', data=_session_form())
+    assert flashes(client) == ["Session booked successfully!"]
+    client.post('/book_session', data=_session_form())
+    assert flashes(client) == ["This session request was already received."]
+
+    login(client, 'b@x')
+    client.post('/book_session', data=_session_form(idempotency_key='k2'))
+    assert flashes(client) == ["Sora Lee is already booked at 09:00 AM on 2099-01-01. Please pick another time."]
+    counts = stats.read(aws_app.stats_table)
+    assert counts['sessions'] == 1 and counts['sessions_pending'] == 1
+
+
+def test_a_cancelled_session_cannot_be_confirmed_back(aws_app, fake_db):
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    client.post('/book_session', data=_session_form())
+    session_id = fake_db.Table('Sessions').scan()['Items'][0]['id']
+    flashes(client)
+
+    admin = aws_app.app.test_client()
+    login(admin, 'admin@x', role='admin')
+    admin.get(f"/admin/cancel_session/{session_id}")
+    admin.get(f"/admin/confirm_session/{session_id}")
+    admin.get(f"/admin/complete_session/{session_id}")
+    assert flashes(admin) == [f"Session {session_id} was cancelled and its slots released. "
+                              "The customer has to book again."] * 2
+    assert fake_db.Table('Sessions').get_item(Key={'id': session_id})['Item']['status'] == 'Cancelled'
+
+    # The released slot can go to someone else, and only once
+    login(client, 'b@x')
+    client.post('/book_session', data=_session_form(idempotency_key='k2'))
+    assert flashes(client) == ["Session booked successfully!"]
+    counts = stats.read(aws_app.stats_table)
+    assert counts['sessions_cancelled'] == 1 and counts['sessions_pending'] == 1
+
+
+def test_confirm_session_sets_the_day_status(aws_app, fake_db):
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    client.post('/book_session', data=_session_form())
+    session_id = fake_db.Table('Sessions').scan()['Items'][0]['id']
+    admin = aws_app.app.test_client()
+    login(admin, 'admin@x', role='admin')
+    admin.get(f"/admin/confirm_session/{session_id}")
+    assert fake_db.Table('Sessions').get_item(Key={'id': session_id})['Item']['status'] == 'Upcoming'
+    admin.get(f"/admin/complete_session/{session_id}")
+    assert fake_db.Table('Sessions').get_item(Key={'id': session_id})['Item']['status'] == 'Completed'
+    assert flashes(admin) == []
+
+
+def test_book_session_flashes_when_the_write_fails(aws_app, fake_db, monkeypatch):
+    def conflicted(*args, **kwargs):
+        raise ClientError({'Error': {'Code': 'TransactionCanceledException', 'Message': 'conflict'},
+                           'CancellationReasons': [{'Code': 'TransactionConflict'}]}, 'TransactWriteItems')
+    monkeypatch.setattr(aws_app.db, 'transact_write', conflicted)
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    response = client.post('/book_session', data=_session_form())
+    assert response.status_code == 302
+    assert flashes(client) == ["We couldn't book this session just now. Please try again."]
+
+
+def test_feedback_only_counts_known_services_and_photographers(aws_app, fake_db):
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+    client.post('/submit_feedback', data={'service': 'x' * 300, 'rating': '5'})
+    client.post('/submit_feedback', data={'service': 'Portrait Session', 'photographer': 'Nobody', 'rating': '5'})
+    assert flashes(client) == ["Please choose a service and photographer from the list."] * 2
+    client.post('/submit_feedback', data={'service': 'Portrait Session', 'photographer': 'Sora Lee', 'rating': '4'})
+    assert ratings.read(aws_app.stats_table) == {'service#Portrait Session#4': 1, 'photographer#Sora Lee#4': 1}
+    assert stats.read(aws_app.stats_table) == {'feedback': 1}
+
+
+# --- Admin pages ---
+
+def test_admin_more_pages_through_a_section(aws_app, fake_db):
+    for n in range(aws_app.ADMIN_PAGE_SIZE + 5):
+        fake_db.Table('Bookings').put_item(Item=_booking(f"b{n:03}", 'a@x', '2030-01-01T10:00:00'))
+    _, cursor, _ = aws_app.admin_page('bookings')
+    client = aws_app.app.test_client()
+    login(client, 'admin@x', role='admin')
+    response = client.get('/admin/more/bookings', query_string={'cursor': cursor})
+    assert response.status_code == 200
+    assert response.headers['X-Next-Cursor'] == ''
+    assert response.get_data(as_text=True).count('<tr') == 5
+
+
+def test_admin_pages_reject_cursors_that_are_not_keys(aws_app, fake_db):
+    client = aws_app.app.test_client()
+    login(client, 'admin@x', role='admin')
+    for cursor in ('not a cursor', aws_app.encode_cursor(['b1']), aws_app.encode_cursor({'email': 'a@x'}),
+                   aws_app.encode_cursor({'id': {'S': 'b1'}}), aws_app.encode_cursor({'id': 'b1', 'user': 'a@x'})):
+        assert client.get('/admin/more/bookings', query_string={'cursor': cursor}).status_code == 400
+        assert client.get('/admin', query_string={'bookings_cursor': cursor}).status_code == 400
+    assert client.get('/admin/more/users', query_string={'cursor': aws_app.encode_cursor({'email': 'a@x'})}).status_code == 200
+
+
+def test_bulk_update_reports_a_throttled_read(aws_app, fake_db, monkeypatch):
+    def throttled(*args, **kwargs):
+        raise ClientError({'Error': {'Code': 'ProvisionedThroughputExceededException',
+                                     'Message': '1 keys still unprocessed'}}, 'BatchGetItem')
+    monkeypatch.setattr(aws_app.db, 'batch_get', throttled)
+    client = aws_app.app.test_client()
+    login(client, 'admin@x', role='admin')
+    response = client.post('/admin/bulk/bookings', json={'ids': ['b1'], 'status': 'Confirmed'})
+    assert response.status_code == 502 and 'ProvisionedThroughputExceeded' in response.get_json()['error']
+    assert client.post('/admin/bulk/bookings', data={'ids': 'b1', 'status': 'Confirmed'}).status_code == 302
+    assert flashes(client)[0].startswith("Bulk update failed:")
+
+
+def _edit_user(aws_app, old_email, new_email, new_name='Ann Park'):
+    client = aws_app.app.test_client()
+    login(client, 'admin@x', role='admin')
+    client.post('/edit_user', data={'old_email': old_email, 'new_email': new_email, 'new_name': new_name})
+    return flashes(client)
+
+
+def test_edit_user_reports_a_taken_email(aws_app, fake_db):
+    for email, name in (('a@x', 'Ann Lee'), ('b@x', 'Bo Kim')):
+        fake_db.Table('Users').put_item(Item={'email': email, 'name': name, 'password': 'pw', 'role': 'user'})
+    assert _edit_user(aws_app, 'a@x', 'b@x') == ["b@x already has an account."]
+    assert fake_db.Table('Users').get_item(Key={'email': 'a@x'})['Item']['name'] == 'Ann Lee'
+
+
+def test_edit_user_flashes_when_the_write_fails(aws_app, fake_db, monkeypatch):
+    fake_db.Table('Users').put_item(Item={'email': 'a@x', 'name': 'Ann Lee', 'password': 'pw', 'role': 'user'})
+    failures = [
+        ClientError({'Error': {'Code': 'ThrottlingException', 'Message': 'slow down'}}, 'TransactWriteItems'),
+        # Retries ran out on a conflict; the reasons list can also come back shorter than the operations
+        ClientError({'Error': {'Code': 'TransactionCanceledException', 'Message': 'conflict'},
+                     'CancellationReasons': [{'Code': 'TransactionConflict'}]}, 'TransactWriteItems'),
+    ]
+    for failure in failures:
+        def failing(*args, **kwargs):
+            raise failure
+        monkeypatch.setattr(aws_app.db, 'transact_write', failing)
+        for new_email in ('a@x', 'ann@x'):
+            assert _edit_user(aws_app, 'a@x', new_email) == \
+                ["We couldn't save the changes to this customer just now. Please try again."]
+    assert fake_db.Table('Users').get_item(Key={'email': 'a@x'})['Item']['name'] == 'Ann Lee'
+
+
+# --- Downloads ---
+
+def _stored_file(aws_app, fake_db, data):
+    sha256 = hashlib.sha256(data).hexdigest()
+    blob = aws_app.blob_store.put_stream(f"test/{sha256}", io.BytesIO(data))
+    fake_db.Table('Files').put_item(Item={'id': sha256, 'filename': 'photo.jpg', 'storage_key': blob.key,
+                                          'sha256': sha256, 'content_type': 'image/jpeg', 'size': len(data),
+                                          'created_at': '2030-01-01T10:00:00'})
+    return sha256
+
+
+def test_download_ranges(aws_app, fake_db):
+    data = bytes(range(10))
+    file_id = _stored_file(aws_app, fake_db, data)
+    client = aws_app.app.test_client()
+    login(client, 'a@x')
+
+    partial = client.get(f"/download/{file_id}", headers={'Range': 'bytes=2-4'})
+    assert partial.status_code == 206 and partial.data == data[2:5]
+    assert partial.headers['Content-Range'] == 'bytes 2-4/10'
+
+    unsatisfiable = client.get(f"/download/{file_id}", headers={'Range': 'bytes=20-30'})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers['Content-Range'] == 'bytes */10'
+
+    # No multipart/byteranges support: several ranges get the whole file
+    several = client.get(f"/download/{file_id}", headers={'Range': 'bytes=0-1,5-6'})
+    assert several.status_code == 200 and several.data == data
@@ -0,0 +1,118 @@
+"""assets.py on a throwaway static folder: the build step, immutable asset URLs and the page cache."""
+import gzip
+import os
+
+import pytest
+from flask import Flask, flash, url_for
+
+import assets
+
+CSS = b'body { color: #333; }\n' * 100
+
+
+@pytest.fixture
+def static_dir(tmp_path):
+    root = tmp_path / 'static'
+    (root / 'css').mkdir(parents=True)
+    (root / 'css' / 'site.css').write_bytes(CSS)
+    (root / 'panda.jpeg').write_bytes(b'\xff\xd8 not really a jpeg')
+    (root / 'uploads' / 'content' / 'ab').mkdir(parents=True)
+    (root / 'uploads' / 'content' / 'ab' / '1.jpg').write_bytes(b'upload')
+    return str(root)
+
+
+@pytest.fixture
+def site(static_dir, tmp_path, monkeypatch):
+    """A Flask app wired up with assets.init_app after a build, with one cached page"""
+    monkeypatch.setattr(assets, '_pages', {})
+    templates = tmp_path / 'templates'
+    templates.mkdir()
+    (templates / 'page.html').write_text(
+        "<link href=\"{{ url_for('static', filename='css/site.css') }}\">"
+        "{% for message in get_flashed_messages() %}<p>{{ message }}</p>{% endfor %}" + 'x' * 2000)
+    assets.build(static_dir)
+    app = Flask(__name__, static_folder=static_dir, template_folder=str(templates))
+    app.secret_key = 'test'
+    assets.init_app(app, immutable_prefixes=('uploads/content/',))
+
+    @app.route('/')
+    def page():
+        return assets.cached_page('page.html', flashes=True)
+
+    @app.route('/flash')
+    def add_flash():
+        flash('Saved!')
+        return 'ok'
+    return app
+
+
+# --- Build step ---
+
+def test_build_fingerprints_assets_and_precompresses_text(static_dir):
+    manifest = assets.build(static_dir)
+    css = manifest['css/site.css']
+    assert css == f"dist/css/site.{assets.fingerprint(os.path.join(static_dir, 'css', 'site.css'))}.css"
+    with open(os.path.join(static_dir, css + '.gz'), 'rb') as f:
+        assert gzip.decompress(f.read()) == CSS
+    assert not os.path.exists(os.path.join(static_dir, manifest['panda.jpeg'] + '.gz'))
+    assert not any(name.startswith(('uploads/', 'dist/')) for name in manifest)
+    assert assets.load_manifest(static_dir) == manifest
+
+
+def test_a_rebuild_keeps_earlier_copies(static_dir):
+    old = assets.build(static_dir)['css/site.css']
+    with open(os.path.join(static_dir, 'css', 'site.css'), 'ab') as f:
+        f.write(b'a { color: red; }\n')
+    new = assets.build(static_dir)['css/site.css']
+    assert new != old
+    assert os.path.exists(os.path.join(static_dir, old)) and os.path.exists(os.path.join(static_dir, new))
+
+
+# --- Serving ---
+
+def test_asset_urls_point_at_immutable_fingerprinted_copies(site, static_dir):
+    with site.test_request_context():
+        url = url_for('static', filename='css/site.css')
+    built = assets.load_manifest(static_dir)['css/site.css']
+    assert url == f"/static/{built}"
+
+    client = site.test_client()
+    with client.get(url, headers={'Accept-Encoding': 'gzip'}) as compressed:
+        assert compressed.headers['Cache-Control'] == assets.IMMUTABLE
+        assert compressed.headers['Content-Encoding'] == 'gzip' and 'Accept-Encoding' in compressed.headers['Vary']
+        assert gzip.decompress(compressed.data) == CSS
+    with client.get(url, headers={'Accept-Encoding': 'identity'}) as plain:
+        assert 'Content-Encoding' not in plain.headers and plain.data == CSS
+
+
+def test_immutable_prefixes_and_unbuilt_files(site):
+    client = site.test_client()
+    with client.get('/static/uploads/content/ab/1.jpg') as upload:
+        assert upload.headers['Cache-Control'] == assets.IMMUTABLE
+    with client.get('/static/css/site.css') as unbuilt:
+        assert unbuilt.headers.get('Cache-Control') != assets.IMMUTABLE
+
+
+# --- Page cache ---
+
+def test_cached_page_revalidates_with_its_etag(site):
+    client = site.test_client()
+    first = client.get('/', headers={'Accept-Encoding': 'identity'})
+    assert first.status_code == 200 and first.headers['Cache-Control'] == assets.PAGE_CACHE_CONTROL
+    etag = first.headers['ETag']
+    assert client.get('/', headers={'If-None-Match': etag, 'Accept-Encoding': 'identity'}).status_code == 304
+
+    compressed = client.get('/', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert compressed.headers['ETag'] != etag  # one ETag per representation
+    assert gzip.decompress(compressed.data) == first.data
+    assert client.get('/', headers={'If-None-Match': compressed.headers['ETag'],
+                                    'Accept-Encoding': 'gzip'}).status_code == 304
+
+
+def test_cached_page_still_shows_flashed_messages(site):
+    client = site.test_client()
+    assert b'Saved!' not in client.get('/').data
+    client.get('/flash')
+    assert b'<p>Saved!</p>' in client.get('/', headers={'Accept-Encoding': 'identity'}).data
+    assert b'Saved!' not in client.get('/', headers={'Accept-Encoding': 'identity'}).data  # shown once
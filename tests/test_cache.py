@@ -0,0 +1,170 @@
+"""cache.py: the per-worker LRU, and namespace invalidation with and without a shared Redis tier."""
+import threading
+import time
+
+import pytest
+
+import cache as caching
+
+
+class FakeRedis:
+    """The part of redis.Redis that RedisCache uses, in memory: bytes values, expiry, atomic INCR"""
+
+    def __init__(self):
+        self._data = {}  # key -> (value bytes, expires_at or None)
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None or (entry[1] is not None and entry[1] <= time.monotonic()):
+                self._data.pop(key, None)
+                return None
+            return entry[0]
+
+    def set(self, key, value, ex=None):
+        if isinstance(value, str):
+            value = value.encode()
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + ex if ex else None)
+        return True
+
+    def delete(self, key):
+        with self._lock:
+            return int(self._data.pop(key, None) is not None)
+
+    def incr(self, key):
+        with self._lock:
+            value = int(self._data.get(key, (b'0', None))[0]) + 1
+            self._data[key] = (str(value).encode(), None)
+            return value
+
+
+def _loader(value):
+    calls = []
+
+    def load():
+        calls.append(value)
+        return value
+    return load, calls
+
+
+# --- LRUCache ---
+
+def test_lru_evicts_the_least_recently_used():
+    lru = caching.LRUCache(maxsize=2, ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2)
+    assert lru.get('a') == 1  # 'b' is now the oldest
+    lru.set('c', 3)
+    assert lru.get('b') is caching.MISSING
+    assert lru.stats() == {'size': 2, 'hits': 1, 'misses': 1, 'evictions': 1}
+
+
+def test_lru_entries_expire(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    lru = caching.LRUCache(ttl=60)
+    lru.set('a', 1)
+    lru.set('b', 2, ttl=5)
+    now[0] += 10
+    assert lru.get('a') == 1
+    assert lru.get('b') is caching.MISSING
+
+
+# --- Cache, local tier only ---
+
+def test_get_or_load_loads_once():
+    cache = caching.Cache(caching.LRUCache())
+    load, calls = _loader({'email': 'a@x'})
+    assert cache.get_or_load('user:a@x', load) == {'email': 'a@x'}
+    assert cache.get_or_load('user:a@x', load) == {'email': 'a@x'}
+    assert calls == [{'email': 'a@x'}]
+    assert cache.stats()['loads'] == 1
+
+
+def test_invalidating_a_namespace_changes_its_keys():
+    cache = caching.Cache(caching.LRUCache())
+    page = cache.key('bookings', 'cursor-1')
+    users = cache.key('users', 'cursor-1')
+    cache.set(page, ['row'])
+    cache.invalidate_namespace('bookings')
+    assert cache.key('bookings', 'cursor-1') != page
+    assert cache.key('users', 'cursor-1') == users  # other namespaces keep their entries
+    load, calls = _loader(['fresh row'])
+    assert cache.get_or_load(cache.key('bookings', 'cursor-1'), load) == ['fresh row']
+    assert calls == [['fresh row']]
+
+
+def test_delete_drops_a_point_lookup():
+    cache = caching.Cache(caching.LRUCache())
+    cache.set('user:a@x', {'name': 'Old'})
+    cache.delete('user:a@x')
+    load, calls = _loader({'name': 'New'})
+    assert cache.get_or_load('user:a@x', load) == {'name': 'New'}
+
+
+# --- Cache with a shared Redis tier ---
+
+@pytest.fixture
+def redis():
+    return FakeRedis()
+
+
+def _worker(redis, local_ttl=5):
+    """One gunicorn worker's cache: its own LRU in front of the shared server"""
+    return caching.Cache(caching.LRUCache(ttl=local_ttl), caching.RedisCache(ttl=60, client=redis))
+
+
+def test_shared_tier_serves_other_workers(redis):
+    first, second = _worker(redis), _worker(redis)
+    first.set('user:a@x', {'email': 'a@x', 'name': 'Ann'})
+    load, calls = _loader(None)
+    assert second.get_or_load('user:a@x', load) == {'email': 'a@x', 'name': 'Ann'}
+    assert calls == []
+    assert second.stats()['shared'] == {'hits': 1, 'misses': 0}
+
+
+def test_one_workers_write_invalidates_every_workers_listings(redis):
+    first, second = _worker(redis), _worker(redis)
+    load, _ = _loader(['page 1'])
+    second.get_or_load(second.key('users', ''), load)
+
+    first.invalidate_namespace('users')  # e.g. a signup handled by the first worker
+
+    load, calls = _loader(['page 1 with the new user'])
+    assert second.get_or_load(second.key('users', ''), load) == ['page 1 with the new user']
+    assert calls == [['page 1 with the new user']]
+    assert first.key('users', '') == second.key('users', '')
+
+
+def test_shared_delete_reaches_other_workers_after_their_local_ttl(redis, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(caching.time, 'monotonic', lambda: now[0])
+    first, second = _worker(redis), _worker(redis)
+    second.set('user:a@x', {'name': 'Old'})
+    first.delete('user:a@x')
+
+    load, calls = _loader({'name': 'New'})
+    assert second.get_or_load('user:a@x', load) == {'name': 'Old'}  # still in its own LRU
+    now[0] += 6
+    assert second.get_or_load('user:a@x', load) == {'name': 'New'}
+    assert calls == [{'name': 'New'}]
+
+
+def test_shared_values_expire(redis, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, 'monotonic', lambda: now[0])
+    shared = caching.RedisCache(ttl=60, client=redis)
+    shared.set('k', [1, 2])
+    shared.set('short', 'x', ttl=1)
+    assert shared.get('short') == 'x'
+    now[0] += 2
+    assert shared.get('k') == [1, 2]
+    assert shared.get('short') is caching.MISSING
+
+
+def test_from_env_builds_the_tiers():
+    local_only = caching.from_env({'CACHE_TTL': '30', 'CACHE_SIZE': '10'})
+    assert local_only.shared is None
+    assert (local_only.local.maxsize, local_only.local.ttl) == (10, 30)
@@ -0,0 +1,225 @@
+"""dynamo.py against the in-process DynamoDB stand-in: decoding, pagination, transactions."""
+import threading
+import time
+
+import pytest
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+
+import dynamo
+from benchmarks.fake_dynamo import create_fake
+from create_tables import USER_INDEX
+
+
+# --- Wire format ---
+
+def test_deserialize_every_type():
+    item = {
+        's': {'S': 'text'}, 'int': {'N': '42'}, 'float': {'N': '2.5'}, 'whole': {'N': '3.0'},
+        'exp': {'N': '1E+2'}, 'yes': {'BOOL': True}, 'none': {'NULL': True},
+        'map': {'M': {'n': {'N': '1'}, 'l': {'L': [{'S': 'a'}, {'N': '0.5'}]}}},
+        'ss': {'SS': ['a', 'b']}, 'ns': {'NS': ['1', '2.5']}, 'b': {'B': b'\x00'}, 'bs': {'BS': [b'x']},
+    }
+    assert dynamo.deserialize(item) == {
+        's': 'text', 'int': 42, 'float': 2.5, 'whole': 3, 'exp': 100, 'yes': True, 'none': None,
+        'map': {'n': 1, 'l': ['a', 0.5]}, 'ss': {'a', 'b'}, 'ns': {1, 2.5}, 'b': b'\x00', 'bs': {b'x'},
+    }
+    assert type(dynamo.deserialize(item)['int']) is int
+
+
+def test_deserialize_rejects_unknown_types():
+    with pytest.raises(TypeError):
+        dynamo.deserialize({'x': {'Q': 'what'}})
+
+
+def test_serialize_round_trips():
+    item = {'id': 'a', 'n': 7, 'f': 0.25, 'flag': False, 'nothing': None,
+            'nested': {'tags': ['x', 1]}, 'names': {'p', 'q'}, 'raw': b'bytes'}
+    wire = dynamo.serialize(item)
+    assert wire['flag'] == {'BOOL': False}  # not N: bool is checked before int
+    assert dynamo.deserialize(wire) == item
+
+
+def test_build_request_expands_conditions():
+    params = dynamo.build_request('Bookings', {
+        'IndexName': USER_INDEX,
+        'KeyConditionExpression': Key('user').eq('a@x'),
+        'FilterExpression': Attr('status').eq('Pending'),
+        'ExclusiveStartKey': {'id': 'b1'},
+    })
+    assert params['TableName'] == 'Bookings'
+    assert isinstance(params['KeyConditionExpression'], str)
+    assert {'S': 'a@x'} in params['ExpressionAttributeValues'].values()
+    assert {'S': 'Pending'} in params['ExpressionAttributeValues'].values()
+    assert params['ExclusiveStartKey'] == {'id': {'S': 'b1'}}
+
+
+# --- Reads ---
+
+def test_table_calls_return_native_values(fake_db):
+    table = fake_db.Table('Bookings')
+    table.put_item(Item={'id': 'b1', 'user': 'a@x', 'created_at': '2030-01-01T10:00:00', 'price': 12})
+    assert table.get_item(Key={'id': 'b1'})['Item']['price'] == 12
+    assert 'Item' not in table.get_item(Key={'id': 'missing'})
+    old = table.update_item(Key={'id': 'b1'}, UpdateExpression='SET price = :p',
+                            ExpressionAttributeValues={':p': 15}, ReturnValues='ALL_OLD')
+    assert old['Attributes']['price'] == 12
+
+
+def test_query_pages_follow_last_evaluated_key(fake_db):
+    table = fake_db.Table('Bookings')
+    for n in range(7):
+        table.put_item(Item={'id': f"b{n}", 'user': 'a@x', 'created_at': f"2030-01-0{n + 1}T10:00:00"})
+    table.put_item(Item={'id': 'other', 'user': 'b@x', 'created_at': '2030-01-01T10:00:00'})
+
+    kwargs = {'IndexName': USER_INDEX, 'KeyConditionExpression': Key('user').eq('a@x'),
+              'ScanIndexForward': False, 'Limit': 3}
+    pages = []
+    while True:
+        resp = table.query(**kwargs)
+        pages.append([item['id'] for item in resp['Items']])
+        if 'LastEvaluatedKey' not in resp:
+            break
+        assert set(resp['LastEvaluatedKey']) == {'id', 'user', 'created_at'}  # decoded, index keys included
+        kwargs['ExclusiveStartKey'] = resp['LastEvaluatedKey']
+    assert pages == [['b6', 'b5', 'b4'], ['b3', 'b2', 'b1'], ['b0']]
+
+
+def test_batch_get_splits_keys_into_calls(fake_db):
+    table = fake_db.Table('Users')
+    for n in range(130):
+        table.put_item(Item={'email': f"u{n}@x", 'name': f"User {n}"})
+    keys = [{'email': f"u{n}@x"} for n in range(130)] + [{'email': 'nobody@x'}]
+    found = fake_db.batch_get('Users', keys)
+    assert sorted(user['email'] for user in found) == sorted(f"u{n}@x" for n in range(130))
+
+
+class _Throttled:
+    """Client whose first `throttled` BatchGetItem calls process nothing (all keys come back unprocessed)"""
+
+    def __init__(self, client, throttled):
+        self.client = client
+        self.throttled = throttled
+        self.calls = 0
+
+    def batch_get_item(self, **params):
+        self.calls += 1
+        if self.calls <= self.throttled:
+            return {'Responses': {}, 'UnprocessedKeys': params['RequestItems']}
+        return self.client.batch_get_item(**params)
+
+    def __getattr__(self, name):
+        return getattr(self.client, name)
+
+
+def test_batch_get_retries_unprocessed_keys(fake_db, monkeypatch):
+    monkeypatch.setattr(dynamo.time, 'sleep', lambda seconds: None)
+    fake_db.Table('Users').put_item(Item={'email': 'a@x'})
+    client = _Throttled(fake_db.client, throttled=dynamo.BATCH_GET_ATTEMPTS - 1)
+    assert dynamo.DynamoDB(client).batch_get('Users', [{'email': 'a@x'}]) == [{'email': 'a@x'}]
+    assert client.calls == dynamo.BATCH_GET_ATTEMPTS
+
+
+def test_batch_get_gives_up_on_keys_that_stay_unprocessed(fake_db, monkeypatch):
+    monkeypatch.setattr(dynamo.time, 'sleep', lambda seconds: None)
+    client = _Throttled(fake_db.client, throttled=dynamo.BATCH_GET_ATTEMPTS)
+    with pytest.raises(ClientError) as throttled:
+        dynamo.DynamoDB(client).batch_get('Users', [{'email': 'a@x'}])
+    assert throttled.value.response['Error']['Code'] == 'ProvisionedThroughputExceededException'
+    assert client.calls == dynamo.BATCH_GET_ATTEMPTS
+
+
+# --- Transactions ---
+
+def _put(email):
+    return ('Put', 'Users', {'Item': {'email': email}, 'ConditionExpression': 'attribute_not_exists(email)'})
+
+
+def test_transaction_writes_all_or_nothing(fake_db):
+    fake_db.transact_write([_put('a@x'), _put('b@x')])
+    with pytest.raises(ClientError) as failed:
+        fake_db.transact_write([_put('c@x'), _put('a@x')])
+    assert dynamo.cancellation_reasons(failed.value) == ['None', 'ConditionalCheckFailed']
+    assert not dynamo.conflicted(failed.value)
+    assert 'Item' not in fake_db.Table('Users').get_item(Key={'email': 'c@x'})
+
+
+def test_transaction_token_makes_a_retry_a_no_op(fake_db):
+    fake_db.transact_write([_put('a@x')], token='t1')
+    fake_db.transact_write([_put('a@x')], token='t1')  # the condition would fail if it ran again
+    with pytest.raises(ClientError) as mismatch:
+        fake_db.transact_write([_put('z@x')], token='t1')
+    assert mismatch.value.response['Error']['Code'] == 'IdempotentParameterMismatchException'
+
+
+def test_transaction_limits(fake_db):
+    with pytest.raises(ClientError) as too_many:
+        fake_db.transact_write([_put(f"u{n}@x") for n in range(101)])
+    assert too_many.value.response['Error']['Code'] == 'ValidationException'
+    with pytest.raises(ClientError) as same_item:
+        fake_db.transact_write([_put('a@x'), ('Delete', 'Users', {'Key': {'email': 'a@x'}})])
+    assert same_item.value.response['Error']['Code'] == 'ValidationException'
+
+
+class _Conflicting:
+    """Client that cancels the first `conflicts` transactions with TransactionConflict"""
+
+    def __init__(self, client, conflicts):
+        self.client = client
+        self.conflicts = conflicts
+        self.calls = 0
+
+    def transact_write_items(self, **params):
+        self.calls += 1
+        if self.calls <= self.conflicts:
+            reasons = [{'Code': 'TransactionConflict'}] + [{'Code': 'None'}] * (len(params['TransactItems']) - 1)
+            raise ClientError({'Error': {'Code': 'TransactionCanceledException', 'Message': 'conflict'},
+                               'CancellationReasons': reasons}, 'TransactWriteItems')
+        return self.client.transact_write_items(**params)
+
+
+def test_transaction_conflicts_are_retried(fake_db, monkeypatch):
+    monkeypatch.setattr(dynamo.time, 'sleep', lambda seconds: None)
+    client = _Conflicting(fake_db.client, conflicts=dynamo.TRANSACTION_ATTEMPTS - 1)
+    db = dynamo.DynamoDB(client)
+    db.transact_write([_put('a@x'), _put('b@x')])
+    assert client.calls == dynamo.TRANSACTION_ATTEMPTS
+    assert 'Item' in fake_db.Table('Users').get_item(Key={'email': 'b@x'})
+
+
+def test_transaction_conflict_is_raised_when_retries_run_out(fake_db, monkeypatch):
+    monkeypatch.setattr(dynamo.time, 'sleep', lambda seconds: None)
+    client = _Conflicting(fake_db.client, conflicts=dynamo.TRANSACTION_ATTEMPTS)
+    with pytest.raises(ClientError) as failed:
+        dynamo.DynamoDB(client).transact_write([_put('a@x')])
+    assert dynamo.conflicted(failed.value)
+    assert client.calls == dynamo.TRANSACTION_ATTEMPTS
+
+
+def test_concurrent_transactions_on_one_item_conflict():
+    db = dynamo.DynamoDB(create_fake(transaction_seconds=0.2))
+    update = dynamo.build_request('Stats', {'Key': {'id': 'totals'}, 'UpdateExpression': 'ADD users :one',
+                                            'ExpressionAttributeValues': {':one': 1}})
+    errors = []
+
+    def write():
+        try:
+            # The raw client: DynamoDB.transact_write would retry the conflict
+            db.client.transact_write_items(TransactItems=[{'Update': update}])
+        except ClientError as e:
+            errors.append(dynamo.cancellation_reasons(e))
+
+    threads = [threading.Thread(target=write) for _ in range(3)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert errors == [['TransactionConflict']] * 2
+    assert db.Table('Stats').get_item(Key={'id': 'totals'})['Item']['users'] == 1
+
+
+def test_deadline_stops_calls_that_would_start_late(fake_db):
+    with dynamo.deadline(time.monotonic() - 1):
+        with pytest.raises(dynamo.DeadlineExceeded):
+            fake_db.Table('Users').get_item(Key={'email': 'a@x'})
+    assert 'Item' not in fake_db.Table('Users').get_item(Key={'email': 'a@x'})
@@ -0,0 +1,204 @@
+"""notify.py with LocalPublisher: batching, retries, spill files and their replay."""
+import json
+import os
+import threading
+import time
+
+import pytest
+
+import notify
+
+
+def _read(path):
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _spilled(spill_dir):
+    return [event for name in sorted(os.listdir(spill_dir)) for event in _read(os.path.join(spill_dir, name))]
+
+
+def _event(n):
+    return {'id': f"e{n}", 'type': 'booking', 'subject': f"Booking {n}", 'details': {}, 'at': '2030-01-01T00:00:00'}
+
+
+def _wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+def _write_spill(path, events):
+    with open(path, 'w', encoding='utf-8') as f:
+        for event in events:
+            f.write(json.dumps(event) + '\n')
+
+
+@pytest.fixture
+def sent(tmp_path):
+    return notify.LocalPublisher(str(tmp_path / 'sent.jsonl'))
+
+
+@pytest.fixture
+def spill_dir(tmp_path):
+    path = tmp_path / 'spool'
+    path.mkdir()
+    return str(path)
+
+
+class _Failing:
+    """Publisher that raises for the first `failures` calls, then hands off to `publish`"""
+
+    def __init__(self, publish, failures):
+        self.publish = publish
+        self.failures = failures
+        self.calls = 0
+
+    def __call__(self, events):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError('endpoint unreachable')
+        return self.publish(events)
+
+
+# --- Batching and retries ---
+
+def test_a_burst_goes_out_in_full_batches(sent, spill_dir):
+    notifier = notify.Notifier(sent, spill_dir=spill_dir, linger=0.5)
+    for n in range(25):
+        notifier.notify('booking', f"Booking {n}", n=n)
+    notifier.close()
+    assert sorted(event['details']['n'] for event in _read(sent.path)) == list(range(25))
+    assert sent.batches == 3  # 10 + 10 + 5
+    assert notifier.stats['sent'] == 25 and notifier.stats['spilled'] == 0
+
+
+def test_failed_publishes_are_retried(sent, spill_dir):
+    publish = _Failing(sent, failures=2)
+    notifier = notify.Notifier(publish, spill_dir=spill_dir, linger=0, backoff=0.01)
+    notifier.notify('booking', 'Booking 1')
+    _wait_for(lambda: notifier.stats['sent'])  # close() stops retrying
+    notifier.close()
+    assert [event['subject'] for event in _read(sent.path)] == ['Booking 1']
+    assert publish.calls == 3
+    assert notifier.stats['retried'] == 2 and notifier.stats['spilled'] == 0
+
+
+def test_events_are_spilled_when_retries_run_out(sent, spill_dir):
+    notifier = notify.Notifier(_Failing(sent, failures=3), spill_dir=spill_dir, linger=0,
+                               max_attempts=3, backoff=0.01)
+    notifier.notify('booking', 'Booking 1')
+    _wait_for(lambda: notifier.stats['spilled'])
+    notifier.close()
+    assert _read(sent.path) == []
+    assert [event['subject'] for event in _spilled(spill_dir)] == ['Booking 1']
+    assert notifier.stats['spilled'] == 1
+
+
+def test_a_full_queue_spills_instead_of_blocking(sent, spill_dir):
+    release = threading.Event()
+
+    def slow(events):
+        release.wait(5)
+        return sent(events)
+    notifier = notify.Notifier(slow, spill_dir=spill_dir, linger=0, maxsize=1)
+    for n in range(12):
+        notifier.notify('booking', f"Booking {n}")
+    release.set()
+    _wait_for(notifier._queue.empty)
+    notifier.close()
+    delivered = {event['subject'] for event in _read(sent.path)}
+    spilled = {event['subject'] for event in _spilled(spill_dir)}
+    assert spilled and not delivered & spilled
+    assert delivered | spilled == {f"Booking {n}" for n in range(12)}
+
+
+def test_close_spills_what_it_cannot_send_in_time(sent, spill_dir):
+    release = threading.Event()
+
+    def stuck(events):
+        release.wait(5)
+        return sent(events)
+    notifier = notify.Notifier(stuck, spill_dir=spill_dir, linger=0)
+    for n in range(3):
+        notifier.notify('booking', f"Booking {n}")
+    notifier.close(timeout=0.2)
+    release.set()
+    assert {event['subject'] for event in _spilled(spill_dir)} == {'Booking 0', 'Booking 1', 'Booking 2'}
+
+
+# --- Replay ---
+
+def test_a_new_worker_replays_spill_files(sent, spill_dir):
+    _write_spill(os.path.join(spill_dir, 'spill-999999.jsonl'), [_event(n) for n in range(12)])
+    notifier = notify.Notifier(sent, spill_dir=spill_dir)
+    notifier._replay_spilled()
+    assert [event['id'] for event in _read(sent.path)] == [f"e{n}" for n in range(12)]
+    assert sent.batches == 2
+    assert os.listdir(spill_dir) == []
+    assert notifier.stats['replayed'] == 12
+
+
+def test_abandoned_claims_are_taken_over(sent, spill_dir):
+    # pid 999999 is not running; pid 1 always is
+    _write_spill(os.path.join(spill_dir, 'spill-123.jsonl.999999.replaying'), [_event(1)])
+    _write_spill(os.path.join(spill_dir, 'spill-456.jsonl.1.replaying'), [_event(2)])
+    notify.Notifier(sent, spill_dir=spill_dir)._replay_spilled()
+    assert [event['id'] for event in _read(sent.path)] == ['e1']
+    assert os.listdir(spill_dir) == ['spill-456.jsonl.1.replaying']
+
+
+def test_a_live_workers_spill_file_is_left_to_it(sent, spill_dir):
+    # pid 1 may still be appending to its file
+    _write_spill(os.path.join(spill_dir, 'spill-1.jsonl'), [_event(1)])
+    _write_spill(os.path.join(spill_dir, 'spill-1-0a1b2c3d.jsonl'), [_event(2)])
+    notify.Notifier(sent, spill_dir=spill_dir)._replay_spilled()
+    assert [event['id'] for event in _read(sent.path)] == ['e2']
+    assert os.listdir(spill_dir) == ['spill-1.jsonl']
+
+
+def test_events_spilled_during_an_outage_follow_the_next_batch(sent, spill_dir):
+    notifier = notify.Notifier(_Failing(sent, failures=1), spill_dir=spill_dir, linger=0, max_attempts=1,
+                               replay_interval=0)
+    notifier.notify('booking', 'Booking 1')
+    _wait_for(lambda: notifier.stats['spilled'])
+    notifier.notify('booking', 'Booking 2')
+    _wait_for(lambda: notifier.stats['replayed'])
+    notifier.close()
+    assert [event['subject'] for event in _read(sent.path)] == ['Booking 2', 'Booking 1']
+    assert os.listdir(spill_dir) == []
+
+
+def test_replay_checks_are_rate_limited(sent, spill_dir, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(notify.time, 'monotonic', lambda: now[0])
+    notifier = notify.Notifier(sent, spill_dir=spill_dir, replay_interval=30)
+    notifier._maybe_replay()
+    _write_spill(os.path.join(spill_dir, 'spill-999999.jsonl'), [_event(1)])
+    notifier._maybe_replay()
+    assert _read(sent.path) == []
+    now[0] += 30
+    notifier._maybe_replay()
+    assert [event['id'] for event in _read(sent.path)] == ['e1']
+
+
+def test_a_failed_replay_puts_the_file_back(sent, spill_dir):
+    path = os.path.join(spill_dir, 'spill-999999.jsonl')
+    _write_spill(path, [_event(1)])
+    with open(path, 'a', encoding='utf-8') as f:
+        f.write('{not json\n')
+    notify.Notifier(sent, spill_dir=spill_dir)._replay_spilled()
+    names = os.listdir(spill_dir)
+    assert len(names) == 1 and names[0].startswith('spill-') and names[0].endswith('.jsonl')
+    assert _read(sent.path) == []
+
+
+def test_claimed_file_names():
+    assert notify._claimant('spool/spill-1.jsonl.42.replaying') == 42
+    assert notify._unclaimed('spool/spill-1.jsonl.42.replaying') == 'spool/spill-1.jsonl'
+    assert notify._unclaimed('spool/spill-1.jsonl') == 'spool/spill-1.jsonl'
+    assert notify._writer('spool/spill-42.jsonl') == 42
+    assert notify._writer('spool/spill-42-0a1b2c3d.jsonl') is None
+    assert not notify._alive(os.getpid())
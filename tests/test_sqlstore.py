@@ -0,0 +1,79 @@
+"""sqlstore.SQLiteStore specifics: the file outlives the process, triggers keep the counters, workers share it."""
+import pytest
+
+from memstore import Booking, Feedback, SessionBooking
+from sqlstore import SQLiteStore
+
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / 'app.db')
+
+
+def _session(user, time='09:00 AM'):
+    return SessionBooking(id=None, user=user, user_name='A', service='Portrait (with Sora Lee)',
+                          photographer='Sora Lee', date='2099-01-01', time=time, status='Pending')
+
+
+def test_rows_survive_reopening(path):
+    store = SQLiteStore(path, {'admin@x': {'name': 'Admin', 'password': 'pw', 'role': 'admin'}})
+    booking = store.bookings.add(Booking(id=None, user='a@x', service='Retouch: Portrait', filename='a.jpg',
+                                         status='Pending', created_at='2030-01-01T10:00:00'))
+    first = store.reserve_session(_session('a@x'), 540, 600)
+
+    reopened = SQLiteStore(path, {'admin@x': {'name': 'Admin', 'password': 'other', 'role': 'admin'}})
+    assert reopened.bookings.get(booking.id).filename == 'a.jpg'
+    assert reopened.users.get('admin@x')['password'] == 'pw'  # seeding doesn't overwrite an account
+    assert reopened.reserve_session(_session('a@x', '01:00 PM'), 780, 840).id == first.id + 1
+    assert reopened.stats()['sessions'] == 2
+
+
+def test_triggers_keep_counters_in_step_with_the_rows(path):
+    store = SQLiteStore(path)
+    store.users.add('a@x', 'Ann Lee', 'pw')
+    session = store.reserve_session(_session('a@x'), 540, 600)
+    store.sessions.set_status(session.id, 'Confirmed')
+    store.feedbacks.add(Feedback(id='f1', user_name='A', user_email='a@x', service='Portrait Session',
+                                 photographer='Sora Lee', rating=5, comment='Lovely'))
+    store.feedbacks.add(Feedback(id='f2', user_name='A', user_email='a@x', service='Portrait Session',
+                                 rating=3, comment='Fine'))
+    store.feedbacks.delete('f2')
+
+    counted, ratings = store.stats(), store.ratings()
+    assert counted['sessions_confirmed'] == 1 and counted.get('sessions_pending', 0) == 0
+    assert counted['users'] == 1 and counted['feedback'] == 1
+    assert ratings == {'service#Portrait Session#5': 1, 'photographer#Sora Lee#5': 1}
+    assert {name: value for name, value in store.rebuild_stats().items() if value} == \
+        {name: value for name, value in counted.items() if value}
+    assert store.rebuild_ratings() == ratings
+
+
+def test_workers_sharing_the_file_cannot_double_book(path):
+    first, second = SQLiteStore(path), SQLiteStore(path)
+    session = first.reserve_session(_session('a@x'), 540, 600)
+    assert second.reserve_session(_session('b@x', '10:00 AM'), 600 - 30, 660) is None
+    second.cancel_session(session.id)
+    assert first.reserve_session(_session('b@x'), 540, 600) is not None
+
+
+def test_a_failed_batch_leaves_nothing_behind(path):
+    store = SQLiteStore(path)
+    with pytest.raises(RuntimeError):
+        with store.batch():
+            store.users.add('a@x', 'Ann Lee', 'pw')
+            store.reserve_session(_session('a@x'), 540, 600)
+            raise RuntimeError('midway')
+    assert store.users.get('a@x') is None and len(store.sessions) == 0
+    assert store.stats().get('sessions', 0) == 0
+
+
+def test_a_new_email_takes_the_accounts_rows_along(path):
+    store = SQLiteStore(path)
+    store.users.add('a@x', 'Ann Lee', 'pw')
+    store.users.add('b@x', 'Bo Kim', 'pw')
+    session = store.reserve_session(_session('a@x'), 540, 600)
+    assert not store.update_user('a@x', 'b@x', 'Ann Lee')
+    assert store.update_user('a@x', 'ann@x', 'Ann Park')
+    assert store.users.get('a@x') is None and store.users.get('ann@x')['name'] == 'Ann Park'
+    assert store.sessions.get(session.id).user == 'ann@x'
+    assert store.sessions.get(session.id).user_name == 'Ann Park'
@@ -0,0 +1,122 @@
+"""app.py's stores, memstore.Store and sqlstore.SQLiteStore, through the interface the routes use."""
+import threading
+
+import pytest
+
+from memstore import Booking, Feedback, SessionBooking, Store
+from sqlstore import SQLiteStore
+
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    if request.param == 'memory':
+        return Store()
+    return SQLiteStore(str(tmp_path / 'store.db'))
+
+
+def _booking(user, status='Pending', created_at='2030-01-01T10:00:00'):
+    return Booking(id=None, user=user, service='Retouch: Portrait', filename='a.jpg', status=status,
+                   created_at=created_at)
+
+
+def _session(user, date='2030-01-01', status='Pending', photographer='Sora Lee'):
+    return SessionBooking(id=None, user=user, user_name='A', service='Portrait (with Sora Lee)',
+                          photographer=photographer, date=date, time='09:00 AM', status=status)
+
+
+# --- Records ---
+
+def test_records_read_like_dicts():
+    record = _booking('a@x')
+    assert record['user'] == 'a@x' and record.get('sha256', 'none') == 'none'
+    with pytest.raises(KeyError):
+        record['nope']
+    with pytest.raises(TypeError):
+        Booking(id=1, colour='red')
+
+
+# --- Indexed lookups ---
+
+def test_rows_are_found_by_id_user_and_status(store):
+    mine = [store.bookings.add(_booking('a@x')), store.bookings.add(_booking('a@x', status='Confirmed'))]
+    store.bookings.add(_booking('b@x'))
+    assert store.bookings.get(mine[0].id).user == 'a@x'
+    assert store.bookings.get(10 ** 6) is None
+    assert [b.id for b in store.bookings.for_user('a@x')] == [b.id for b in mine]
+    assert store.bookings.for_user('nobody@x') == []
+    assert len(store.bookings.with_status('Pending')) == 2
+    assert [b.id for b in store.bookings.with_status('Confirmed')] == [mine[1].id]
+
+
+def test_status_changes_move_rows_between_indexes(store):
+    booking = store.bookings.add(_booking('a@x'))
+    assert store.bookings.set_status(booking.id, 'Confirmed').status == 'Confirmed'
+    assert store.bookings.with_status('Pending') == []
+    assert [b.id for b in store.bookings.with_status('Confirmed')] == [booking.id]
+    assert store.stats()['bookings_confirmed'] == 1 and store.stats().get('bookings_pending', 0) == 0
+
+
+def test_deleted_rows_leave_every_index_and_ids_are_not_reused(store):
+    first = store.bookings.add(_booking('a@x'))
+    store.bookings.delete(first.id)
+    assert store.bookings.get(first.id) is None
+    assert store.bookings.for_user('a@x') == [] and store.bookings.with_status('Pending') == []
+    assert store.bookings.delete(first.id) is None
+    assert store.bookings.add(_booking('a@x')).id != first.id
+    assert len(store.bookings) == 1
+
+
+def test_sessions_by_date(store):
+    for date in ('2030-01-03', '2030-01-01', '2030-01-02', '2030-02-01'):
+        store.sessions.add(_session('a@x', date=date))
+    assert [s.date for s in store.sessions.between('2030-01-01', '2030-01-31')] == \
+        ['2030-01-01', '2030-01-02', '2030-01-03']
+    assert [s.date for s in store.sessions.on_date('2030-02-01')] == ['2030-02-01']
+    assert store.sessions.get(store.sessions.on_date('2030-02-01')[0].id).id >= 1000  # session ids start at 1000
+
+
+def _upload(user, sha256='ab' * 32):
+    return Booking(id=None, user=user, service='Retouch: Portrait', filename='a.jpg', sha256=sha256,
+                   status='Pending', created_at='2030-01-01T10:00:00')
+
+
+def test_uploads_are_counted_per_content(store):
+    assert store.add_upload(_upload('a@x'), 10) is None  # nothing stored yet: the caller writes the bytes
+    first = store.add_upload(_upload('a@x'), 10, 'content/abab/1.jpg')
+    second = store.add_upload(_upload('b@x'), 10)
+    assert second.storage_key == 'content/abab/1.jpg'
+    collected = []
+    store.delete_booking(first.id, lambda key, sha256: collected.append(key))
+    assert collected == []
+    store.delete_booking(second.id, lambda key, sha256: collected.append(key))
+    assert collected == ['content/abab/1.jpg']
+
+
+def test_the_last_copy_is_collected_after_the_delete_is_done(store):
+    booking = store.add_upload(_upload('a@x'), 10, 'content/abab/1.jpg')
+    seen = []
+
+    def delete_blob(key, sha256):
+        # Another request uploading the same content now must not wait on, or find, the old copy
+        upload = threading.Thread(target=lambda: seen.append(store.add_upload(_upload('b@x'), 10)), daemon=True)
+        upload.start()
+        upload.join(2)
+        seen.append(upload.is_alive())
+    store.delete_booking(booking.id, delete_blob)
+    assert seen == [None, False]
+
+
+def test_feedback_by_customer(store):
+    store.feedbacks.add(Feedback(id='f1', user_name='A', user_email='a@x', service='Portrait Session',
+                                 rating=5, comment='Lovely'))
+    assert [f.comment for f in store.feedbacks.for_user('a@x')] == ['Lovely']
+    store.feedbacks.delete('f1')
+    assert store.feedbacks.for_user('a@x') == [] and len(store.feedbacks) == 0
+
+
+def test_accounts(store):
+    assert store.users.add('a@x', 'Ann Lee', 'pw')
+    assert not store.users.add('a@x', 'Someone Else', 'pw')
+    assert store.users.get('a@x')['name'] == 'Ann Lee'
+    assert store.users.get('b@x') is None
+    assert set(store.users.all()) == {'a@x'}
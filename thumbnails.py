@@ -0,0 +1,101 @@
+"""Thumbnail and preview derivatives for uploaded images.
+
+Each accepted upload is handed to `schedule()`, which renders the sizes in
+SIZES on a small process pool so the request that uploaded the file never
+waits on image decoding. Derivatives are written back into the same blob
+store as the original, under a key derived from the original's sha256, so
+re-uploads of the same picture reuse what is already there:
+
+    derived/<sha256>/thumb.webp
+    derived/<sha256>/preview.webp
+
+Pillow is optional: without it (or for non-image uploads such as PDFs) no
+derivatives are produced and the templates fall back to a placeholder.
+"""
+import io
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # pragma: no cover - Pillow is optional
+    Image = None
+
+log = logging.getLogger(__name__)
+
+# name -> (width, height, crop to fill?)
+SIZES = {
+    'thumb': (160, 160, True),
+    'preview': (1024, 1024, False),
+}
+FORMAT = 'WEBP'
+EXTENSION = 'webp'
+CONTENT_TYPE = 'image/webp'
+QUALITY = 80
+IMAGE_TYPES = {'jpg', 'jpeg', 'png', 'gif'}
+POOL_WORKERS = 2
+
+_pool = None
+
+
+def derivative_key(sha256, name):
+    return f"derived/{sha256}/{name}.{EXTENSION}"
+
+
+def render(image, name):
+    """Return the encoded bytes of one derivative of an already-opened image"""
+    width, height, crop = SIZES[name]
+    if crop:
+        resized = ImageOps.fit(image, (width, height), Image.LANCZOS)
+    else:
+        resized = image.copy()
+        resized.thumbnail((width, height), Image.LANCZOS)
+    out = io.BytesIO()
+    resized.save(out, FORMAT, quality=QUALITY)
+    return out.getvalue()
+
+
+def build_derivatives(store, key, sha256):
+    """Render every missing derivative of `key`; runs inside a pool process"""
+    missing = [name for name in SIZES if not store.exists(derivative_key(sha256, name))]
+    if not missing:
+        return []
+
+    # Spool the original to disk: Pillow needs a seekable file and RAW-sized
+    # uploads should not be pulled into memory whole
+    with tempfile.TemporaryFile() as original:
+        for chunk in store.iter_chunks(key):
+            original.write(chunk)
+        original.seek(0)
+
+        with Image.open(original) as image:
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            for name in missing:
+                store.put_stream(derivative_key(sha256, name), io.BytesIO(render(image, name)), CONTENT_TYPE)
+    return missing
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        log.warning("Thumbnail generation failed: %s", future.exception())
+
+
+def schedule(store, key, sha256, file_type):
+    """Queue derivative generation for an upload; returns the Future or None"""
+    global _pool
+    if Image is None or file_type.lower() not in IMAGE_TYPES:
+        return None
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS)
+    future = _pool.submit(build_derivatives, store, key, sha256)
+    future.add_done_callback(_log_failure)
+    return future
+
+
+def delete_derivatives(store, sha256):
+    """Remove every derivative of a content hash (its last upload is gone)"""
+    for name in SIZES:
+        store.delete(derivative_key(sha256, name))